@@ -0,0 +1,121 @@
+"""Bounded LRU cache of query results."""
+import threading
+from collections import OrderedDict
+
+
+class QueryCache(object):
+    """
+    LRU cache of query results, for the latest version of the data.
+
+    Every entry belongs to the client which added it, and a client can have
+    at most max_client_entries entries. Once it has that many, its new
+    entries evict its own least recently used ones, so a single busy client
+    can't evict everyone else's. The cache is emptied when a newer version
+    of the data is seen.
+
+    If a precision is set, the coordinates of the queries should be
+    quantized (rounded to that many decimal places) with quantize(), and the
+    queries run on the quantized ones, so nearby queries share an entry.
+
+    It's safe to use from many threads.
+    """
+
+    MISSING = object()
+
+    def __init__(self, max_entries, max_client_entries=None, precision=None):
+        if max_client_entries is None:
+            max_client_entries = max(1, max_entries // 4)
+        self._max_entries = max_entries
+        self._max_client_entries = min(max_client_entries, max_entries)
+        self._precision = precision
+
+        self._lock = threading.Lock()
+        self._version = None
+        # key: (client, value), from the least to the most recently used
+        self._entries = OrderedDict()
+        # client: OrderedDict of the keys of its entries, in the same order
+        self._client_keys = {}
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def hits(self):
+        return self._hits
+
+    @property
+    def misses(self):
+        return self._misses
+
+    @property
+    def evictions(self):
+        """Number of entries evicted to make room for new ones."""
+        return self._evictions
+
+    def quantize(self, value):
+        if self._precision is None:
+            return value
+        return round(value, self._precision)
+
+    def get(self, key, version):
+        """
+        Returns the value cached for a version of the data, or QueryCache.MISSING.
+        """
+        with self._lock:
+            self._update_version(version)
+            entry = self._entries.get(key, None)
+            if entry is None or version != self._version:
+                self._misses += 1
+                return self.MISSING
+
+            self._hits += 1
+            client, value = entry
+            self._entries.move_to_end(key)
+            self._client_keys[client].move_to_end(key)
+            return value
+
+    def put(self, key, value, version, client=None):
+        """
+        Cache the value of a query on a version of the data, on behalf of a client.
+
+        Values of older versions of the data are ignored.
+        """
+        with self._lock:
+            self._update_version(version)
+            if version != self._version or self._max_entries < 1:
+                return
+            if key in self._entries:
+                self._remove(key)
+
+            client_keys = self._client_keys.setdefault(client, OrderedDict())
+            if len(client_keys) >= self._max_client_entries:
+                self._remove(next(iter(client_keys)))
+                self._evictions += 1
+            elif len(self._entries) >= self._max_entries:
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+
+            self._entries[key] = (client, value)
+            client_keys[key] = None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._client_keys.clear()
+
+    def _update_version(self, version):
+        if self._version is None or version > self._version:
+            self._entries.clear()
+            self._client_keys.clear()
+            self._version = version
+
+    def _remove(self, key):
+        client, _ = self._entries.pop(key)
+        client_keys = self._client_keys[client]
+        del client_keys[key]
+        if not client_keys:
+            del self._client_keys[client]
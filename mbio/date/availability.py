@@ -0,0 +1,73 @@
+"""WeeklyAvailability class implementation."""
+from math import gcd
+
+
+class WeeklyAvailability(object):
+    """
+    Weekly availability of a vehicle, compiled into a bitmap of time slots.
+
+    The week is split into slots of the same length, starting on Monday at
+    00:00, and bit i of the bitmap is set if the vehicle is available at the
+    start of slot i. Slots are 30 minutes long, unless the availability has
+    times which are not on the hour or half past the hour, in which case the
+    slots get shorter, so every available time starts a slot.
+    """
+
+    __slots__ = ('_resolution', '_bitmap')
+
+    DATE_MAP = {
+                'monday': 0,
+                'tuesday': 1,
+                'wednesday': 2,
+                'thursday': 3,
+                'friday': 4,
+                'saturday': 5,
+                'sunday': 6
+                }
+
+    SLOT_MINUTES = 30
+    DAY_MINUTES = 24 * 60
+
+    def __init__(self, availability):
+        """
+        Compile the availability of a vehicle from the dataset.
+
+        The availability maps week day names to lists of "HHMM" times. A
+        KeyError is raised for unknown week day names.
+        """
+        times = []
+        for day, day_times in availability.items():
+            day_integer = self.DATE_MAP[day.lower()]
+            for t in day_times:
+                hour = int(t[0:2])
+                minute = int(t[2:4])
+                # times which no date can have are never available
+                if 0 <= hour < 24 and 0 <= minute < 60:
+                    times.append(day_integer * self.DAY_MINUTES + hour * 60 + minute)
+
+        resolution = self.SLOT_MINUTES
+        for minute in times:
+            resolution = gcd(resolution, minute)
+
+        bitmap = 0
+        for minute in times:
+            bitmap |= 1 << (minute // resolution)
+
+        self._resolution = resolution
+        self._bitmap = bitmap
+
+    @property
+    def resolution(self):
+        """Length of the slots in minutes."""
+        return self._resolution
+
+    @property
+    def bitmap(self):
+        return self._bitmap
+
+    def is_available(self, datetime):
+        """Check if the vehicle is available at the hour and minute of a datetime."""
+        minute = datetime.weekday() * self.DAY_MINUTES + datetime.hour * 60 + datetime.minute
+        if minute % self._resolution:
+            return False
+        return (self._bitmap >> (minute // self._resolution)) & 1 == 1
@@ -1,6 +1,7 @@
 """BookingDate class implementation."""
-from collections import defaultdict
 from mbio.date.utils import isoformat_to_datetime
+from mbio.date.bookingledger import BookingLedger
+from mbio.date.availability import WeeklyAvailability
 
 class BookingResponse(object):
     """Response to the request of the booking availability."""
@@ -22,62 +23,47 @@ class BookingResponse(object):
 class BookingDate(object):
     """Wrapper around datetime.datetime that abstracts booking availability checking."""
 
-    DATE_MAP = {
-                'monday': 0,
-                'tuesday': 1,
-                'wednesday': 2,
-                'thursday': 3,
-                'friday': 4,
-                'saturday': 5,
-                'sunday': 6
-                }
+    DATE_MAP = WeeklyAvailability.DATE_MAP
 
     def __init__(self, datetime):
         self._datetime = datetime
 
-    def is_booking_possible(self, vehicle, bookings=[]):
+    def is_booking_possible(self, vehicle, bookings=[], ledger=None, availability=None):
         """
         1. make sure vehicle is available on day/time
         2. make sure that that vehicle_id is not registered for that date already,
               UNLESS booking is cancelled
+
+        The active bookings are checked through the ledger and the vehicle's
+        schedule through its compiled WeeklyAvailability. If they're not
+        provided, they're built from the bookings list and the vehicle.
         """
-        vehicle_availability = self._parse_availability(vehicle['availability'])
-        is_vehicle_compatible = self._is_vehicle_availabile(self._datetime, vehicle_availability, bookings)
+        if ledger is None:
+            ledger = self._build_ledger(bookings)
+        vehicle_availability = availability
+        if vehicle_availability is None:
+            vehicle_availability = WeeklyAvailability(vehicle['availability'])
+        is_vehicle_compatible = self._is_vehicle_availabile(self._datetime, vehicle['id'],
+                                                        vehicle_availability, ledger)
         return is_vehicle_compatible
 
 
-    def _is_vehicle_availabile(self, datetime, vehicle_availability, bookings):
-        booking_day = datetime.weekday()
-        bookin_hour = datetime.hour
-        booking_minute = datetime.minute
-        booking_time_tuple = (bookin_hour, booking_minute)
-
+    def _is_vehicle_availabile(self, datetime, vehicle_id, vehicle_availability, ledger):
         # make sure that the vehicle is available on a cerntain date/time
-        available_hours = vehicle_availability[booking_day]
-        if not booking_time_tuple in available_hours:
+        if not vehicle_availability.is_available(datetime):
             return BookingResponse(False, BookingResponse.ERR_CAR_DATE)
 
+        if ledger.is_booked(vehicle_id, datetime):
+            return BookingResponse(False, BookingResponse.ERR_BOOKING_EXITS)
+
+        return BookingResponse(True)
 
-        booking_datetimes = []
+    def _build_ledger(self, bookings):
+        ledger = BookingLedger()
         for booking in bookings:
             if 'cancelledAt' in booking:
                 # ignore cancelled bookings
                 continue
-            booking_datetime_str = booking['pickupDate']
-            booking_datetime = isoformat_to_datetime(booking_datetime_str)
-            booking_datetimes.append(booking_datetime)
-
-        if self._datetime in booking_datetimes:
-            return BookingResponse(False, BookingResponse.ERR_BOOKING_EXITS)
-
-        return BookingResponse(True)
-
-    def _parse_availability(self, availability):
-        res = defaultdict(list)
-        for day, time in availability.items():
-            for t in time:
-                hour = int(t[0:2])
-                minute = int(t[2:4])
-                day_integer = self.DATE_MAP[day.lower()]
-                res[day_integer].append((hour, minute))
-        return res
+            booking_datetime = isoformat_to_datetime(booking['pickupDate'])
+            ledger.add(booking['vehicleId'], booking_datetime)
+        return ledger
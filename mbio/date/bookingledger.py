@@ -0,0 +1,33 @@
+"""BookingLedger class implementation."""
+from mbio.utils import normalize_key
+
+
+class BookingLedger(object):
+    """
+    Active (non-cancelled) bookings, keyed by vehicle and pickup date.
+
+    The pickup dates are stored as datetime.datetime objects, so checking if
+    a vehicle is already booked for a date is a single lookup.
+    """
+
+    def __init__(self):
+        # (vehicle key, pickup datetime) -> number of active bookings
+        self._slots = {}
+
+    def __len__(self):
+        return len(self._slots)
+
+    def add(self, vehicle_id, pickup_date):
+        key = (normalize_key(vehicle_id), pickup_date)
+        self._slots[key] = self._slots.get(key, 0) + 1
+
+    def remove(self, vehicle_id, pickup_date):
+        key = (normalize_key(vehicle_id), pickup_date)
+        count = self._slots.get(key, 0)
+        if count > 1:
+            self._slots[key] = count - 1
+        else:
+            self._slots.pop(key, None)
+
+    def is_booked(self, vehicle_id, pickup_date):
+        return (normalize_key(vehicle_id), pickup_date) in self._slots
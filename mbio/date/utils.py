@@ -2,6 +2,23 @@
 
 import datetime
 
+from mbio.utils import is_ascii
+
+ISOFORMAT = '%Y-%m-%dT%H:%M:%S'
+
 def isoformat_to_datetime(isoformat_str):
-    dt_obj = datetime.datetime.strptime(isoformat_str, '%Y-%m-%dT%H:%M:%S')
+    if _is_zero_padded_isoformat(isoformat_str):
+        # fast path for the fixed-width format, strptime() is comparatively slow
+        return datetime.datetime(int(isoformat_str[0:4]), int(isoformat_str[5:7]),
+                                 int(isoformat_str[8:10]), int(isoformat_str[11:13]),
+                                 int(isoformat_str[14:16]), int(isoformat_str[17:19]))
+    dt_obj = datetime.datetime.strptime(isoformat_str, ISOFORMAT)
     return dt_obj
+
+def _is_zero_padded_isoformat(string):
+    return (len(string) == 19 and is_ascii(string) and
+            string[4] == '-' and string[7] == '-' and string[10] == 'T' and
+            string[13] == ':' and string[16] == ':' and
+            string[0:4].isdigit() and string[5:7].isdigit() and
+            string[8:10].isdigit() and string[11:13].isdigit() and
+            string[14:16].isdigit() and string[17:19].isdigit())
@@ -28,3 +28,7 @@ class BookingDoesNotExistError(BookingError):
 
 class BookingAlreadyCancelledError(BookingError):
     pass
+
+class JournalError(TestDriveError):
+    """The bookings journal could not be read or written."""
+    pass
@@ -20,6 +20,9 @@ class Coordinate(object):
             return self.latitude == other.latitude and self.longitude == other.longitude
         return False
 
+    def __hash__(self):
+        return hash((self.latitude, self.longitude))
+
     @property
     def latitude(self):
         return self._latitude
@@ -51,7 +54,9 @@ class Coordinate(object):
 
     def is_inside_polygon(self, coord_list):
         self._check_if_polygon(coord_list)
+        return self._winding_angle_is_inside(coord_list)
 
+    def _winding_angle_is_inside(self, coord_list):
         angle = 0
         num_coords = len(coord_list)
 
@@ -72,7 +77,8 @@ class Coordinate(object):
         else:
             return True
 
-    def _check_if_polygon(self, coord_list):
+    @staticmethod
+    def _check_if_polygon(coord_list):
         if len(coord_list) < 3:
             raise NotAPolygonError('A polygon has at least 3 points.')
 
@@ -0,0 +1,145 @@
+"""CoordinateArray class and batched distance computation."""
+from array import array
+from math import radians, cos, sin, asin, sqrt
+from mbio.geo.coordinate import Coordinate
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover - numpy is an optional dependency
+    numpy = None
+
+
+class CoordinateArray(object):
+    """
+    Struct-of-arrays store of coordinates.
+
+    The latitudes and longitudes are kept in degrees and in radians, along
+    with the cosines of the latitudes, in contiguous array('d') buffers, so
+    distances to all of the coordinates can be computed in one call. If NumPy
+    is installed, it is used to compute the distances.
+    """
+
+    # distances close to a rounding boundary are recomputed with the scalar
+    # formula, so the NumPy results round exactly like Coordinate.distance_to()
+    ROUNDING_GUARD = 1e-6
+
+    def __init__(self, coordinates=()):
+        """Create the array from (latitude, longitude) pairs."""
+        self._latitudes = array('d')
+        self._longitudes = array('d')
+        self._latitudes_rad = array('d')
+        self._longitudes_rad = array('d')
+        self._cos_latitudes = array('d')
+
+        for latitude, longitude in coordinates:
+            self.append(latitude, longitude)
+
+    def __len__(self):
+        return len(self._latitudes)
+
+    def __getitem__(self, pos):
+        return Coordinate(self._latitudes[pos], self._longitudes[pos])
+
+    @property
+    def latitudes(self):
+        return self._latitudes
+
+    @property
+    def longitudes(self):
+        return self._longitudes
+
+    @property
+    def latitudes_rad(self):
+        return self._latitudes_rad
+
+    @property
+    def longitudes_rad(self):
+        return self._longitudes_rad
+
+    @property
+    def cos_latitudes(self):
+        return self._cos_latitudes
+
+    def append(self, latitude, longitude):
+        latitude_rad = radians(latitude)
+        self._latitudes.append(latitude)
+        self._longitudes.append(longitude)
+        self._latitudes_rad.append(latitude_rad)
+        self._longitudes_rad.append(radians(longitude))
+        self._cos_latitudes.append(cos(latitude_rad))
+
+    def distances_from(self, latitude, longitude, positions=None, out=None):
+        """
+        Compute the distances in kilometers from a coordinate to the ones in the array.
+
+        The distances are the same as the ones computed by
+        Coordinate(latitude, longitude).distance_to() (rounded to meters).
+        If positions is provided, only the distances to the coordinates at
+        those positions are computed, in that order. The results are stored
+        in out, an array('d') which is resized as needed, or in a new one.
+        """
+        if out is None:
+            out = array('d')
+        if positions is None:
+            positions = range(len(self))
+        count = len(positions)
+        del out[count:]
+        if len(out) < count:
+            out.frombytes(bytes(out.itemsize * (count - len(out))))
+
+        my_coord = Coordinate(latitude, longitude)
+        if numpy is not None and count:
+            self._numpy_distances(my_coord, positions, out)
+        else:
+            self._scalar_distances(my_coord, positions, out)
+        return out
+
+    def _scalar_distance(self, my_coord, pos):
+        dlat = my_coord.latitude_rad - self._latitudes_rad[pos]
+        dlon = my_coord.longitude_rad - self._longitudes_rad[pos]
+        a = sin(dlat/2)**2 + cos(my_coord.latitude_rad) * self._cos_latitudes[pos] * sin(dlon/2)**2
+        c = 2 * asin(sqrt(a))
+        return round(c * Coordinate.EARTH_RADIUS, 3)
+
+    def _scalar_distances(self, my_coord, positions, out):
+        # the same formula, in the same order of operations, as Coordinate.distance_to()
+        my_latitude_rad = my_coord.latitude_rad
+        my_longitude_rad = my_coord.longitude_rad
+        my_cos_latitude = cos(my_latitude_rad)
+        latitudes_rad = self._latitudes_rad
+        longitudes_rad = self._longitudes_rad
+        cos_latitudes = self._cos_latitudes
+        earth_radius = Coordinate.EARTH_RADIUS
+
+        for i, pos in enumerate(positions):
+            dlat = my_latitude_rad - latitudes_rad[pos]
+            dlon = my_longitude_rad - longitudes_rad[pos]
+            a = sin(dlat/2)**2 + my_cos_latitude * cos_latitudes[pos] * sin(dlon/2)**2
+            c = 2 * asin(sqrt(a))
+            out[i] = round(c * earth_radius, 3)
+
+    def _numpy_distances(self, my_coord, positions, out):
+        latitudes_rad = numpy.frombuffer(self._latitudes_rad, dtype=numpy.float64)
+        longitudes_rad = numpy.frombuffer(self._longitudes_rad, dtype=numpy.float64)
+        cos_latitudes = numpy.frombuffer(self._cos_latitudes, dtype=numpy.float64)
+        if positions != range(len(self)):
+            index = numpy.fromiter(positions, dtype=numpy.intp, count=len(positions))
+            latitudes_rad = latitudes_rad[index]
+            longitudes_rad = longitudes_rad[index]
+            cos_latitudes = cos_latitudes[index]
+
+        dlat = my_coord.latitude_rad - latitudes_rad
+        dlon = my_coord.longitude_rad - longitudes_rad
+        a = numpy.sin(dlat/2)**2 + cos(my_coord.latitude_rad) * cos_latitudes * numpy.sin(dlon/2)**2
+        distances = 2 * numpy.arcsin(numpy.sqrt(a)) * Coordinate.EARTH_RADIUS
+
+        # NumPy's trigonometric functions may be an ulp away from the math
+        # module's ones, which only matters next to a rounding boundary. Away
+        # from them, rint(meters) / 1000 is the same as round(distance, 3)
+        meters = distances * 1000
+        near_boundary = numpy.abs(meters - numpy.floor(meters) - 0.5) < self.ROUNDING_GUARD
+        rounded = numpy.frombuffer(out, dtype=numpy.float64, count=len(positions))
+        numpy.divide(numpy.rint(meters), 1000, out=rounded)
+        del rounded
+        for i in numpy.flatnonzero(near_boundary).tolist():
+            out[i] = self._scalar_distance(my_coord, positions[i])
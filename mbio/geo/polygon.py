@@ -0,0 +1,95 @@
+"""Polygon class and point in polygon test."""
+from mbio.geo.coordinate import Coordinate
+
+
+class Polygon(object):
+    """
+    Polygon prepared for testing if many points are inside of it.
+
+    The polygon is validated and its bounding box computed once, so points
+    outside of the bounding box are rejected straight away. The edges are
+    bucketed by latitude, so the points inside of the bounding box are only
+    tested against the edges which cross their latitude, with a winding
+    number test.
+
+    The results are the same as the ones of Coordinate.is_inside_polygon().
+    The winding number is not zero exactly when the winding angle is at
+    least pi. Points on (or extremely close to) an edge are handed over to
+    Coordinate.is_inside_polygon()'s winding angle test, since it's only
+    there that the floating point results of the two can differ.
+    """
+
+    # points closer than this (in degrees) to an edge are "on" the edge
+    EDGE_TOLERANCE = 1e-9
+
+    def __init__(self, coord_list):
+        """
+        Prepare a polygon from a list of Coordinate objects.
+
+        NotAPolygonError is raised if they don't form a polygon.
+        """
+        coord_list = list(coord_list)
+        Coordinate._check_if_polygon(coord_list)
+        self._coords = coord_list
+
+        latitudes = [coord.latitude for coord in coord_list]
+        longitudes = [coord.longitude for coord in coord_list]
+        self._min_latitude = min(latitudes)
+        self._max_latitude = max(latitudes)
+        self._min_longitude = min(longitudes)
+        self._max_longitude = max(longitudes)
+
+        num_coords = len(coord_list)
+        edges = []
+        for i in range(num_coords):
+            j = (i + 1) % num_coords
+            edges.append((longitudes[i], latitudes[i], longitudes[j], latitudes[j]))
+
+        # one bucket per couple of edges, each spanning the same latitude range
+        tolerance = self.EDGE_TOLERANCE
+        self._bucket_count = max(1, num_coords // 2)
+        height = self._max_latitude - self._min_latitude
+        self._bucket_height = height / self._bucket_count if height > 0 else 1.0
+        self._buckets = [[] for _ in range(self._bucket_count)]
+        for edge in edges:
+            first = self._bucket(min(edge[1], edge[3]) - tolerance)
+            last = self._bucket(max(edge[1], edge[3]) + tolerance)
+            for bucket in range(first, last + 1):
+                self._buckets[bucket].append(edge)
+
+    def __len__(self):
+        return len(self._coords)
+
+    def contains(self, latitude, longitude):
+        """Check if the point at latitude, longitude is inside of the polygon."""
+        tolerance = self.EDGE_TOLERANCE
+        if (latitude < self._min_latitude - tolerance or
+                latitude > self._max_latitude + tolerance or
+                longitude < self._min_longitude - tolerance or
+                longitude > self._max_longitude + tolerance):
+            return False
+
+        winding_number = 0
+        for x1, y1, x2, y2 in self._buckets[self._bucket(latitude)]:
+            dx = x2 - x1
+            dy = y2 - y1
+            # > 0 if the point is left of the edge, < 0 if it's on its right
+            side = dx * (latitude - y1) - (longitude - x1) * dy
+
+            if abs(side) <= tolerance * (abs(dx) + abs(dy)):
+                if (min(x1, x2) - tolerance <= longitude <= max(x1, x2) + tolerance and
+                        min(y1, y2) - tolerance <= latitude <= max(y1, y2) + tolerance):
+                    # the point is on the edge
+                    return Coordinate(latitude, longitude)._winding_angle_is_inside(self._coords)
+
+            if y1 <= latitude:
+                if y2 > latitude and side > 0:
+                    winding_number += 1
+            elif y2 <= latitude and side < 0:
+                winding_number -= 1
+
+        return winding_number != 0
+
+    def _bucket(self, latitude):
+        bucket = int((latitude - self._min_latitude) / self._bucket_height)
+        return min(max(bucket, 0), self._bucket_count - 1)
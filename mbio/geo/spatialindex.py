@@ -0,0 +1,132 @@
+"""Spatial index for nearest neighbour queries over coordinates."""
+import heapq
+from math import cos, sin, asin, sqrt
+from mbio.geo.coordinate import Coordinate
+from mbio.geo.coordinatearray import CoordinateArray
+
+
+class _Node(object):
+
+    __slots__ = ('mins', 'maxs', 'left', 'right', 'positions')
+
+    def __init__(self, mins, maxs, left=None, right=None, positions=None):
+        self.mins = mins
+        self.maxs = maxs
+        self.left = left
+        self.right = right
+        self.positions = positions
+
+
+class SpatialIndex(object):
+    """
+    k-d tree over the coordinates of a list of points.
+
+    The points are stored as vectors on the unit sphere, where the straight
+    line (chord) distance between two points only grows with their haversine
+    distance. The distance from a query to a bounding box of the tree is thus
+    a lower bound of the haversine distance to every point inside of it, so
+    the tree can be searched best-first, yielding the closest points without
+    looking at the ones which are far away.
+    """
+
+    LEAF_SIZE = 16
+    # slack for the floating point error of the lower bounds, in kilometers,
+    # which is the largest close to antipodal points
+    BOUND_EPSILON = 1e-3
+    # distances are rounded to meters, so a rounded distance is at most this
+    # far away from the exact one
+    ROUNDING_ERROR = 0.0005
+
+    def __init__(self, coordinates):
+        """
+        Build the index over a CoordinateArray or a list of (latitude, longitude) pairs.
+
+        The points are identified by their position in the array or list.
+        """
+        if not isinstance(coordinates, CoordinateArray):
+            coordinates = CoordinateArray(coordinates)
+        self._coords = coordinates
+        self._vectors = [self._to_vector(latitude_rad, longitude_rad) for latitude_rad, longitude_rad
+                         in zip(coordinates.latitudes_rad, coordinates.longitudes_rad)]
+        self._root = self._build(list(range(len(self._vectors))))
+
+    def __len__(self):
+        return len(self._coords)
+
+    @property
+    def coordinates(self):
+        return self._coords
+
+    def nearest(self, latitude, longitude):
+        """
+        Iterate over (distance, position) pairs, from the closest point to the farthest.
+
+        Distances are the ones computed by Coordinate.distance_to() (rounded
+        to meters), and points at the same distance come in the order of
+        their positions. This is the same order as sorting all of the points
+        by (distance, position), but the search only visits as much of the
+        tree as it needs to produce the points that are consumed.
+        """
+        if self._root is None:
+            return
+        my_coord = Coordinate(latitude, longitude)
+        query = self._to_vector(my_coord.latitude_rad, my_coord.longitude_rad)
+
+        nodes = [(self._lower_bound(query, self._root), 0, self._root)]
+        node_counter = 1
+        points = []
+        distances = None
+
+        while nodes or points:
+            next_bound = nodes[0][0] if nodes else None
+            # the unexplored points are at least next_bound away, so once
+            # their rounded distance can't match the closest buffered one,
+            # the buffered one comes next
+            if points and (next_bound is None or
+                    next_bound - self.ROUNDING_ERROR - self.BOUND_EPSILON > points[0][0]):
+                yield heapq.heappop(points)
+                continue
+
+            bound, _, node = heapq.heappop(nodes)
+            if node.positions is not None:
+                distances = self._coords.distances_from(latitude, longitude,
+                                                        node.positions, distances)
+                for distance, pos in zip(distances, node.positions):
+                    heapq.heappush(points, (distance, pos))
+            else:
+                for child in (node.left, node.right):
+                    heapq.heappush(nodes, (self._lower_bound(query, child), node_counter, child))
+                    node_counter += 1
+
+    def _build(self, positions):
+        if not positions:
+            return None
+
+        vectors = self._vectors
+        mins = tuple(min(vectors[pos][axis] for pos in positions) for axis in range(3))
+        maxs = tuple(max(vectors[pos][axis] for pos in positions) for axis in range(3))
+
+        if len(positions) <= self.LEAF_SIZE:
+            return _Node(mins, maxs, positions=positions)
+
+        # split along the axis with the largest spread
+        axis = max(range(3), key=lambda axis: maxs[axis] - mins[axis])
+        positions.sort(key=lambda pos: vectors[pos][axis])
+        middle = len(positions) // 2
+        return _Node(mins, maxs, left=self._build(positions[:middle]),
+                     right=self._build(positions[middle:]))
+
+    def _lower_bound(self, query, node):
+        """Lower bound of the haversine distance from the query to any point of the node."""
+        chord_sq = 0
+        for axis in range(3):
+            if query[axis] < node.mins[axis]:
+                chord_sq += (node.mins[axis] - query[axis]) ** 2
+            elif query[axis] > node.maxs[axis]:
+                chord_sq += (query[axis] - node.maxs[axis]) ** 2
+        half_chord = min(1.0, sqrt(chord_sq) / 2)
+        return 2 * asin(half_chord) * Coordinate.EARTH_RADIUS
+
+    def _to_vector(self, latitude_rad, longitude_rad):
+        cos_lat = cos(latitude_rad)
+        return (cos_lat * cos(longitude_rad), cos_lat * sin(longitude_rad), sin(latitude_rad))
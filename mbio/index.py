@@ -0,0 +1,246 @@
+"""In-memory indexes built over the loaded dataset."""
+from bisect import bisect_left
+from collections import namedtuple
+from mbio.utils import normalize_key, intern_key
+from mbio.exceptions import InvalidDataSetError
+from mbio.date.utils import isoformat_to_datetime
+from mbio.date.bookingledger import BookingLedger
+from mbio.models import weekly_availability
+
+
+VehicleKeys = namedtuple('VehicleKeys', ['id', 'model', 'fuel', 'transmission'])
+
+
+def vehicle_keys(vehicle):
+    """Compute the normalized comparison keys of a vehicle."""
+    # attribute values repeat across the fleet, so they are interned and
+    # shared, while ids are unique and would only bloat the interned table
+    return VehicleKeys(normalize_key(vehicle['id']), intern_key(vehicle['model']),
+                       intern_key(vehicle['fuel']), intern_key(vehicle['transmission']))
+
+
+class VehicleIndex(object):
+    """
+    Inverted index from vehicle attribute values to vehicle positions.
+
+    Every vehicle gets a position, which is its place in the dataset order
+    (dealer by dealer). For each normalized attribute value a posting list
+    with the ascending positions of the vehicles that have it is kept, so a
+    combined filter becomes an intersection of those posting lists.
+
+    The normalized keys and the compiled WeeklyAvailability of every vehicle
+    are computed once, when it is indexed, and kept next to it. Vehicles can
+    also be looked up by id, which must be unique across the dataset.
+    """
+
+    ATTRIBUTES = ('model', 'fuel', 'transmission')
+
+    def __init__(self, dealers=()):
+        self._vehicles = []
+        self._keys = []
+        self._availabilities = []
+        self._positions = {}
+        self._by_id = {}
+        self._postings = {attribute: {} for attribute in self.ATTRIBUTES}
+        self._posting_sets = {attribute: {} for attribute in self.ATTRIBUTES}
+        self._dealer_ranges = {}
+        self._dealer_ranges_by_record = {}
+
+        for dealer in dealers:
+            self.add_dealer(dealer)
+
+    def __len__(self):
+        return len(self._vehicles)
+
+    def add_dealer(self, dealer):
+        start = len(self._vehicles)
+        for vehicle in dealer['vehicles']:
+            self._add_vehicle(vehicle, dealer)
+        end = len(self._vehicles)
+
+        # the first dealer with a given id wins, as it did with the linear scan
+        self._dealer_ranges.setdefault(normalize_key(dealer['id']), (start, end))
+        self._dealer_ranges_by_record[id(dealer)] = (start, end)
+
+    def get_by_id(self, vehicle_id):
+        """
+        Return a (vehicle, dealer) pair for the vehicle with the provided id.
+
+        None is returned if there is no such vehicle.
+        """
+        return self._by_id.get(normalize_key(vehicle_id))
+
+    def keys_of(self, vehicle):
+        """Return the VehicleKeys of a vehicle, computing them only if it's not indexed."""
+        pos = self._positions.get(id(vehicle))
+        if pos is not None and self._vehicles[pos] is vehicle:
+            return self._keys[pos]
+        return vehicle_keys(vehicle)
+
+    def availability_of(self, vehicle):
+        """Return the WeeklyAvailability of a vehicle, compiling it only if it's not indexed."""
+        pos = self._positions.get(id(vehicle))
+        if pos is not None and self._vehicles[pos] is vehicle:
+            return self._availabilities[pos]
+        return weekly_availability(vehicle['availability'])
+
+    def dealer_keys(self, dealer):
+        """Return the VehicleKeys of all of the vehicles of a dealer."""
+        vehicle_range = self._dealer_ranges_by_record.get(id(dealer))
+        if vehicle_range is None:
+            return [vehicle_keys(vehicle) for vehicle in dealer['vehicles']]
+        start, end = vehicle_range
+        return self._keys[start:end]
+
+    def lookup(self, dealer=None, model=None, fuel=None, transmission=None):
+        """
+        Return the vehicles matching all of the provided attributes, in dataset order.
+
+        Attributes set to None are not used for filtering.
+        """
+        return [self._vehicles[pos] for pos in self._lookup_positions(dealer,
+                                                model, fuel, transmission)]
+
+    def lookup_page(self, limit, after=None, dealer=None, model=None, fuel=None,
+                    transmission=None):
+        """
+        Return a page of at most limit vehicles matching all of the provided attributes.
+
+        The vehicles are in dataset order, starting after the vehicle with
+        the id after, or from the first one. Also returns whether more
+        vehicles match after the page. The page isn't limited if limit is
+        None. A KeyError is raised if there is no vehicle with the id after.
+        """
+        start_pos = 0
+        if after is not None:
+            vehicle, _ = self._by_id[normalize_key(after)]
+            start_pos = self._positions[id(vehicle)] + 1
+
+        driver, probes = self._lookup_plan(dealer, model, fuel, transmission)
+        # the driver is sorted, so the page starts without looking at the previous ones
+        res = []
+        for i in range(bisect_left(driver, start_pos), len(driver)):
+            pos = driver[i]
+            if all(pos in probe for probe in probes):
+                if len(res) == limit:
+                    return res, True
+                res.append(self._vehicles[pos])
+        return res, False
+
+    def _lookup_positions(self, dealer, model, fuel, transmission):
+        driver, probes = self._lookup_plan(dealer, model, fuel, transmission)
+        if not probes:
+            return driver
+        return [pos for pos in driver if all(pos in probe for probe in probes)]
+
+    def _lookup_plan(self, dealer, model, fuel, transmission):
+        """
+        Return the ascending positions to iterate over and the sets of positions to probe them in.
+        """
+        if dealer is not None:
+            start, end = self._dealer_ranges.get(normalize_key(dealer), (0, 0))
+            candidates = range(start, end)
+        else:
+            candidates = None
+
+        filters = []
+        for attribute, value in zip(self.ATTRIBUTES, (model, fuel, transmission)):
+            if value is None:
+                continue
+            key = normalize_key(value)
+            postings = self._postings[attribute].get(key)
+            if postings is None:
+                return [], []
+            filters.append((postings, self._posting_sets[attribute][key]))
+
+        if not filters:
+            return (candidates if candidates is not None else range(len(self._vehicles))), []
+
+        # drive the intersection with the shortest posting list and probe the others
+        filters.sort(key=lambda posting: len(posting[0]))
+        driver = filters[0][0]
+        if candidates is not None and len(candidates) < len(driver):
+            driver = candidates
+        elif candidates is not None:
+            filters.append((candidates, candidates))
+
+        probes = [posting_set for postings, posting_set in filters if postings is not driver]
+        return driver, probes
+
+    def _add_vehicle(self, vehicle, dealer):
+        pos = len(self._vehicles)
+        keys = vehicle_keys(vehicle)
+        if keys.id in self._by_id:
+            msg = 'More than one vehicles with the same id: {}'.format(vehicle['id'])
+            raise InvalidDataSetError(msg)
+        try:
+            availability = weekly_availability(vehicle['availability'])
+        except (KeyError, ValueError):
+            msg = 'Vehicle {} has an invalid availability.'.format(vehicle['id'])
+            raise InvalidDataSetError(msg)
+        self._by_id[keys.id] = (vehicle, dealer)
+
+        self._vehicles.append(vehicle)
+        self._keys.append(keys)
+        self._availabilities.append(availability)
+        self._positions[id(vehicle)] = pos
+
+        for attribute in self.ATTRIBUTES:
+            key = getattr(keys, attribute)
+            self._postings[attribute].setdefault(key, []).append(pos)
+            self._posting_sets[attribute].setdefault(key, set()).add(pos)
+
+
+class BookingIndex(object):
+    """
+    Index over the bookings of the dataset.
+
+    Besides the bookings by id, it keeps the ledger of the active bookings
+    of every vehicle. Must be kept up to date with add() and cancel()
+    whenever a booking is appended to the dataset or cancelled.
+    """
+
+    def __init__(self, bookings=()):
+        self._by_id = {}
+        # booking key -> (vehicle id, pickup datetime) of the indexed bookings
+        self._pickups = {}
+        self.ledger = BookingLedger()
+
+        for booking in bookings:
+            self.add(booking)
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def add(self, booking, pickup_date=None):
+        """
+        Index a booking.
+
+        The pickup date is parsed from the booking if it is not provided.
+        """
+        if pickup_date is None:
+            try:
+                pickup_date = isoformat_to_datetime(booking['pickupDate'])
+            except ValueError:
+                msg = 'Booking {} has an invalid pickup date.'.format(booking['id'])
+                raise InvalidDataSetError(msg)
+
+        # the first booking with a given id wins, as it did with the linear scan.
+        # Later ones can't be cancelled, so they don't take up their slot either
+        key = normalize_key(booking['id'])
+        if key in self._by_id:
+            return
+        self._by_id[key] = booking
+        self._pickups[key] = (booking['vehicleId'], pickup_date)
+
+        if 'cancelledAt' not in booking:
+            self.ledger.add(booking['vehicleId'], pickup_date)
+
+    def cancel(self, booking):
+        """Remove a booking, which has just been cancelled, from the ledger."""
+        vehicle_id, pickup_date = self._pickups[normalize_key(booking['id'])]
+        self.ledger.remove(vehicle_id, pickup_date)
+
+    def get(self, booking_id):
+        """Return the booking with the provided id or None if there is no such booking."""
+        return self._by_id.get(normalize_key(booking_id))
@@ -0,0 +1,293 @@
+"""Write-ahead journal of the bookings."""
+import os
+import json
+import zlib
+import struct
+import threading
+
+from mbio.models import to_json
+from mbio.exceptions import JournalError
+
+
+class BookingJournal(object):
+    """
+    Append-only journal of the created and cancelled bookings.
+
+    Every record is a JSON object, framed by its length, its CRC32 checksum
+    and a sequence number. The records are appended to a buffer, which a
+    flusher thread writes and fsyncs in one go, so the records of concurrent
+    requests share an fsync (group commit). Callers wait() for their record
+    to be durable before acknowledging it.
+
+    compact() writes a snapshot of all of the bookings and drops the records
+    it includes from the journal, so recovering only replays the records
+    written since the last snapshot. A torn record at the end of the journal,
+    left by a crash in the middle of a write, is truncated when recovering,
+    along with anything after it.
+    """
+
+    # length of the payload, its CRC32, sequence number
+    HEADER = struct.Struct('>IIQ')
+    SNAPSHOT_SUFFIX = '.snapshot'
+    # records after which the bookings should be compacted
+    COMPACT_EVERY = 10000
+
+    OP_CREATE = 'create'
+    OP_CANCEL = 'cancel'
+
+    def __init__(self, path, compact_every=COMPACT_EVERY):
+        self._path = path
+        self._snapshot_path = path + self.SNAPSHOT_SUFFIX
+        self._compact_every = compact_every
+
+        # _lock is always acquired before _file_lock, which is held while
+        # writing to the file
+        self._lock = threading.Condition(threading.Lock())
+        self._file_lock = threading.Lock()
+        self._file = None
+        self._buffer = bytearray()
+        # size of the journal, including the buffered records
+        self._size = 0
+        self._last_seq = 0
+        self._durable_seq = 0
+        self._snapshot_seq = 0
+        self._compacting = False
+        self._error = None
+        self._closed = False
+        self._flusher = None
+        self._flusher_pid = None
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def last_seq(self):
+        return self._last_seq
+
+    @property
+    def error(self):
+        """The error which the journal failed with (None if it didn't), it can't be used after it."""
+        return self._error
+
+    def recover(self):
+        """
+        Read the snapshot and the journal, and open the journal for appending.
+
+        Returns the bookings of the snapshot (None if there's no snapshot),
+        and the records of the journal which are not in the snapshot, in
+        order. Must be called once, before appending to the journal.
+        """
+        bookings = None
+        if os.path.exists(self._snapshot_path):
+            try:
+                with open(self._snapshot_path, 'r') as f:
+                    snapshot = json.load(f)
+                self._snapshot_seq = snapshot['seq']
+                bookings = snapshot['bookings']
+            except (ValueError, KeyError, TypeError):
+                raise JournalError('Invalid journal snapshot: {}'.format(self._snapshot_path))
+
+        records = []
+        data = b''
+        if os.path.exists(self._path):
+            with open(self._path, 'rb') as f:
+                data = f.read()
+
+        offset = 0
+        last_seq = self._snapshot_seq
+        while offset + self.HEADER.size <= len(data):
+            length, crc, seq = self.HEADER.unpack_from(data, offset)
+            end = offset + self.HEADER.size + length
+            payload = data[offset + self.HEADER.size:end]
+            if end > len(data) or zlib.crc32(payload) != crc:
+                break
+            offset = end
+            if seq > self._snapshot_seq:
+                try:
+                    records.append(json.loads(payload.decode()))
+                except ValueError:
+                    raise JournalError('Invalid journal record {} in {}'.format(seq, self._path))
+            last_seq = max(last_seq, seq)
+
+        self._file = open(self._path, 'ab')
+        if offset < len(data):
+            # the end of the journal was torn by a crash
+            self._file.truncate(offset)
+            self._sync(self._file)
+        self._size = offset
+        self._last_seq = self._durable_seq = last_seq
+        return bookings, records
+
+    def append(self, record):
+        """
+        Append a record to the journal.
+
+        Returns its sequence number, which can be waited for with wait().
+        """
+        payload = json.dumps(record, default=to_json).encode()
+        crc = zlib.crc32(payload)
+        with self._lock:
+            self._check_usable()
+            self._start_flusher_if_needed()
+            self._last_seq += 1
+            header = self.HEADER.pack(len(payload), crc, self._last_seq)
+            self._buffer += header
+            self._buffer += payload
+            self._size += len(header) + len(payload)
+            self._lock.notify_all()
+            return self._last_seq
+
+    def wait(self, seq):
+        """Wait until the record with the sequence number seq is durable."""
+        with self._lock:
+            while self._durable_seq < seq and self._error is None:
+                self._lock.wait()
+            if self._durable_seq < seq:
+                raise JournalError('Could not write the journal: {}'.format(self._error))
+
+    def needs_compaction(self):
+        return (self._compact_every > 0 and not self._compacting and
+                self._last_seq - self._snapshot_seq >= self._compact_every)
+
+    def mark(self):
+        """
+        Returns the sequence number of the last record and the size of the journal up to it.
+
+        Together with the bookings at the same time, they are what compact() needs.
+        """
+        with self._lock:
+            return self._last_seq, self._size
+
+    def compact(self, bookings, seq, size):
+        """
+        Write a snapshot of the bookings and drop the records it includes from the journal.
+
+        The bookings are already encoded to JSON, and must include the
+        records up to seq, which end at size (see mark()). Returns False if
+        another compaction is in progress.
+        """
+        with self._lock:
+            self._check_usable()
+            if self._compacting:
+                return False
+            self._compacting = True
+
+        try:
+            tmp_path = self._snapshot_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                f.write('{{"seq": {}, "bookings": ['.format(seq))
+                for i, booking in enumerate(bookings):
+                    f.write(', ' + booking if i else booking)
+                f.write(']}')
+                self._sync(f)
+            os.replace(tmp_path, self._snapshot_path)
+            self._sync_directory()
+            self._snapshot_seq = seq
+            self._truncate_head(size)
+        finally:
+            with self._lock:
+                self._compacting = False
+        return True
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._lock.notify_all()
+        if self._flusher is not None and self._flusher_pid == os.getpid():
+            self._flusher.join()
+        if self._file is not None:
+            with self._file_lock:
+                self._file.close()
+
+    def _truncate_head(self, size):
+        with self._lock, self._file_lock:
+            # write the buffered records, so the tail is all in the file
+            self._write(self._buffer)
+            self._buffer = bytearray()
+            self._durable_seq = self._last_seq
+            self._lock.notify_all()
+
+            with open(self._path, 'rb') as f:
+                f.seek(size)
+                tail = f.read()
+            tmp_path = self._path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(tail)
+                self._sync(f)
+            self._file.close()
+            os.replace(tmp_path, self._path)
+            self._sync_directory()
+            self._file = open(self._path, 'ab')
+            self._size -= size
+
+    def _start_flusher_if_needed(self):
+        # the thread doesn't survive a fork, the child process starts its own
+        if self._flusher is None or self._flusher_pid != os.getpid():
+            self._flusher_pid = os.getpid()
+            self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            with self._lock:
+                while not self._buffer and not self._closed:
+                    self._lock.wait()
+                if not self._buffer:
+                    return
+                data = self._buffer
+                self._buffer = bytearray()
+                seq = self._last_seq
+                # taken before letting go of _lock, so the batches are written in order
+                self._file_lock.acquire()
+
+            start = None
+            try:
+                # the records appended meanwhile are buffered for the next batch
+                start = self._file.tell()
+                self._write(data)
+            except OSError as e:
+                # the callers are told that the batch failed, so drop it (as
+                # far as possible), rather than replaying it on recovery
+                try:
+                    if start is not None:
+                        self._file.truncate(start)
+                except OSError:
+                    pass
+                with self._lock:
+                    self._error = e
+                    self._lock.notify_all()
+                return
+            finally:
+                self._file_lock.release()
+
+            with self._lock:
+                self._durable_seq = max(self._durable_seq, seq)
+                self._lock.notify_all()
+
+    def _write(self, data):
+        if data:
+            self._file.write(data)
+            self._sync(self._file)
+
+    def _sync(self, f):
+        f.flush()
+        os.fsync(f.fileno())
+
+    def _sync_directory(self):
+        # make the renames durable as well
+        if not hasattr(os, 'O_DIRECTORY'):
+            return
+        fd = os.open(os.path.dirname(os.path.abspath(self._path)), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _check_usable(self):
+        if self._file is None:
+            raise JournalError('The journal must be recovered before it is used')
+        if self._closed:
+            raise JournalError('The journal is closed')
+        if self._error is not None:
+            raise JournalError('Could not write the journal: {}'.format(self._error))
@@ -0,0 +1,160 @@
+"""Streaming loader of the JSON dataset."""
+import os
+import json
+import codecs
+
+from mbio.exceptions import InvalidDataSetError, DatasetNotFoundError
+
+
+class DatasetLoader(object):
+    """
+    Loads the JSON dataset one array element at a time.
+
+    The file is read in chunks, and the elements of the top-level arrays
+    (the dealers and the bookings) are decoded one by one with
+    JSONDecoder.raw_decode(). Only the part of the file which hasn't been
+    decoded yet is kept, so the memory needed is about the size of the
+    loaded dataset, instead of several times the size of the file with
+    json.load(). The result is the same as json.load()'s.
+
+    progress, if provided, is called with the number of bytes read so far
+    and the size of the file, after every chunk. hooks can map the keys of
+    top-level arrays to functions, which convert each of their elements as
+    soon as it's decoded.
+    """
+
+    CHUNK_SIZE = 1024 * 1024
+    WHITESPACE = ' \t\n\r'
+
+    def __init__(self, path, progress=None, chunk_size=CHUNK_SIZE, hooks=None):
+        self._path = path
+        self._progress = progress
+        self._chunk_size = chunk_size
+        self._hooks = hooks or {}
+
+    def load(self):
+        try:
+            with open(self._path, 'rb') as f:
+                try:
+                    return _DatasetParser(f, self._chunk_size, self._progress,
+                                          self._hooks).parse()
+                except ValueError:
+                    # JSONDecodeError and UnicodeDecodeError included
+                    msg = 'Error in when decoding JSON file: {}'.format(self._path)
+                    raise InvalidDataSetError(msg)
+        except FileNotFoundError:
+            msg = 'Dataset at {} not found. Make sure that the file path is correct.'.format(
+                self._path)
+            raise DatasetNotFoundError(msg)
+
+
+class _DatasetParser(object):
+    """Parses a file with a JSON object, raising ValueError if it's not valid."""
+
+    def __init__(self, f, chunk_size, progress, hooks):
+        self._file = f
+        self._hooks = hooks
+        self._json_decoder = json.JSONDecoder(object_pairs_hook=self._object)
+        self._keys = {}
+        self._chunk_size = chunk_size
+        self._progress = progress
+        self._size = os.fstat(f.fileno()).st_size
+        self._read = 0
+        self._text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+
+    def parse(self):
+        self._expect('{')
+        dataset = {}
+        if self._peek() == '}':
+            self._pos += 1
+        else:
+            while True:
+                key = self._decode_value()
+                if not isinstance(key, str):
+                    raise ValueError('Expected a key at {}'.format(self._pos))
+                self._expect(':')
+                if self._peek() == '[':
+                    self._pos += 1
+                    dataset[key] = self._decode_array(self._hooks.get(key))
+                else:
+                    dataset[key] = self._decode_value()
+                if not self._separator('}'):
+                    break
+
+        if self._peek():
+            raise ValueError('Extra data after the dataset')
+        return dataset
+
+    def _decode_array(self, hook=None):
+        items = []
+        if self._peek() == ']':
+            self._pos += 1
+            return items
+        while True:
+            item = self._decode_value()
+            items.append(hook(item) if hook is not None else item)
+            if not self._separator(']'):
+                return items
+
+    def _decode_value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self._json_decoder.raw_decode(self._buffer, self._pos)
+                # a number near the end of the buffer may go on in the next
+                # chunk, even after a '.', an 'e' or its sign ('1.5e+3')
+                if end + 2 < len(self._buffer) or self._eof:
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            # the value doesn't end in the buffer yet, at least double what's left of it
+            self._fill(len(self._buffer) - self._pos)
+
+    def _peek(self):
+        """Skip the whitespace, and return the next character ('' at the end)."""
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in DatasetLoader.WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buffer) or self._eof:
+                return self._buffer[self._pos:self._pos + 1]
+            self._fill()
+
+    def _next(self):
+        c = self._peek()
+        self._pos += 1
+        return c
+
+    def _expect(self, c):
+        if self._next() != c:
+            raise ValueError('Expected {!r} at {}'.format(c, self._pos - 1))
+
+    def _separator(self, closing):
+        """Read a ',' and return True, or the closing character and return False."""
+        c = self._next()
+        if c not in (',', closing):
+            raise ValueError('Expected \',\' or {!r} at {}'.format(closing, self._pos - 1))
+        return c == ','
+
+    def _object(self, pairs):
+        # json.load() shares the strings of the keys of the whole file, while
+        # raw_decode() only shares them within a value, so share them here
+        keys = self._keys
+        return {keys.setdefault(key, key): value for key, value in pairs}
+
+    def _fill(self, min_size=1):
+        # drop what was already decoded
+        self._buffer = self._buffer[self._pos:]
+        self._pos = 0
+        wanted = len(self._buffer) + max(min_size, 1)
+        while len(self._buffer) < wanted and not self._eof:
+            data = self._file.read(self._chunk_size)
+            self._read += len(data)
+            self._eof = not data
+            self._buffer += self._text_decoder.decode(data, final=self._eof)
+            if self._progress is not None:
+                self._progress(self._read, self._size)
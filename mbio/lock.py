@@ -0,0 +1,89 @@
+"""Readers-writer lock used to make the TestDrive app thread-safe."""
+import threading
+from functools import wraps
+from contextlib import contextmanager
+
+
+class ReadWriteLock(object):
+    """
+    Lock that can be held by many readers at once, or by a single writer.
+
+    Writers are preferred: once a writer is waiting, new readers wait for it,
+    so a steady stream of reads can't starve the writes. The lock is not
+    reentrant.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    def acquire_read(self):
+        with self._condition:
+            while self._writer or self._waiting_writers:
+                self._condition.wait()
+            self._readers += 1
+
+    def release_read(self):
+        with self._condition:
+            self._readers -= 1
+            if self._readers == 0:
+                self._condition.notify_all()
+
+    def acquire_write(self):
+        with self._condition:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._condition.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+
+    def release_write(self):
+        with self._condition:
+            self._writer = False
+            self._condition.notify_all()
+
+    @contextmanager
+    def read_locked(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write_locked(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+def read_locked(f):
+    """
+    Runs the method holding the read lock of its object.
+
+    IMPORTANT: the object must have a ReadWriteLock in its _lock attribute.
+    """
+    @wraps(f)
+    def decorated_function(self, *args, **kwargs):
+        with self._lock.read_locked():
+            return f(self, *args, **kwargs)
+
+    return decorated_function
+
+
+def write_locked(f):
+    """
+    Runs the method holding the write lock of its object.
+
+    IMPORTANT: the object must have a ReadWriteLock in its _lock attribute.
+    """
+    @wraps(f)
+    def decorated_function(self, *args, **kwargs):
+        with self._lock.write_locked():
+            return f(self, *args, **kwargs)
+
+    return decorated_function
@@ -0,0 +1,284 @@
+"""Compact records of the dealers, vehicles and bookings of the dataset."""
+import sys
+import weakref
+from collections.abc import Mapping, MutableMapping
+
+from mbio.date.availability import WeeklyAvailability
+
+
+def intern_code(value):
+    """
+    Returns the shared copy of a value which repeats across the dataset, like a vehicle's model.
+
+    Values which aren't strings are returned as they are.
+    """
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def to_json(obj):
+    """
+    Converts a record to the JSON object it was made from, for json.dumps(default=to_json).
+    """
+    if isinstance(obj, (Record, Availability)):
+        return obj.to_dict()
+    raise TypeError('Object of type {} is not JSON serializable'.format(type(obj).__name__))
+
+
+def weekly_availability(availability):
+    """Returns the compiled WeeklyAvailability of a vehicle's availability."""
+    if isinstance(availability, Availability):
+        return availability.weekly
+    return WeeklyAvailability(availability)
+
+
+def _plain(value):
+    if isinstance(value, (Record, Availability)):
+        return value.to_dict()
+    if isinstance(value, list):
+        return [_plain(item) for item in value]
+    return value
+
+
+class Availability(Mapping):
+    """
+    Weekly availability of vehicles, shared by all of the vehicles with the same one.
+
+    It maps the week day names to tuples of the "HHMM" times, in their
+    original order, and is compiled into a WeeklyAvailability (a bitmap of
+    time slots) only once. Use Availability.of() to get the shared one.
+    """
+
+    __slots__ = ('_days', '_weekly', '__weakref__')
+
+    # (day, times) pairs: the shared Availability, while any vehicle has it
+    _shared = weakref.WeakValueDictionary()
+
+    def __init__(self, days):
+        self._days = days
+        self._weekly = None
+
+    @classmethod
+    def of(cls, availability):
+        """
+        Returns the shared Availability equal to an availability from the dataset.
+
+        Values which aren't a valid availability are returned as they are,
+        to be rejected when they're compiled.
+        """
+        if isinstance(availability, Availability) or not isinstance(availability, dict):
+            return availability
+        items = []
+        for day, times in availability.items():
+            if not isinstance(day, str) or not isinstance(times, list) or \
+                    not all(isinstance(t, str) for t in times):
+                return availability
+            items.append((sys.intern(day), tuple(sys.intern(t) for t in times)))
+
+        key = tuple(items)
+        shared = cls._shared.get(key)
+        if shared is None:
+            shared = cls._shared.setdefault(key, cls(dict(items)))
+        return shared
+
+    @property
+    def weekly(self):
+        """The compiled WeeklyAvailability, see its exceptions."""
+        if self._weekly is None:
+            self._weekly = WeeklyAvailability(self)
+        return self._weekly
+
+    def __getitem__(self, day):
+        return self._days[day]
+
+    def __iter__(self):
+        return iter(self._days)
+
+    def __len__(self):
+        return len(self._days)
+
+    def __eq__(self, other):
+        if isinstance(other, Availability):
+            return self._days == other._days
+        if isinstance(other, Mapping):
+            return self.to_dict() == dict(other.items())
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'Availability({!r})'.format(self.to_dict())
+
+    def to_dict(self):
+        return {day: list(times) for day, times in self._days.items()}
+
+
+class Record(MutableMapping):
+    """
+    A JSON object of the dataset, with the values of its known FIELDS in __slots__.
+
+    Records behave like the dicts they're made from: they're read and
+    written by key, iterate over their keys in the original order, and are
+    equal to dicts with the same items. Keys which aren't FIELDS are kept in
+    a dict of extra items. The records with the same keys share the tuple of
+    their keys, so a record takes about as much memory as its values.
+
+    The CONVERTERS of the fields make their values more compact (shared),
+    whenever they're set. to_dict() converts a record back to its JSON
+    object, which is only needed to encode it (see to_json()).
+    """
+
+    __slots__ = ('_keys', '_extra')
+
+    FIELDS = frozenset()
+    CONVERTERS = {}
+    # the records' keys follow the few orders of their JSON objects, the keys of
+    # any others aren't shared
+    MAX_SHARED_KEYS = 1024
+    # tuple of keys: the same tuple, shared by the records
+    _shared_keys = {}
+
+    def __init__(self, items=()):
+        if not isinstance(items, Mapping):
+            items = dict(items)
+        fields = self.FIELDS
+        converters = self.CONVERTERS
+        extra = None
+        for key, value in items.items():
+            converter = converters.get(key)
+            if converter is not None:
+                value = converter(value)
+            if key in fields:
+                setattr(self, key, value)
+            else:
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+        self._extra = extra
+        self._keys = self._share_keys(tuple(items))
+
+    def __getitem__(self, key):
+        if key in self.FIELDS:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key)
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        converter = self.CONVERTERS.get(key)
+        if converter is not None:
+            value = converter(value)
+        if key in self.FIELDS:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+        if key not in self._keys:
+            self._keys = self._share_keys(self._keys + (key,))
+
+    def __delitem__(self, key):
+        if key not in self._keys:
+            raise KeyError(key)
+        if key in self.FIELDS:
+            delattr(self, key)
+        else:
+            del self._extra[key]
+        self._keys = self._share_keys(tuple(k for k in self._keys if k != key))
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, self.to_dict())
+
+    def to_dict(self):
+        return {key: _plain(self[key]) for key in self._keys}
+
+    @classmethod
+    def from_fields(cls, keys, values):
+        """
+        Makes a record with the values of some of its FIELDS, in the order of keys.
+
+        The values must already be converted (see CONVERTERS), they're set as
+        they are.
+        """
+        record = cls.__new__(cls)
+        for key, value in zip(keys, values):
+            setattr(record, key, value)
+        record._extra = None
+        record._keys = cls._share_keys(tuple(keys))
+        return record
+
+    @classmethod
+    def _share_keys(cls, keys):
+        shared = cls._shared_keys.get(keys)
+        if shared is None:
+            if len(cls._shared_keys) >= cls.MAX_SHARED_KEYS:
+                return keys
+            shared = cls._shared_keys.setdefault(keys, keys)
+        return shared
+
+
+def _vehicles(vehicles):
+    if not isinstance(vehicles, list):
+        return vehicles
+    return [Vehicle(vehicle) if isinstance(vehicle, dict) else vehicle for vehicle in vehicles]
+
+
+def _week_days(days):
+    if not isinstance(days, list):
+        return days
+    return [intern_code(day) for day in days]
+
+
+class Vehicle(Record):
+
+    __slots__ = ('id', 'model', 'fuel', 'transmission', 'availability')
+
+    FIELDS = frozenset(__slots__)
+    CONVERTERS = {
+        'model': intern_code,
+        'fuel': intern_code,
+        'transmission': intern_code,
+        'availability': Availability.of,
+    }
+
+
+class Dealer(Record):
+
+    __slots__ = ('id', 'name', 'latitude', 'longitude', 'closed', 'vehicles')
+
+    FIELDS = frozenset(__slots__)
+    CONVERTERS = {
+        'closed': _week_days,
+        'vehicles': _vehicles,
+    }
+
+
+class Booking(Record):
+
+    __slots__ = ('id', 'firstName', 'lastName', 'vehicleId', 'pickupDate', 'createdAt',
+                 'cancelledAt', 'cancelledReason')
+
+    FIELDS = frozenset(__slots__)
+
+
+def dealer_from_json(dealer):
+    """Converts a dealer of the dataset, with its vehicles, to a Dealer."""
+    return Dealer(dealer) if isinstance(dealer, dict) else dealer
+
+
+def booking_from_json(booking):
+    """Converts a booking of the dataset to a Booking."""
+    return Booking(booking) if isinstance(booking, dict) else booking
@@ -0,0 +1,228 @@
+"""
+asyncio HTTP/1.1 front end for the request handler.
+"""
+import io
+import socket
+import asyncio
+import threading
+import http.client
+from http import HTTPStatus
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+
+
+class _ResponseWriter(object):
+    """
+    File object through which a handler, in a thread of the pool, sends its response.
+
+    The writes are buffered and sent by the event loop whenever the buffer
+    is full or flushed, and the handler waits until the connection has room
+    for more (so a streamed response is never held in memory as a whole).
+    Once the connection is closed, writing raises ConnectionResetError.
+    """
+
+    BUFFER_SIZE = 64 * 1024
+
+    def __init__(self, loop, writer):
+        self._loop = loop
+        self._writer = writer
+        self._buffer = bytearray()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._sending = None
+
+    def write(self, data):
+        self._buffer += data
+        if len(self._buffer) >= self.BUFFER_SIZE:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        if not self._buffer:
+            return
+        data = bytes(self._buffer)
+        del self._buffer[:]
+        with self._lock:
+            if self._closed:
+                raise ConnectionResetError('The connection was closed')
+            self._sending = asyncio.run_coroutine_threadsafe(self._send(data), self._loop)
+        try:
+            self._sending.result()
+        except CancelledError:
+            raise ConnectionResetError('The connection was closed')
+
+    def close(self):
+        """Stop sending, must be called from the event loop."""
+        with self._lock:
+            self._closed = True
+            if self._sending is not None:
+                # the handler may be waiting for it, and the loop may stop
+                self._sending.cancel()
+
+    async def _send(self, data):
+        self._writer.write(data)
+        await self._writer.drain()
+
+
+class _BufferedRequestMixin(object):
+    """Runs a request handler on a request that was already read into memory."""
+
+    def setup(self):
+        raw_request, self.wfile = self.request
+        self.connection = None
+        self.rfile = io.BytesIO(raw_request)
+
+    def handle(self):
+        # the connection is managed by the server, one request at a time
+        self.handle_one_request()
+
+    def finish(self):
+        self.wfile.flush()
+
+
+class AsyncHTTPServer(object):
+    """
+    HTTP/1.1 server with persistent connections and pipelining.
+
+    The connections are handled by an asyncio event loop, while the requests
+    themselves are handled by the same request handler as the other servers
+    (Server), in a pool of threads. The handlers take the TestDrive's lock
+    and the geo queries are CPU-heavy, so neither runs on the event loop.
+
+    The handler writes the response as it would to a socket (with a
+    Content-Length, or in chunks when it's streamed), and it's sent as it's
+    written. Pipelined requests are handled one after the other and answered
+    in order. The connection is closed after a response if the handler says
+    so, for example when it failed after the response was started.
+    """
+
+    DEFAULT_THREADS = 16
+    # seconds a connection may be idle before it's closed
+    KEEP_ALIVE_TIMEOUT = 15
+    address_family = socket.AF_INET
+    request_queue_size = socket.SOMAXCONN
+
+    def __init__(self, server_address, RequestHandlerClass, threads=DEFAULT_THREADS,
+                 keep_alive_timeout=KEEP_ALIVE_TIMEOUT):
+        self.RequestHandlerClass = type(RequestHandlerClass.__name__,
+                                        (_BufferedRequestMixin, RequestHandlerClass), {})
+        self.keep_alive_timeout = keep_alive_timeout
+        self.socket = socket.socket(self.address_family, socket.SOCK_STREAM)
+        try:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.socket.bind(server_address)
+            self.socket.listen(self.request_queue_size)
+        except OSError:
+            self.socket.close()
+            raise
+        self.server_address = self.socket.getsockname()
+        self._executor = ThreadPoolExecutor(max_workers=threads)
+        self._loop = None
+        self._stopped = None
+        self._serving = threading.Event()
+        self._finished = threading.Event()
+
+    def serve_forever(self):
+        # asyncio.run() needs Python 3.7
+        loop = asyncio.new_event_loop()
+        try:
+            self._loop = loop
+            loop.run_until_complete(self._serve())
+        finally:
+            loop.close()
+            self._finished.set()
+
+    def shutdown(self):
+        """Stop serve_forever() and wait until it returns. Must be called from another thread."""
+        self._serving.wait()
+        self._loop.call_soon_threadsafe(self._stopped.set)
+        self._finished.wait()
+
+    def server_close(self):
+        self.socket.close()
+        self._executor.shutdown(wait=True)
+
+    async def _serve(self):
+        self._stopped = asyncio.Event()
+        connections = set()
+
+        def handle_connection(reader, writer):
+            task = self._loop.create_task(self._handle_connection(reader, writer))
+            connections.add(task)
+            task.add_done_callback(connections.discard)
+
+        server = await asyncio.start_server(handle_connection, sock=self.socket)
+        self._serving.set()
+        await self._stopped.wait()
+
+        server.close()
+        # idle persistent connections would keep the server open
+        for task in list(connections):
+            task.cancel()
+        await asyncio.gather(*connections, return_exceptions=True)
+        await server.wait_closed()
+
+    async def _handle_connection(self, reader, writer):
+        client_address = writer.get_extra_info('peername')
+        wfile = _ResponseWriter(self._loop, writer)
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader),
+                                                     self.keep_alive_timeout)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except (ValueError, http.client.HTTPException):
+                    # asyncio.LimitOverrunError is a ValueError too
+                    writer.write(self._error_response(HTTPStatus.BAD_REQUEST))
+                    break
+
+                version, raw_request = request
+                if not version.startswith(b'HTTP/1.'):
+                    writer.write(self._error_response(HTTPStatus.HTTP_VERSION_NOT_SUPPORTED))
+                    break
+
+                close_connection = await self._loop.run_in_executor(
+                    self._executor, self._handle_request, raw_request, wfile, client_address)
+                await writer.drain()
+                if close_connection:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            wfile.close()
+            writer.close()
+
+    async def _read_request(self, reader):
+        """
+        Read the next request.
+
+        Returns the HTTP version and the whole request.
+        """
+        head = b''
+        while not head:
+            # empty lines before a request are ignored
+            head = (await reader.readuntil(b'\r\n\r\n')).lstrip(b'\r\n')
+
+        request_line, _, header_lines = head.partition(b'\r\n')
+        words = request_line.split()
+        if len(words) != 3:
+            raise ValueError('Invalid request line')
+        version = words[2]
+
+        headers = http.client.parse_headers(io.BytesIO(header_lines))
+        if 'Transfer-Encoding' in headers:
+            raise ValueError('Only requests with a Content-Length are supported')
+        content_length = int(headers.get('Content-Length', 0))
+        if content_length < 0:
+            raise ValueError('Invalid Content-Length')
+        body = await reader.readexactly(content_length)
+        return version, head + body
+
+    def _handle_request(self, raw_request, wfile, client_address):
+        """Handle a request, and return whether the connection must be closed after it."""
+        handler = self.RequestHandlerClass((raw_request, wfile), client_address, self)
+        return handler.close_connection
+
+    def _error_response(self, status):
+        return 'HTTP/1.1 {} {}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n'.format(
+            status.value, status.phrase).encode()
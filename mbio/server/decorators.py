@@ -17,13 +17,21 @@ def handle_expcetions(f):
         try:
             f(*args, **kwargs)
         except Exception as e:
-            handler.send_response(500)
-            handler.send_header('Content-type','application/json')
-            handler.end_headers()
+            if getattr(handler, 'response_started', False):
+                # part of the response may have been sent already, so the
+                # connection can't be used for another request
+                handler.close_connection = True
+            else:
+                ret_json = {'error': 'An internal application error has occured.'}
+                ret_json = json.dumps(ret_json).encode()
 
-            ret_json = {'error': 'An internal application error has occured.'}
-            ret_json = json.dumps(ret_json)
-            handler.wfile.write(ret_json.encode())
+                handler.send_response(500)
+                handler.send_header('Content-type','application/json')
+                handler.send_header('Content-Length', str(len(ret_json)))
+                # the request may not have been read completely
+                handler.send_header('Connection', 'close')
+                handler.end_headers()
+                handler.wfile.write(ret_json)
 
             exc_type, exc_value, exc_traceback = sys.exc_info()
             traceback.print_tb(exc_traceback, file=sys.stdout)
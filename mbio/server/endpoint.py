@@ -4,7 +4,7 @@ class Endpoint(object):
     API_PREFIX = '/api/'
     VEHICLES = API_PREFIX + 'vehicles/'  # ?dealer=AAA?model=XXX?fuel=YYY?transmission=ZZZ
 
-    DEALERS_CLOSEST_LIST = API_PREFIX + 'dealers/' # ?dealer=AAA?model=XXX?fuel=YYY?transmission=ZZZ?latitude=LLL?longitude=OOO
+    DEALERS_CLOSEST_LIST = API_PREFIX + 'dealers/' # ?dealer=AAA?model=XXX?fuel=YYY?transmission=ZZZ?latitude=LLL?longitude=OOO?limit=KKK?max_distance_km=DDD
     DEALER_CLOSEST = API_PREFIX + 'dealers/closest/' # ?dealer=AAA?model=XXX?fuel=YYY?transmission=ZZZ?latitude=LLL?longitude=OOO
     DEALERS_IN_POLYGON = API_PREFIX + 'dealers/polygon/'
 
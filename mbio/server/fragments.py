@@ -0,0 +1,63 @@
+"""Pre-encoded JSON of the dealers and vehicles."""
+import json
+from mbio.models import to_json
+
+
+class JSONFragments(object):
+    """
+    The dealers and their vehicles, encoded as JSON once.
+
+    Responses with dealers and vehicles are then encoded by joining their
+    fragments, and the result is the same as
+    json.dumps(response, default=to_json).encode().
+    Objects which weren't encoded up front (like bookings) are encoded on
+    demand.
+
+    The fragments are not updated if the dealers or vehicles are modified in
+    place, so a new JSONFragments must be built whenever the dataset changes
+    (see TestDrive.dataset_version).
+    """
+
+    def __init__(self, dealers, version=None):
+        self.version = version
+        # id(object): (object, encoded object), the object keeps its id unique
+        self._fragments = {}
+        for dealer in dealers:
+            self._add(dealer)
+            for vehicle in dealer['vehicles']:
+                self._add(vehicle)
+
+    def __len__(self):
+        return len(self._fragments)
+
+    def dumps(self, obj):
+        """
+        Encode a response, made of dicts and lists of dealers, vehicles and
+        other JSON values, to UTF-8 JSON bytes.
+        """
+        return b''.join(self.iterdumps(obj))
+
+    def iterdumps(self, obj):
+        """Same as dumps(), in pieces, with one for each dealer and vehicle."""
+        fragment = self._fragments.get(id(obj), None)
+        if fragment is not None and fragment[0] is obj:
+            yield fragment[1]
+        elif isinstance(obj, list):
+            yield b'['
+            for i, item in enumerate(obj):
+                if i:
+                    yield b', '
+                yield from self.iterdumps(item)
+            yield b']'
+        # json.dumps() converts keys which aren't strings, let it do that
+        elif isinstance(obj, dict) and all(isinstance(key, str) for key in obj):
+            yield b'{'
+            for i, (key, value) in enumerate(obj.items()):
+                yield (b', ' if i else b'') + json.dumps(key).encode() + b': '
+                yield from self.iterdumps(value)
+            yield b'}'
+        else:
+            yield json.dumps(obj, default=to_json).encode()
+
+    def _add(self, obj):
+        self._fragments[id(obj)] = (obj, json.dumps(obj, default=to_json).encode())
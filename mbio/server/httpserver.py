@@ -0,0 +1,53 @@
+"""HTTP servers the request handler can be served with."""
+import threading
+from http.server import HTTPServer
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ThreadPoolHTTPServer(HTTPServer):
+    """
+    HTTP server that handles each connection in a bounded pool of threads.
+
+    Connections accepted while all of the threads are busy wait in the
+    pool's queue. Persistent connections hold a thread while they're idle,
+    so they are only kept open for keep_alive_timeout seconds, and are
+    closed after a response whenever other connections are waiting.
+    """
+
+    DEFAULT_THREADS = 16
+    # seconds an idle persistent connection may hold a thread
+    KEEP_ALIVE_TIMEOUT = 1
+
+    def __init__(self, server_address, RequestHandlerClass, threads=DEFAULT_THREADS,
+                 bind_and_activate=True, keep_alive_timeout=KEEP_ALIVE_TIMEOUT):
+        self.keep_alive_timeout = keep_alive_timeout
+        self._executor = ThreadPoolExecutor(max_workers=threads)
+        # connections accepted, which don't have a thread yet
+        self._waiting = 0
+        self._waiting_lock = threading.Lock()
+        super(ThreadPoolHTTPServer, self).__init__(server_address, RequestHandlerClass,
+                                                   bind_and_activate)
+
+    @property
+    def has_waiting_connections(self):
+        return self._waiting > 0
+
+    def process_request(self, request, client_address):
+        with self._waiting_lock:
+            self._waiting += 1
+        self._executor.submit(self._process_request_thread, request, client_address)
+
+    def _process_request_thread(self, request, client_address):
+        with self._waiting_lock:
+            self._waiting -= 1
+        # same as socketserver.ThreadingMixIn.process_request_thread()
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super(ThreadPoolHTTPServer, self).server_close()
+        self._executor.shutdown(wait=True)
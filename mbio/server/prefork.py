@@ -0,0 +1,126 @@
+"""
+Pre-forking HTTP server: worker processes sharing one listening socket.
+"""
+import os
+import sys
+import signal
+import multiprocessing
+from http.server import HTTPServer
+from multiprocessing.managers import BaseManager
+
+from mbio.server.server import Server
+from mbio.storage.sqlitestorage import SQLiteStorage
+
+
+class BookingManager(BaseManager):
+    """Serves the bookings owner TestDrive to the worker processes."""
+    pass
+
+
+class PreforkServer(object):
+    """
+    Serves the request handler from several worker processes.
+
+    The listening socket is bound and the dataset is loaded in the parent
+    process before the workers are forked, so they all accept connections on
+    the same socket and share the read-only dataset copy-on-write. Bookings
+    are created and cancelled by a single process, which owns the bookings,
+    so every worker sees the same bookings. The workers send those requests
+    to it through a multiprocessing manager.
+
+    Only available on platforms with os.fork(), and not with an in-memory
+    SQLite database, which can't be used by the forked processes.
+
+    IMPORTANT: the request handler must be Server (or a subclass of it).
+    """
+
+    def __init__(self, server_address, RequestHandlerClass, workers,
+                 server_class=HTTPServer):
+        self._workers = workers
+        self._httpd = server_class(server_address, RequestHandlerClass)
+        self._manager = None
+        self._pids = set()
+        self._stopping = False
+
+    @property
+    def server_address(self):
+        return self._httpd.server_address
+
+    def serve_forever(self):
+        if Server.DATABASE_PATH == SQLiteStorage.MEMORY:
+            # the workers would each have a copy of the connection to it
+            raise ValueError('An in-memory database can not be shared by the worker processes')
+
+        # load the dataset once, before forking, so the workers share it
+        Server.load_dataset()
+        self._start_booking_manager(Server.td)
+
+        signal.signal(signal.SIGTERM, self._handle_stop_signal)
+        try:
+            for _ in range(self._workers):
+                self._fork_worker()
+
+            while self._pids:
+                try:
+                    pid, _ = os.wait()
+                except ChildProcessError:
+                    break
+                except InterruptedError:
+                    continue
+                self._pids.discard(pid)
+                if not self._stopping:
+                    # replace the workers that died unexpectedly
+                    self._fork_worker()
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        self._stopping = True
+        for pid in list(self._pids):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                self._pids.discard(pid)
+        for pid in list(self._pids):
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+            self._pids.discard(pid)
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
+
+    def server_close(self):
+        self._httpd.server_close()
+
+    def _start_booking_manager(self, td):
+        BookingManager.register('TestDrive', callable=lambda: td)
+        # the manager process is forked as well, so it owns a copy of the
+        # already loaded dataset
+        self._manager = BookingManager(ctx=multiprocessing.get_context('fork'))
+        self._manager.start()
+
+    def _fork_worker(self):
+        pid = os.fork()
+        if pid:
+            self._pids.add(pid)
+            return
+
+        # worker process
+        exit_code = 0
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            Server.booking_owner = self._manager.TestDrive()
+            self._httpd.serve_forever()
+        except Exception as e:
+            print('[!!!] Worker {} crashed: {}'.format(os.getpid(), str(e)))
+            exit_code = 1
+        finally:
+            sys.stdout.flush()
+            os._exit(exit_code)
+
+    def _handle_stop_signal(self, signum, frame):
+        self._stopping = True
+        raise SystemExit(0)
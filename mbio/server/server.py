@@ -3,12 +3,19 @@ HTTP server that handles the request from the client application.
 """
 import sys
 import json
+import base64
+import hashlib
 import logging
+import threading
 from urllib.parse import urlparse, parse_qs
 from http.server import BaseHTTPRequestHandler
 
 from mbio.server.endpoint import Endpoint
 from mbio.testdrive import TestDrive
+from mbio.storage.sqlitestorage import SQLiteStorage
+from mbio.cache import QueryCache
+from mbio.server.fragments import JSONFragments
+from mbio.utils import normalize_key
 from mbio.server.decorators import handle_expcetions
 from mbio.date.utils import isoformat_to_datetime
 
@@ -20,9 +27,30 @@ logging.basicConfig(level=logging.CRITICAL)
 
 class Server(BaseHTTPRequestHandler):
 
+    # persistent connections: every response has a Content-Length. They're
+    # only kept open by servers which handle connections concurrently (see
+    # _keeps_alive()), the others close them after every response
+    protocol_version = 'HTTP/1.1'
+    # seconds a client may take to send a request
+    timeout = 5
+    # the connection is closed after this many requests
+    MAX_KEEP_ALIVE_REQUESTS = 100
+    # lists with more dealers or vehicles than this are streamed in chunks
+    STREAM_MIN_ITEMS = 100
+    STREAM_CHUNK_SIZE = 64 * 1024
+
     DATASET_PATH = None
+    # the bookings are only kept in memory without a journal
+    JOURNAL_PATH = None
+    # the vehicle indexes and bookings are kept in memory without a database
+    DATABASE_PATH = None
+    # the dataset is parsed from JSON every time, without a binary snapshot
+    SNAPSHOT_PATH = None
+    # called with the bytes read and the size of the dataset while it's parsed
+    PROGRESS = None
     HTTP_OK = 200
     HTTP_OK_CREATED = 201
+    HTTP_NOT_MODIFIED = 304
     HTTP_BAD_REQUEST = 400
 
     METHOD_POST = 'POST'
@@ -37,7 +65,17 @@ class Server(BaseHTTPRequestHandler):
     }
 
 
+    # results of the geo queries, see mbio.cache.QueryCache
+    CACHE_SIZE = 1024
+    CACHE_PRECISION = None
+
     td = None
+    cache = None
+    fragments = None
+    # creates and cancels the bookings instead of td, when they're owned by
+    # another process (see mbio.server.prefork)
+    booking_owner = None
+    _td_lock = threading.Lock()
 
     def __init__(self, *args, **kwargs):
         # NOTE: do all of the setup and then call the super's __init__.
@@ -56,13 +94,56 @@ class Server(BaseHTTPRequestHandler):
             Endpoint.BOOKINGS_CREATE: self.create_booking,
             Endpoint.BOOKINGS_CANCEL: self.cancel_booking,
         }
+        self._handled_requests = 0
+        self._response_etag = None
+        self._if_none_match_any = False
+        self.response_started = False
         self._init_td_if_needed()
         super(Server, self).__init__(*args, **kwargs)
 
+    @classmethod
+    def load_dataset(cls):
+        """Load the dataset, along with an empty cache for it."""
+        Server.cache = QueryCache(Server.CACHE_SIZE, precision=Server.CACHE_PRECISION) \
+            if Server.CACHE_SIZE > 0 else None
+        storage = SQLiteStorage(Server.DATABASE_PATH) if Server.DATABASE_PATH is not None else None
+        Server.td = TestDrive(Server.DATASET_PATH, journal=Server.JOURNAL_PATH, storage=storage,
+                              snapshot=Server.SNAPSHOT_PATH, progress=Server.PROGRESS)
+        Server.fragments = JSONFragments(Server.td.dealers, Server.td.dataset_version)
+
     def _init_td_if_needed(self):
         # propagate exception
         if Server.td is None:
-            Server.td = TestDrive(Server.DATASET_PATH)
+            # the first requests may be handled concurrently, load the dataset once
+            with Server._td_lock:
+                if Server.td is None:
+                    Server.load_dataset()
+
+    def handle_one_request(self):
+        self._response_etag = None
+        self._if_none_match_any = False
+        self.response_started = False
+        super(Server, self).handle_one_request()
+        self._handled_requests += 1
+        if not self.close_connection and self.connection is not None:
+            # wait for the next request for as long as the server allows
+            self.connection.settimeout(self.server.keep_alive_timeout)
+
+    def parse_request(self):
+        # the next request arrived, the rest of it gets the full timeout
+        if self._handled_requests and self.connection is not None:
+            self.connection.settimeout(self.timeout)
+        return super(Server, self).parse_request()
+
+    def send_response(self, code, message=None):
+        # once the response is started, an error can only close the connection
+        self.response_started = True
+        super(Server, self).send_response(code, message)
+
+    def _get_booking_owner(self):
+        if Server.booking_owner is not None:
+            return Server.booking_owner
+        return Server.td
 
     @handle_expcetions
     def do_GET(self):
@@ -76,6 +157,15 @@ class Server(BaseHTTPRequestHandler):
         if not is_valid:
             return
 
+        # the GET endpoints only read the data, so their responses only
+        # change with its version
+        self._response_etag = self._build_etag(query_params)
+        if self._is_not_modified(self._response_etag):
+            self._respond_not_modified(self._response_etag)
+            return
+        # "*" only matches if the query has a result, see _respond_json()
+        self._if_none_match_any = '*' in self._if_none_match_tags()
+
         dispatch_function = self.RES_FUNC.get(endpoint, self.invalid_endpoint_err)
         dispatch_function(query_params)
 
@@ -176,10 +266,39 @@ class Server(BaseHTTPRequestHandler):
         fuel = args.get('fuel', None)
         transmission = args.get('transmission', None)
 
+        limit = args.get('limit', None)
+        cursor = args.get('cursor', None)
+        if limit is not None or cursor is not None:
+            self._get_vehicles_page(limit, cursor, dealer, model, fuel, transmission)
+            return
+
         vehicles = Server.td.get_vehicles_by_attributes(dealer=dealer, model=model, fuel=fuel, transmission=transmission)
 
         ret_json = {'vehicles': vehicles}
-        self._respond_json(ret_json, self.HTTP_OK)
+        self._respond_json(ret_json, self.HTTP_OK, stream=len(vehicles) > Server.STREAM_MIN_ITEMS)
+
+    def _get_vehicles_page(self, limit, cursor, dealer, model, fuel, transmission):
+        try:
+            limit = int(limit) if limit is not None else limit
+        except ValueError:
+            self._respond_API_error(msg='limit must be an integer')
+            return
+        if limit is not None and limit < 1:
+            self._respond_API_error(msg='limit must be positive')
+            return
+
+        try:
+            after = self._decode_cursor(cursor) if cursor is not None else None
+            vehicles, next_after = Server.td.get_vehicles_page(limit, after, dealer=dealer,
+                                        model=model, fuel=fuel, transmission=transmission)
+        except (ValueError, VehicleNotFoundError):
+            self._respond_API_error(msg='{} is not a valid cursor'.format(cursor))
+            return
+
+        ret_json = {'vehicles': vehicles}
+        if limit is not None:
+            ret_json['next_cursor'] = self._encode_cursor(next_after) if next_after is not None else None
+        self._respond_json(ret_json, self.HTTP_OK, stream=len(vehicles) > Server.STREAM_MIN_ITEMS)
 
     @handle_expcetions
     def get_closest_dealers_list(self, args):
@@ -189,6 +308,9 @@ class Server(BaseHTTPRequestHandler):
         latitude = args.get('latitude', None)
         longitude = args.get('longitude', None)
 
+        limit = args.get('limit', None)
+        max_distance = args.get('max_distance_km', None)
+
         latitude = float(latitude) if latitude is not None else latitude
         longitude = float(longitude) if longitude is not None else longitude
 
@@ -196,10 +318,25 @@ class Server(BaseHTTPRequestHandler):
             self._respond_API_error(msg='latitude and longitude parameters are required')
             return
 
-        res = Server.td.get_closest_dealers_with_vehicle(latitude, longitude, model, fuel, transmission)
+        try:
+            limit = int(limit) if limit is not None else limit
+            max_distance = float(max_distance) if max_distance is not None else max_distance
+        except ValueError:
+            self._respond_API_error(msg='limit must be an integer and max_distance_km a number')
+            return
+
+        if (limit is not None and limit < 1) or (max_distance is not None and not max_distance >= 0):
+            self._respond_API_error(msg='limit must be positive and max_distance_km non-negative')
+            return
+
+        latitude, longitude = self._quantize(latitude), self._quantize(longitude)
+        key = (Endpoint.DEALERS_CLOSEST_LIST, latitude, longitude, limit, max_distance) + \
+            self._filters_key(model, fuel, transmission)
+        res = self._cached_query(key, Server.td.get_closest_dealers_with_vehicle, latitude,
+                                 longitude, model, fuel, transmission, limit, max_distance)
 
         res_json = {'dealers': res}
-        self._respond_json(res_json, self.HTTP_OK)
+        self._respond_json(res_json, self.HTTP_OK, stream=len(res) > Server.STREAM_MIN_ITEMS)
 
     @handle_expcetions
     def get_dealers_in_polygon(self, args):
@@ -223,9 +360,15 @@ class Server(BaseHTTPRequestHandler):
         for lat, lon in lat_longitude_list:
             float_lat_lon.append([float(lat), float(lon)])
 
+        # the query runs on the exact vertices, which nearby polygons share the
+        # result of, unless rounding them makes some of them the same
+        vertices = tuple((self._quantize(lat), self._quantize(lon)) for lat, lon in float_lat_lon)
+        if len(set(vertices)) != len(vertices):
+            vertices = tuple(tuple(pair) for pair in float_lat_lon)
+        key = (Endpoint.DEALERS_IN_POLYGON, vertices) + self._filters_key(model, fuel, transmission)
         try:
-            res = Server.td.get_dealers_in_polygon_with_vehicle(float_lat_lon, model,
-                                                            fuel, transmission)
+            res = self._cached_query(key, Server.td.get_dealers_in_polygon_with_vehicle,
+                                     float_lat_lon, model, fuel, transmission)
         except TestDriveError as e:
             err = self._build_error_dict(str(e))
             self._respond_json(err, self.HTTP_BAD_REQUEST)
@@ -249,7 +392,11 @@ class Server(BaseHTTPRequestHandler):
             self._respond_API_error(msg='latitude and longitude parameters are required')
             return
 
-        res = Server.td.get_closest_dealer_with_vehicle(latitude, longitude, model, fuel, transmission)
+        latitude, longitude = self._quantize(latitude), self._quantize(longitude)
+        key = (Endpoint.DEALER_CLOSEST, latitude, longitude) + \
+            self._filters_key(model, fuel, transmission)
+        res = self._cached_query(key, Server.td.get_closest_dealer_with_vehicle, latitude,
+                                 longitude, model, fuel, transmission)
 
         res_json = {'dealer': res}
         self._respond_json(res_json, self.HTTP_OK)
@@ -274,7 +421,7 @@ class Server(BaseHTTPRequestHandler):
             return
 
         try:
-            res = Server.td.create_booking(first_name, last_name, vehicle_id, pickup_date_dt_obj)
+            res = self._get_booking_owner().create_booking(first_name, last_name, vehicle_id, pickup_date_dt_obj)
         except (VehicleNotFoundError, VehicleNotAvailableOnDateError,
                                 VehicleAlreadyBookedError, BookingError) as e:
             err = self._build_error_dict(str(e))
@@ -294,7 +441,7 @@ class Server(BaseHTTPRequestHandler):
             return
 
         try:
-            res = Server.td.cancel_booking(booking_id, reason)
+            res = self._get_booking_owner().cancel_booking(booking_id, reason)
         except (BookingDoesNotExistError, BookingAlreadyCancelledError) as e:
             err_res = self._build_error_dict(str(e))
             self._respond_json(err_res, self.HTTP_BAD_REQUEST)
@@ -304,6 +451,40 @@ class Server(BaseHTTPRequestHandler):
 
 
 
+    def _cached_query(self, key, query, *args):
+        """
+        Run a query, or get its result from the cache.
+
+        The queries must not modify the data and must only depend on their
+        arguments and on the dealers and vehicles (not on the bookings).
+        """
+        cache = Server.cache
+        if cache is None:
+            return query(*args)
+
+        version = Server.td.dataset_version
+        res = cache.get(key, version)
+        if res is QueryCache.MISSING:
+            res = query(*args)
+            cache.put(key, res, version, client=self.client_address[0])
+        return res
+
+    def _quantize(self, value):
+        cache = Server.cache
+        return cache.quantize(value) if cache is not None else value
+
+    def _filters_key(self, *filters):
+        return tuple(normalize_key(value) if value is not None else None for value in filters)
+
+    def _encode_cursor(self, vehicle_id):
+        # the cursor is opaque to the clients
+        return base64.urlsafe_b64encode(vehicle_id.encode()).decode().rstrip('=')
+
+    def _decode_cursor(self, cursor):
+        # raises a ValueError for invalid cursors
+        padding = '=' * (-len(cursor) % 4)
+        return base64.b64decode(cursor + padding, altchars=b'-_', validate=True).decode()
+
     def _respond_API_error(self, msg):
         res_dict = self._build_error_dict(msg)
         self._respond_json(res_dict, self.HTTP_BAD_REQUEST)
@@ -334,16 +515,123 @@ class Server(BaseHTTPRequestHandler):
         lm.delete_key(username, token, key)
         self._send_OK_headers()
 
-    def _respond_json(self, json_dict, code):
-        self._send_response_headers(code)
-        res = json.dumps(json_dict)
-        self.wfile.write(res.encode())
+    def _respond_json(self, json_dict, code, stream=False):
+        if code == self.HTTP_OK and self._if_none_match_any and self._response_etag is not None:
+            self._respond_not_modified(self._response_etag)
+            return
 
-    def _send_response_headers(self, code):
+        if stream:
+            self._stream_json(json_dict, code)
+            return
+
+        res = self._get_fragments().dumps(json_dict)
+        self._send_response_headers(code, len(res))
+        self.wfile.write(res)
+
+    def _stream_json(self, json_dict, code):
+        """
+        Send the response as it's encoded, without holding all of it in memory.
+        """
+        chunked = self.request_version not in ('HTTP/0.9', 'HTTP/1.0')
+        # without chunks, the body ends when the connection is closed
+        self._send_response_headers(code, chunked=chunked, close=not chunked)
+
+        chunk = bytearray()
+        for piece in self._get_fragments().iterdumps(json_dict):
+            chunk += piece
+            if len(chunk) >= self.STREAM_CHUNK_SIZE:
+                self._write_chunk(chunk, chunked)
+                chunk = bytearray()
+        if chunk:
+            self._write_chunk(chunk, chunked)
+        if chunked:
+            self.wfile.write(b'0\r\n\r\n')
+
+    def _write_chunk(self, chunk, chunked):
+        if chunked:
+            self.wfile.write('{:x}\r\n'.format(len(chunk)).encode() + chunk + b'\r\n')
+        else:
+            self.wfile.write(chunk)
+
+    def _get_fragments(self):
+        td = Server.td
+        if td is None:
+            # everything is encoded on demand
+            return JSONFragments([])
+
+        fragments = Server.fragments
+        if fragments is None or fragments.version != td.dataset_version:
+            # the dataset was changed, encode the new dealers and vehicles
+            with Server._td_lock:
+                if Server.fragments is None or Server.fragments.version != td.dataset_version:
+                    Server.fragments = JSONFragments(td.dealers, td.dataset_version)
+                fragments = Server.fragments
+        return fragments
+
+    def _send_response_headers(self, code, content_length=None, chunked=False, close=False):
         self.send_response(code)
         self.send_header('Content-Type', 'application/json')
+        if content_length is not None:
+            self.send_header('Content-Length', str(content_length))
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        if code == self.HTTP_OK and self._response_etag is not None:
+            self.send_header('ETag', self._response_etag)
+        self._end_headers(close)
+
+    def _respond_not_modified(self, etag):
+        self.send_response(self.HTTP_NOT_MODIFIED)
+        self.send_header('ETag', etag)
+        self._end_headers()
+
+    def _keeps_alive(self):
+        """
+        Whether the connection can be kept open after this response.
+
+        An idle connection holds the thread (or the whole server, if it's
+        single-threaded) which handles it, so only servers with a
+        keep_alive_timeout keep connections open, and only while no other
+        connection is waiting for a thread.
+        """
+        server = getattr(self, 'server', None)
+        if getattr(server, 'keep_alive_timeout', None) is None:
+            return False
+        return not getattr(server, 'has_waiting_connections', False)
+
+    def _end_headers(self, close=False):
+        # close_connection is already set if the client asked for it
+        if close or self.close_connection or not self._keeps_alive() or \
+                self._handled_requests + 1 >= self.MAX_KEEP_ALIVE_REQUESTS:
+            # also sets close_connection
+            self.send_header('Connection', 'close')
+        elif self.request_version == 'HTTP/1.0':
+            # HTTP/1.0 connections are only kept open if both ends say so
+            self.send_header('Connection', 'keep-alive')
         self.end_headers()
 
+    def _build_etag(self, query_params):
+        # built before the query runs, so a response is never tagged with a
+        # version newer than the data it was computed from
+        query = json.dumps(sorted(query_params.items())).encode()
+        return '"{}-{}-{}"'.format(Server.td.instance_id, Server.td.version,
+                                   hashlib.sha1(query).hexdigest())
+
+    def _is_not_modified(self, etag):
+        return etag in self._if_none_match_tags()
+
+    def _if_none_match_tags(self):
+        if_none_match = self.headers.get('If-None-Match', None)
+        if if_none_match is None:
+            return []
+
+        tags = []
+        for tag in if_none_match.split(','):
+            tag = tag.strip()
+            if tag.startswith('W/'):
+                tag = tag[2:]
+            tags.append(tag)
+        return tags
+
     def _parse_auth(self, args):
         return (args['username'], args['token'].encode())
 
@@ -0,0 +1,338 @@
+"""Binary snapshot of the loaded dataset."""
+import os
+import mmap
+import struct
+import hashlib
+from itertools import islice
+
+from mbio.models import Availability, Vehicle, Dealer, Booking
+
+
+class _Unsupported(Exception):
+    """The dataset has values which the snapshot can't represent."""
+
+
+class DatasetSnapshot(object):
+    """
+    Binary image of a dataset, which loads much faster than its JSON file.
+
+    The snapshot is a header followed by sections of fixed-width,
+    little-endian records: a string table (the offsets of the strings and
+    their UTF-8 text), the distinct availabilities, the dealers (with their
+    coordinates as doubles), the closed days of the dealers, the vehicles
+    and the bookings. Every string of the dataset is stored once, and the
+    records refer to it by its position in the table.
+
+    The header has the format version of the snapshot, and the size,
+    modification time and SHA-256 checksum of the JSON file it was made
+    from. Loading a snapshot maps it in memory, checks its header and
+    decodes the sections, which doesn't need any JSON parsing. The snapshot
+    is stale when its JSON file changed: if the size and modification time
+    are the same it isn't read again, otherwise its checksum is compared.
+
+    Datasets which don't have the layout of the snapshot (other keys,
+    other types of values) can't be written, and stay loaded from JSON.
+    """
+
+    MAGIC = b'MBIOSNAP'
+    # changes whenever the layout changes, older snapshots are then rebuilt
+    VERSION = 1
+
+    # magic, version, JSON size, JSON mtime (ns), JSON SHA-256, snapshot size
+    HEADER = struct.Struct('<8sIQq32sQ')
+    # offset, size (bytes)
+    SECTION = struct.Struct('<QQ')
+    SECTIONS = ('string_offsets', 'strings', 'availability_offsets', 'availabilities',
+                'dealers', 'closed', 'vehicles', 'bookings')
+
+    OFFSET = struct.Struct('<Q')
+    INDEX = struct.Struct('<I')
+    # id, name, latitude, longitude, number of closed days, number of vehicles
+    DEALER = struct.Struct('<IIddII')
+    # id, model, fuel, transmission, availability
+    VEHICLE = struct.Struct('<IIIII')
+    # mask of the present fields, then each of the fields (0 if not present)
+    BOOKING = struct.Struct('<I{}I'.format(len(Booking.__slots__)))
+
+    DEALER_KEYS = Dealer.__slots__
+    VEHICLE_KEYS = Vehicle.__slots__
+    BOOKING_KEYS = Booking.__slots__
+
+    HASH_CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, path, source_path):
+        self._path = path
+        self._source_path = source_path
+
+    @property
+    def path(self):
+        return self._path
+
+    def load(self):
+        """
+        Returns the dataset in the snapshot.
+
+        Returns None if there's no snapshot, if it's stale, of another
+        version, or damaged: it must be rebuilt from the JSON file.
+        """
+        try:
+            with open(self._path, 'rb') as f, \
+                    mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if not self._is_current(mm):
+                    return None
+                with memoryview(mm) as view:
+                    return _Decoder(self, view).decode()
+        except (OSError, ValueError, IndexError, BufferError, struct.error):
+            # mmap() raises ValueError for empty files
+            return None
+
+    def write(self, dataset):
+        """
+        Writes a snapshot of the dataset, which must be the one of the JSON file.
+
+        The snapshot replaces the previous one atomically. Returns False if
+        the dataset can't be represented in a snapshot, raises OSError if it
+        can't be written.
+        """
+        try:
+            sections = _Encoder(self).encode(dataset)
+        except _Unsupported:
+            return False
+
+        stat = os.stat(self._source_path)
+        digest = self._source_digest()
+        offset = self.HEADER.size + self.SECTION.size * len(self.SECTIONS)
+        table = []
+        for section in sections:
+            table.append(self.SECTION.pack(offset, len(section)))
+            offset += len(section)
+        header = self.HEADER.pack(self.MAGIC, self.VERSION, stat.st_size, stat.st_mtime_ns,
+                                  digest, offset)
+
+        # a crash while writing leaves the old snapshot, or a temporary file: the
+        # new one is on disk before it replaces it
+        tmp_path = self._path + '.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(header)
+                f.writelines(table)
+                f.writelines(sections)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self._path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        return True
+
+    def _is_current(self, mm):
+        if len(mm) < self.HEADER.size:
+            return False
+        magic, version, size, mtime, digest, snapshot_size = self.HEADER.unpack_from(mm)
+        if magic != self.MAGIC or version != self.VERSION or snapshot_size != len(mm):
+            return False
+
+        stat = os.stat(self._source_path)
+        if stat.st_size != size:
+            return False
+        return stat.st_mtime_ns == mtime or self._source_digest() == digest
+
+    def _source_digest(self):
+        sha256 = hashlib.sha256()
+        with open(self._source_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(self.HASH_CHUNK_SIZE), b''):
+                sha256.update(chunk)
+        return sha256.digest()
+
+
+class _Encoder(object):
+
+    def __init__(self, snapshot):
+        self._snapshot = snapshot
+        # string: position in the table
+        self._strings = {}
+        # (day, times) pairs: position of the availability
+        self._availabilities = {}
+        self._availability_items = []
+        self._availability_offsets = [0]
+
+    def encode(self, dataset):
+        """Returns the sections of the snapshot, in order, as bytes."""
+        s = self._snapshot
+        if set(dataset) != {'dealers', 'bookings'}:
+            raise _Unsupported()
+
+        dealers = []
+        closed = []
+        vehicles = []
+        for dealer in self._list(dataset['dealers']):
+            self._check_keys(dealer, s.DEALER_KEYS)
+            latitude, longitude = dealer['latitude'], dealer['longitude']
+            if type(latitude) is not float or type(longitude) is not float:
+                raise _Unsupported()
+            closed_days = self._list(dealer['closed'])
+            dealer_vehicles = self._list(dealer['vehicles'])
+            dealers.append(s.DEALER.pack(self._string(dealer['id']), self._string(dealer['name']),
+                                         latitude, longitude, len(closed_days),
+                                         len(dealer_vehicles)))
+            closed.extend(s.INDEX.pack(self._string(day)) for day in closed_days)
+
+            for vehicle in dealer_vehicles:
+                self._check_keys(vehicle, s.VEHICLE_KEYS)
+                vehicles.append(s.VEHICLE.pack(
+                    self._string(vehicle['id']), self._string(vehicle['model']),
+                    self._string(vehicle['fuel']), self._string(vehicle['transmission']),
+                    self._availability(vehicle['availability'])))
+
+        bookings = [self._booking(booking) for booking in self._list(dataset['bookings'])]
+
+        strings = list(self._strings)
+        try:
+            text = ''.join(strings).encode('utf-8')
+        except UnicodeEncodeError:
+            # lone surrogates, which JSON allows
+            raise _Unsupported()
+        string_offsets = [0]
+        for string in strings:
+            string_offsets.append(string_offsets[-1] + len(string))
+
+        return [
+            b''.join(s.OFFSET.pack(offset) for offset in string_offsets),
+            text,
+            b''.join(s.OFFSET.pack(offset) for offset in self._availability_offsets),
+            b''.join(s.INDEX.pack(item) for item in self._availability_items),
+            b''.join(dealers),
+            b''.join(closed),
+            b''.join(vehicles),
+            b''.join(bookings),
+        ]
+
+    def _booking(self, booking):
+        # the fields are in the order of Booking's, and some can be missing
+        keys = self._snapshot.BOOKING_KEYS
+        if not isinstance(booking, (dict, Booking)) or \
+                tuple(key for key in keys if key in booking) != tuple(booking):
+            raise _Unsupported()
+        mask = 0
+        fields = []
+        for i, key in enumerate(keys):
+            if key in booking:
+                mask |= 1 << i
+                fields.append(self._string(booking[key]))
+            else:
+                fields.append(0)
+        return self._snapshot.BOOKING.pack(mask, *fields)
+
+    def _availability(self, availability):
+        if not isinstance(availability, (dict, Availability)):
+            raise _Unsupported()
+        # an Availability has tuples of times, a dict lists
+        key = tuple((day, times if type(times) is tuple else tuple(self._list(times)))
+                    for day, times in availability.items())
+        pos = self._availabilities.get(key)
+        if pos is None:
+            pos = self._availabilities[key] = len(self._availabilities)
+            items = self._availability_items
+            for day, times in key:
+                items.append(self._string(day))
+                items.append(len(times))
+                items.extend(self._string(time) for time in times)
+            self._availability_offsets.append(len(items))
+        return pos
+
+    def _string(self, value):
+        if type(value) is not str:
+            raise _Unsupported()
+        pos = self._strings.get(value)
+        if pos is None:
+            pos = self._strings[value] = len(self._strings)
+        return pos
+
+    def _list(self, value):
+        if type(value) is not list:
+            raise _Unsupported()
+        return value
+
+    def _check_keys(self, record, keys):
+        if not isinstance(record, (dict, Dealer, Vehicle)) or tuple(record) != keys:
+            raise _Unsupported()
+
+
+class _Decoder(object):
+
+    def __init__(self, snapshot, view):
+        self._snapshot = snapshot
+        self._view = view
+        self._sections = {}
+        offset = snapshot.HEADER.size
+        for name in snapshot.SECTIONS:
+            start, size = snapshot.SECTION.unpack_from(view, offset)
+            if start + size > len(view):
+                raise ValueError('Section {} out of the snapshot'.format(name))
+            self._sections[name] = (start, size)
+            offset += snapshot.SECTION.size
+
+    def decode(self):
+        s = self._snapshot
+        offsets = self._unpack('string_offsets', 'Q')
+        text = str(self._section('strings'), 'utf-8')
+        strings = [text[start:end] for start, end in zip(offsets, islice(offsets, 1, None))]
+        availabilities = self._availabilities(strings)
+
+        closed = iter(self._unpack('closed', 'I'))
+        vehicles = s.VEHICLE.iter_unpack(self._section('vehicles'))
+        dealers = []
+        for id_, name, latitude, longitude, closed_count, vehicle_count in \
+                s.DEALER.iter_unpack(self._section('dealers')):
+            dealer_vehicles = [
+                Vehicle.from_fields(s.VEHICLE_KEYS, (
+                    strings[vehicle_id], strings[model], strings[fuel], strings[transmission],
+                    availabilities[availability]))
+                for vehicle_id, model, fuel, transmission, availability
+                in islice(vehicles, vehicle_count)]
+            if len(dealer_vehicles) != vehicle_count:
+                raise ValueError('Missing vehicles')
+            closed_days = [strings[day] for day in islice(closed, closed_count)]
+            dealers.append(Dealer.from_fields(s.DEALER_KEYS, (
+                strings[id_], strings[name], latitude, longitude, closed_days, dealer_vehicles)))
+
+        # mask: (keys, their positions in the record)
+        shapes = {}
+        bookings = []
+        for row in s.BOOKING.iter_unpack(self._section('bookings')):
+            shape = shapes.get(row[0])
+            if shape is None:
+                positions = [i for i in range(len(s.BOOKING_KEYS)) if row[0] & (1 << i)]
+                shape = shapes[row[0]] = ([s.BOOKING_KEYS[i] for i in positions],
+                                          [i + 1 for i in positions])
+            keys, positions = shape
+            bookings.append(Booking.from_fields(keys, [strings[row[i]] for i in positions]))
+
+        return {'dealers': dealers, 'bookings': bookings}
+
+    def _availabilities(self, strings):
+        offsets = self._unpack('availability_offsets', 'Q')
+        items = self._unpack('availabilities', 'I')
+        availabilities = []
+        for start, end in zip(offsets, islice(offsets, 1, None)):
+            days = {}
+            pos = start
+            while pos < end:
+                count = items[pos + 1]
+                days[strings[items[pos]]] = [strings[time] for time in
+                                             items[pos + 2:pos + 2 + count]]
+                pos += 2 + count
+            availabilities.append(Availability.of(days))
+        return availabilities
+
+    def _section(self, name):
+        start, size = self._sections[name]
+        return self._view[start:start + size]
+
+    def _unpack(self, name, code):
+        start, size = self._sections[name]
+        count = size // struct.calcsize(code)
+        return struct.unpack_from('<{}{}'.format(count, code), self._view, start)
@@ -0,0 +1,65 @@
+"""In-memory storage, the default one."""
+import json
+from mbio.index import VehicleIndex, BookingIndex
+from mbio.storage.storage import Storage
+from mbio.models import to_json
+
+
+class MemoryStorage(Storage):
+    """
+    Keeps the bookings in a list, with a VehicleIndex and a BookingIndex over the dataset.
+
+    The bookings are the list of the dataset itself, and get_booking()
+    returns the booking in it, so the bookings can be modified in place.
+    """
+
+    def __init__(self):
+        self._vehicle_index = VehicleIndex()
+        self._booking_index = BookingIndex()
+        self._bookings = []
+
+    def load(self, dealers, bookings):
+        self._vehicle_index = VehicleIndex(dealers)
+        self._booking_index = BookingIndex(bookings)
+        self._bookings = bookings
+
+    @property
+    def bookings(self):
+        return self._bookings
+
+    def encoded_bookings(self):
+        return [json.dumps(booking, default=to_json) for booking in self._bookings]
+
+    def lookup(self, dealer=None, model=None, fuel=None, transmission=None):
+        return self._vehicle_index.lookup(dealer=dealer, model=model, fuel=fuel,
+                                          transmission=transmission)
+
+    def lookup_page(self, limit, after=None, dealer=None, model=None, fuel=None,
+                    transmission=None):
+        return self._vehicle_index.lookup_page(limit, after=after, dealer=dealer, model=model,
+                                               fuel=fuel, transmission=transmission)
+
+    def get_vehicle(self, vehicle_id):
+        return self._vehicle_index.get_by_id(vehicle_id)
+
+    def keys_of(self, vehicle):
+        return self._vehicle_index.keys_of(vehicle)
+
+    def availability_of(self, vehicle):
+        return self._vehicle_index.availability_of(vehicle)
+
+    def dealer_keys(self, dealer):
+        return self._vehicle_index.dealer_keys(dealer)
+
+    def get_booking(self, booking_id):
+        return self._booking_index.get(booking_id)
+
+    def is_booked(self, vehicle_id, pickup_date):
+        return self._booking_index.ledger.is_booked(vehicle_id, pickup_date)
+
+    def add_booking(self, booking, pickup_date):
+        self._bookings.append(booking)
+        self._booking_index.add(booking, pickup_date)
+
+    def cancel_booking(self, booking):
+        self._booking_index.cancel(booking)
@@ -0,0 +1,296 @@
+"""SQLite storage."""
+import os
+import json
+import sqlite3
+import threading
+from mbio.utils import normalize_key
+from mbio.index import vehicle_keys
+from mbio.storage.storage import Storage
+from mbio.date.utils import isoformat_to_datetime
+from mbio.models import Booking, to_json, weekly_availability
+from mbio.exceptions import InvalidDataSetError, VehicleAlreadyBookedError
+
+
+class SQLiteStorage(Storage):
+    """
+    Keeps the vehicle indexes and the bookings in a SQLite database.
+
+    The vehicles are looked up by their normalized attributes, dealer and id
+    with indexed queries, and the vehicle records of the dataset are
+    returned. The normalized keys and the compiled WeeklyAvailability of
+    every vehicle are kept next to it, as VehicleIndex does, since the geo
+    queries need them for every dealer they visit. The bookings are only
+    kept in the database (as JSON), indexed by id and by (vehicle, pickup
+    date), so get_booking() and bookings return copies of them.
+
+    A unique index on the vehicle and pickup date of the active bookings
+    guarantees that a vehicle is never booked twice for the same date. Older
+    datasets can have such double bookings already, they are loaded as they
+    are and marked as duplicates, which the unique index skips.
+
+    The database is rebuilt every time the dataset is loaded, so it doesn't
+    need to survive a crash (see BookingJournal for that), and it's only
+    written in memory by default. A forked process opens its own connection
+    to a database file, but can't use an in-memory database.
+    """
+
+    MEMORY = ':memory:'
+
+    SCHEMA = '''
+        DROP TABLE IF EXISTS dealers;
+        DROP TABLE IF EXISTS vehicles;
+        DROP TABLE IF EXISTS bookings;
+
+        CREATE TABLE dealers (pos INTEGER PRIMARY KEY, id TEXT NOT NULL);
+        CREATE INDEX dealers_id ON dealers (id);
+
+        CREATE TABLE vehicles (
+            pos INTEGER PRIMARY KEY,
+            id TEXT NOT NULL UNIQUE,
+            dealer_pos INTEGER NOT NULL,
+            model TEXT NOT NULL,
+            fuel TEXT NOT NULL,
+            transmission TEXT NOT NULL
+        );
+        CREATE INDEX vehicles_dealer ON vehicles (dealer_pos);
+        CREATE INDEX vehicles_model ON vehicles (model);
+        CREATE INDEX vehicles_fuel ON vehicles (fuel);
+        CREATE INDEX vehicles_transmission ON vehicles (transmission);
+
+        CREATE TABLE bookings (
+            pos INTEGER PRIMARY KEY,
+            id TEXT NOT NULL,
+            vehicle_id TEXT NOT NULL,
+            pickup TEXT NOT NULL,
+            active INTEGER NOT NULL,
+            duplicate INTEGER NOT NULL DEFAULT 0,
+            booking TEXT NOT NULL
+        );
+        CREATE INDEX bookings_id ON bookings (id);
+        CREATE INDEX bookings_pickup ON bookings (vehicle_id, pickup);
+        CREATE UNIQUE INDEX bookings_slot ON bookings (vehicle_id, pickup)
+            WHERE active AND NOT duplicate;
+    '''
+
+    def __init__(self, path=MEMORY):
+        self._path = path
+        # the connection is shared by the threads, one query at a time
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+        self._dealers = []
+        self._vehicles = []
+        self._keys = []
+        self._availabilities = []
+        # id(vehicle): position of the vehicle
+        self._positions = {}
+        # id(dealer): position of the dealer
+        self._dealer_positions = {}
+        # (start, end) positions of the vehicles of each dealer
+        self._dealer_ranges = []
+
+    @property
+    def path(self):
+        return self._path
+
+    def load(self, dealers, bookings):
+        dealers = list(dealers)
+        vehicles = []
+        vehicle_keys_list = []
+        availabilities = []
+        dealer_positions = {}
+        dealer_ranges = []
+        with self._lock:
+            connection = self._connect()
+            connection.executescript(self.SCHEMA)
+            connection.execute('BEGIN')
+            try:
+                for dealer_pos, dealer in enumerate(dealers):
+                    dealer_positions[id(dealer)] = dealer_pos
+                    connection.execute('INSERT INTO dealers VALUES (?, ?)',
+                                       (dealer_pos, normalize_key(dealer['id'])))
+                    start = len(vehicles)
+                    for vehicle in dealer['vehicles']:
+                        keys, availability = self._insert_vehicle(connection, len(vehicles),
+                                                                  vehicle, dealer_pos)
+                        vehicles.append(vehicle)
+                        vehicle_keys_list.append(keys)
+                        availabilities.append(availability)
+                    dealer_ranges.append((start, len(vehicles)))
+                self._insert_bookings(connection, bookings)
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+            connection.execute('COMMIT')
+
+        self._dealers = dealers
+        self._vehicles = vehicles
+        self._keys = vehicle_keys_list
+        self._availabilities = availabilities
+        self._positions = {id(vehicle): pos for pos, vehicle in enumerate(vehicles)}
+        self._dealer_positions = dealer_positions
+        self._dealer_ranges = dealer_ranges
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    @property
+    def bookings(self):
+        return [Booking(json.loads(booking)) for booking in self.encoded_bookings()]
+
+    def encoded_bookings(self):
+        # the JSON is stored as it is written out, it's not decoded
+        return [booking for booking, in self._query('SELECT booking FROM bookings ORDER BY pos')]
+
+    def lookup(self, dealer=None, model=None, fuel=None, transmission=None):
+        where, params = self._where(dealer, model, fuel, transmission)
+        rows = self._query('SELECT pos FROM vehicles WHERE {} ORDER BY pos'.format(where), params)
+        return [self._vehicles[pos] for pos, in rows]
+
+    def lookup_page(self, limit, after=None, dealer=None, model=None, fuel=None,
+                    transmission=None):
+        where, params = self._where(dealer, model, fuel, transmission)
+        if after is not None:
+            rows = self._query('SELECT pos FROM vehicles WHERE id = ?', (normalize_key(after),))
+            if not rows:
+                raise KeyError(after)
+            where += ' AND pos > ?'
+            params.append(rows[0][0])
+
+        # one more, to know if there are more vehicles after the page
+        params.append(-1 if limit is None else limit + 1)
+        rows = self._query('SELECT pos FROM vehicles WHERE {} ORDER BY pos LIMIT ?'.format(where),
+                           params)
+        res = [self._vehicles[pos] for pos, in rows]
+        if limit is not None and len(res) > limit:
+            return res[:limit], True
+        return res, False
+
+    def get_vehicle(self, vehicle_id):
+        rows = self._query('SELECT pos, dealer_pos FROM vehicles WHERE id = ?',
+                           (normalize_key(vehicle_id),))
+        if not rows:
+            return None
+        pos, dealer_pos = rows[0]
+        return self._vehicles[pos], self._dealers[dealer_pos]
+
+    def keys_of(self, vehicle):
+        pos = self._positions.get(id(vehicle))
+        if pos is not None and self._vehicles[pos] is vehicle:
+            return self._keys[pos]
+        return vehicle_keys(vehicle)
+
+    def availability_of(self, vehicle):
+        pos = self._positions.get(id(vehicle))
+        if pos is not None and self._vehicles[pos] is vehicle:
+            return self._availabilities[pos]
+        return weekly_availability(vehicle['availability'])
+
+    def dealer_keys(self, dealer):
+        dealer_pos = self._dealer_positions.get(id(dealer))
+        if dealer_pos is None or self._dealers[dealer_pos] is not dealer:
+            return [vehicle_keys(vehicle) for vehicle in dealer['vehicles']]
+        start, end = self._dealer_ranges[dealer_pos]
+        return self._keys[start:end]
+
+    def get_booking(self, booking_id):
+        # the first booking with a given id wins, as it does in memory
+        rows = self._query('SELECT booking FROM bookings WHERE id = ? ORDER BY pos LIMIT 1',
+                           (normalize_key(booking_id),))
+        return Booking(json.loads(rows[0][0])) if rows else None
+
+    def is_booked(self, vehicle_id, pickup_date):
+        rows = self._query('SELECT 1 FROM bookings WHERE vehicle_id = ? AND pickup = ? '
+                           'AND active LIMIT 1', (normalize_key(vehicle_id), pickup_date.isoformat()))
+        return bool(rows)
+
+    def add_booking(self, booking, pickup_date):
+        try:
+            self._query('INSERT INTO bookings (id, vehicle_id, pickup, active, booking) '
+                        'VALUES (?, ?, ?, ?, ?)',
+                        (normalize_key(booking['id']), normalize_key(booking['vehicleId']),
+                         pickup_date.isoformat(), 'cancelledAt' not in booking,
+                         json.dumps(booking, default=to_json)))
+        except sqlite3.IntegrityError:
+            msg = 'Booking for {} already exists'.format(pickup_date.isoformat())
+            raise VehicleAlreadyBookedError(msg)
+
+    def cancel_booking(self, booking):
+        self._query('UPDATE bookings SET active = 0, booking = ? WHERE pos = '
+                    '(SELECT min(pos) FROM bookings WHERE id = ?)',
+                    (json.dumps(booking, default=to_json), normalize_key(booking['id'])))
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._connect().execute(sql, params).fetchall()
+
+    def _connect(self):
+        # a connection must not be used by a forked process, and an in-memory
+        # database only exists in the connection, so it can't be opened again
+        if self._connection is not None and self._pid != os.getpid():
+            self._connection = None
+            if self._path == self.MEMORY:
+                raise sqlite3.ProgrammingError('An in-memory database can not be used '
+                                               'by a forked process')
+        if self._connection is None:
+            self._connection = sqlite3.connect(self._path, isolation_level=None,
+                                               check_same_thread=False)
+            # rebuilt on every load, it doesn't need a rollback journal or fsyncs
+            self._connection.execute('PRAGMA journal_mode = OFF')
+            self._connection.execute('PRAGMA synchronous = OFF')
+            self._pid = os.getpid()
+        return self._connection
+
+    def _where(self, dealer, model, fuel, transmission):
+        clauses = ['1']
+        params = []
+        if dealer is not None:
+            # the first dealer with a given id wins, as it does in memory
+            clauses.append('dealer_pos = (SELECT min(pos) FROM dealers WHERE id = ?)')
+            params.append(normalize_key(dealer))
+        for attribute, value in (('model', model), ('fuel', fuel), ('transmission', transmission)):
+            if value is not None:
+                clauses.append('{} = ?'.format(attribute))
+                params.append(normalize_key(value))
+        return ' AND '.join(clauses), params
+
+    def _insert_vehicle(self, connection, pos, vehicle, dealer_pos):
+        """Insert a vehicle, and return its VehicleKeys and WeeklyAvailability."""
+        keys = vehicle_keys(vehicle)
+        try:
+            availability = weekly_availability(vehicle['availability'])
+        except (KeyError, ValueError):
+            msg = 'Vehicle {} has an invalid availability.'.format(vehicle['id'])
+            raise InvalidDataSetError(msg)
+        try:
+            connection.execute('INSERT INTO vehicles VALUES (?, ?, ?, ?, ?, ?)',
+                               (pos, keys.id, dealer_pos, keys.model, keys.fuel, keys.transmission))
+        except sqlite3.IntegrityError:
+            msg = 'More than one vehicles with the same id: {}'.format(vehicle['id'])
+            raise InvalidDataSetError(msg)
+        return keys, availability
+
+    def _insert_bookings(self, connection, bookings):
+        booked = set()
+        booking_ids = set()
+        for booking in bookings:
+            try:
+                pickup = isoformat_to_datetime(booking['pickupDate']).isoformat()
+            except ValueError:
+                msg = 'Booking {} has an invalid pickup date.'.format(booking['id'])
+                raise InvalidDataSetError(msg)
+            vehicle_id = normalize_key(booking['vehicleId'])
+            booking_id = normalize_key(booking['id'])
+            # only the first booking with an id can be cancelled, so only it takes up its slot
+            active = 'cancelledAt' not in booking and booking_id not in booking_ids
+            booking_ids.add(booking_id)
+            duplicate = active and (vehicle_id, pickup) in booked
+            if active:
+                booked.add((vehicle_id, pickup))
+            connection.execute('INSERT INTO bookings (id, vehicle_id, pickup, active, duplicate, '
+                               'booking) VALUES (?, ?, ?, ?, ?, ?)',
+                               (booking_id, vehicle_id, pickup, active, duplicate,
+                                json.dumps(booking, default=to_json)))
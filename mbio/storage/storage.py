@@ -0,0 +1,86 @@
+"""Storage interface of the TestDrive."""
+
+
+class Storage(object):
+    """
+    Keeps the indexes of the vehicles and the bookings of a TestDrive.
+
+    load() is called with the dealers and bookings of the dataset every time
+    it's (re)loaded. The dealers and their vehicles stay in memory, owned by
+    the TestDrive, while the bookings are owned by the storage from then on.
+
+    The TestDrive calls the queries while holding its read lock, and the
+    other methods while holding its write lock. The vehicle ids, dealer ids
+    and attribute values are compared ignoring letter case.
+    """
+
+    def load(self, dealers, bookings):
+        """Index the dealers and their vehicles, and replace the bookings."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    @property
+    def bookings(self):
+        """All of the bookings, in the order they were added."""
+        raise NotImplementedError
+
+    def encoded_bookings(self):
+        """
+        The JSON of all of the bookings, in the order they were added.
+
+        It doesn't change with the bookings, so it can be written out
+        without holding the lock.
+        """
+        raise NotImplementedError
+
+    def lookup(self, dealer=None, model=None, fuel=None, transmission=None):
+        """
+        Return the vehicles matching all of the provided attributes, in dataset order.
+
+        Attributes set to None are not used for filtering.
+        """
+        raise NotImplementedError
+
+    def lookup_page(self, limit, after=None, dealer=None, model=None, fuel=None,
+                    transmission=None):
+        """
+        Same as lookup(), for at most limit vehicles after the one with the id after.
+
+        Also returns whether more vehicles match after the page. A KeyError
+        is raised if there is no vehicle with the id after.
+        """
+        raise NotImplementedError
+
+    def get_vehicle(self, vehicle_id):
+        """Return a (vehicle, dealer) pair for the vehicle with the id, or None."""
+        raise NotImplementedError
+
+    def keys_of(self, vehicle):
+        """Return the VehicleKeys of a vehicle."""
+        raise NotImplementedError
+
+    def availability_of(self, vehicle):
+        """Return the WeeklyAvailability of a vehicle."""
+        raise NotImplementedError
+
+    def dealer_keys(self, dealer):
+        """Return the VehicleKeys of all of the vehicles of a dealer."""
+        raise NotImplementedError
+
+    def get_booking(self, booking_id):
+        """Return the booking with the id, or None."""
+        raise NotImplementedError
+
+    def is_booked(self, vehicle_id, pickup_date):
+        """Check if the vehicle has an active booking for the pickup datetime."""
+        raise NotImplementedError
+
+    def add_booking(self, booking, pickup_date):
+        """Add a new booking, for the pickup datetime."""
+        raise NotImplementedError
+
+    def cancel_booking(self, booking):
+        """Save a booking which has just been cancelled."""
+        raise NotImplementedError
@@ -1,116 +1,369 @@
 """Code that loads the dataset and handles queries on it."""
-import json
+import os
 import uuid
 import datetime
+import threading
 from collections import defaultdict, OrderedDict
-from mbio.utils import is_str_equal_ignore_case
+from mbio.utils import normalize_key
+from mbio.lock import ReadWriteLock, read_locked, write_locked
+from mbio.journal import BookingJournal
+from mbio.loader import DatasetLoader
+from mbio.snapshot import DatasetSnapshot
+from mbio.models import Booking, dealer_from_json, booking_from_json
+from mbio.storage.memorystorage import MemoryStorage
 from mbio.geo.coordinate import Coordinate
+from mbio.geo.coordinatearray import CoordinateArray
+from mbio.geo.spatialindex import SpatialIndex
+from mbio.geo.polygon import Polygon
 from mbio.date.bookingdate import BookingDate, BookingResponse
-from mbio.exceptions import (InvalidDataSetError,  VehicleNotFoundError,
+from mbio.exceptions import (VehicleNotFoundError,
                     VehicleAlreadyBookedError, VehicleNotAvailableOnDateError,
                     BookingError, BookingDoesNotExistError, BookingAlreadyCancelledError,
-                    DatasetNotFoundError, TestDriveError)
+                    TestDriveError, JournalError)
 from mbio.geo.exceptions import NotAPolygonError
 
 class TestDrive(object):
-
-    def __init__(self, dataset):
+    """
+    The TestDrive app: queries on the dataset and bookings.
+
+    It's safe to use from many threads: queries run in parallel, while
+    creating and cancelling bookings is atomic, so the same vehicle can't be
+    booked twice for the same date.
+
+    If a journal path is provided, the bookings made and cancelled are
+    written to that journal (see BookingJournal), and the ones already in it
+    are replayed on top of the dataset when it's loaded, so they survive a
+    restart. Bookings are only returned once they're durable. Once the
+    journal fails to write a record, no bookings are made or cancelled
+    anymore (they raise JournalError): the change of that record was already
+    made in memory, but it's lost on a restart.
+
+    The vehicle indexes and the bookings are kept by a Storage, a
+    MemoryStorage unless another one is provided.
+
+    The dataset is loaded by a DatasetLoader, which calls progress, if
+    provided, with the number of bytes read and the size of the dataset. If
+    a snapshot path is provided, the dataset is loaded from that
+    DatasetSnapshot instead, unless the dataset changed since it was
+    written, in which case it's written again.
+    """
+
+    DEFAULT_STORAGE = MemoryStorage
+
+    def __init__(self, dataset, journal=None, compact_every=BookingJournal.COMPACT_EVERY,
+                 storage=None, progress=None, snapshot=None):
+        self._lock = ReadWriteLock()
+        self._progress = progress
+        self._snapshot = DatasetSnapshot(snapshot, dataset) if snapshot is not None else None
+        self._storage = storage if storage is not None else self.DEFAULT_STORAGE()
+        self._version = 0
+        self._dataset_version = 0
+        # tells the versions of different TestDrive instances apart
+        self._instance_id = os.urandom(8).hex()
         self._dataset_path = dataset
-        self._dataset = self._load_dataset(self._dataset_path)
+        self._journal = None
+        # compacts the journal in the background, see _wait_until_durable()
+        self._compaction = None
+        self._compaction_lock = threading.Lock()
+        data = self._load_dataset(self._dataset_path)
+        if journal is not None:
+            self._journal = BookingJournal(journal, compact_every)
+            self._replay_journal(data)
+        self._dataset = data
+
+    @property
+    def _dataset(self):
+        # the bookings are owned by the storage
+        return dict(self._data, bookings=self._storage.bookings)
+
+    @_dataset.setter
+    def _dataset(self, dataset):
+        # (re)build the indexes whenever the dataset is replaced
+        with self._lock.write_locked():
+            self._data = {key: value for key, value in dataset.items() if key != 'bookings'}
+            self._storage.load(self._data['dealers'], dataset['bookings'])
+            self._reindex()
+
+    @write_locked
+    def reindex(self):
+        """
+        Rebuild the dataset indexes.
+
+        Must be called after the dataset's dealers, vehicles or bookings are
+        modified in place.
+        """
+        self._storage.load(self._data['dealers'], self._storage.bookings)
+        self._reindex()
+
+    @property
+    def version(self):
+        """
+        Version of the data, which grows every time the dataset or the bookings change.
+        """
+        return self._version
+
+    @property
+    def dataset_version(self):
+        """
+        Version of the dealers and their vehicles, which grows every time the dataset changes.
+
+        Unlike version, it doesn't change with the bookings.
+        """
+        return self._dataset_version
 
+    @property
+    def instance_id(self):
+        return self._instance_id
+
+    @property
+    def dealers(self):
+        """The dealers of the dataset, with their vehicles. Must not be modified."""
+        return self._data['dealers']
+
+    def _reindex(self):
+        self._version += 1
+        self._dataset_version += 1
+        self._dealer_coordinates = CoordinateArray((dealer['latitude'], dealer['longitude'])
+                                                   for dealer in self._data['dealers'])
+        self._dealer_spatial_index = SpatialIndex(self._dealer_coordinates)
+
+    @read_locked
     def get_vehicles_by_attributes(self, dealer=None, model=None, fuel=None, transmission=None):
-        vehicles = list(self._all_vehicles)
+        return self._storage.lookup(dealer=dealer, model=model, fuel=fuel,
+                                          transmission=transmission)
 
-        if dealer is not None:
-            vehicles = self.get_vehicles_by_dealer(dealer, vehicles)
-        if model is not None:
-            vehicles = self.get_vehicles_by_model(model, vehicles)
-        if fuel is not None:
-            vehicles = self.get_vehicles_by_fuel_type(fuel, vehicles)
-        if transmission is not None:
-            vehicles = self.get_vehicles_by_transmission(transmission, vehicles)
+    @read_locked
+    def get_vehicles_page(self, limit, after=None, dealer=None, model=None, fuel=None,
+                          transmission=None):
+        """
+        Returns a page of at most limit vehicles with the attributes, in a stable order.
+
+        The page starts after the vehicle with the id after, or from the
+        first vehicle. Along with the vehicles, the id of the last one is
+        returned, to get the next page with, or None if there are no more.
+        """
+        try:
+            vehicles, has_more = self._storage.lookup_page(limit, after=after, dealer=dealer,
+                                                model=model, fuel=fuel, transmission=transmission)
+        except KeyError:
+            raise VehicleNotFoundError('Vehicle with id {} was not found'.format(after))
 
-        return vehicles
+        next_after = vehicles[-1]['id'] if has_more else None
+        return vehicles, next_after
 
+    @read_locked
     def get_vehicles_by_model(self, model, vehicles=None):
         """
         Returns a list of vehicles with the specified model.
         """
-        vehicles = vehicles if vehicles is not None else self._all_vehicles
+        if vehicles is None:
+            return self._storage.lookup(model=model)
 
         return self._filter_vehicles_by_property_value('model', model, vehicles)
 
+    @read_locked
     def get_vehicles_by_fuel_type(self, fuel, vehicles=None):
-        vehicles = vehicles if vehicles is not None else self._all_vehicles
+        if vehicles is None:
+            return self._storage.lookup(fuel=fuel)
 
         return self._filter_vehicles_by_property_value('fuel', fuel, vehicles)
 
+    @read_locked
     def get_vehicles_by_transmission(self, transmission, vehicles=None):
-        vehicles = vehicles if vehicles is not None else self._all_vehicles
+        if vehicles is None:
+            return self._storage.lookup(transmission=transmission)
 
         return self._filter_vehicles_by_property_value('transmission',
                                                        transmission, vehicles)
 
+    @read_locked
     def get_vehicles_by_dealer(self, dealer, vehicles=None):
-        vehicles = vehicles if vehicles is not None else self._all_vehicles
-
-        for mb_dealer in self._dataset['dealers']:
-            if mb_dealer['id'].lower() == dealer.lower():
-                return mb_dealer['vehicles']
-        return []
+        return self._storage.lookup(dealer=dealer)
 
+    @read_locked
     def get_closest_dealer_with_vehicle(self, latitude, longitude, model=None,
                                             fuel=None, transmission=None):
-        sorted_dealers = self._sort_dealers_by_distance(latitude, longitude)
-        for dealer_group in sorted_dealers:
-            for dealer in dealer_group:
-                if self._dealer_has_vehicle(dealer, model, fuel, transmission):
-                    return dealer
+        model, fuel, transmission = self._normalize_filters(model, fuel, transmission)
+        dealers = self._data['dealers']
+        # stop the nearest neighbour search at the first dealer with the vehicle
+        for _, pos in self._dealer_spatial_index.nearest(latitude, longitude):
+            dealer = dealers[pos]
+            if self._dealer_has_vehicle(dealer, model, fuel, transmission):
+                return dealer
         return None
 
+    @read_locked
     def get_dealers_in_polygon_with_vehicle(self, coord_pair, model=None, fuel=None,
                                         transmission=None):
         res = []
-        polygon = [Coordinate(*lat_lon_pair) for lat_lon_pair in coord_pair]
-        for dealer in self._dataset['dealers']:
-            if self._dealer_has_vehicle(dealer, model, fuel, transmission):
-                dealer_coord = Coordinate(dealer['latitude'], dealer['longitude'])
-                try:
-                    if dealer_coord.is_inside_polygon(polygon):
-                        res.append(dealer)
-                except NotAPolygonError as e:
-                    raise TestDriveError(str(e))
+        model, fuel, transmission = self._normalize_filters(model, fuel, transmission)
+        try:
+            # validate and prepare the polygon once for all of the dealers
+            polygon = Polygon([Coordinate(*lat_lon_pair) for lat_lon_pair in coord_pair])
+        except NotAPolygonError as e:
+            raise TestDriveError(str(e))
+
+        latitudes = self._dealer_coordinates.latitudes
+        longitudes = self._dealer_coordinates.longitudes
+        for pos, dealer in enumerate(self._data['dealers']):
+            if polygon.contains(latitudes[pos], longitudes[pos]):
+                if self._dealer_has_vehicle(dealer, model, fuel, transmission):
+                    res.append(dealer)
         return res
 
 
 
+    @read_locked
     def get_closest_dealers_with_vehicle(self, latitude, longitude, model=None,
-                                            fuel=None, transmission=None):
+                                            fuel=None, transmission=None, limit=None,
+                                            max_distance=None):
+        """
+        Returns the dealers with the vehicle, sorted from the closest to the farthest one.
+
+        At most limit dealers are returned, and only the ones at most
+        max_distance kilometers away, if they're provided.
+        """
         res = []
-        sorted_dealers = self._sort_dealers_by_distance(latitude, longitude)
-        for dealer_group in sorted_dealers:
-            for dealer in dealer_group:
-                if self._dealer_has_vehicle(dealer, model, fuel, transmission):
-                    res += [dealer]
+        model, fuel, transmission = self._normalize_filters(model, fuel, transmission)
+        if limit is None and max_distance is None:
+            # every dealer is needed, so sorting them all at once is cheaper
+            sorted_dealers = self._sort_dealers_by_distance(latitude, longitude)
+            for dealer_group in sorted_dealers:
+                for dealer in dealer_group:
+                    if self._dealer_has_vehicle(dealer, model, fuel, transmission):
+                        res += [dealer]
+            return res
+
+        if limit is not None and limit < 1:
+            return res
+
+        dealers = self._data['dealers']
+        for distance, pos in self._dealer_spatial_index.nearest(latitude, longitude):
+            if max_distance is not None and distance > max_distance:
+                break
+            dealer = dealers[pos]
+            if self._dealer_has_vehicle(dealer, model, fuel, transmission):
+                res += [dealer]
+                if limit is not None and len(res) >= limit:
+                    break
         return res
 
     def create_booking(self, first_name, last_name, vehicle_id, pickup_date):
-        vehicles_with_id = self._filter_vehicles_by_property_value('id', vehicle_id)
-        assert len(vehicles_with_id) < 2, 'More than one vehicles with the same id.'
+        new_booking, seq = self._book(first_name, last_name, vehicle_id, pickup_date)
+        self._wait_until_durable(seq)
+        return new_booking
+
+    def cancel_booking(self, booking_id, reason):
+        booking, seq = self._cancel_booking(booking_id, reason)
+        self._wait_until_durable(seq)
+        return booking
+
+    def compact(self):
+        """
+        Snapshot the bookings and drop the journal records in the snapshot.
 
-        if len(vehicles_with_id) < 1:
+        Called in the background every compact_every journal records, it
+        keeps the journal, and so the recovery, short.
+        """
+        if self._journal is None:
+            return False
+        with self._lock.read_locked():
+            seq, size = self._journal.mark()
+            bookings = self._storage.encoded_bookings()
+        return self._journal.compact(bookings, seq, size)
+
+    def close(self):
+        with self._compaction_lock:
+            compaction = self._compaction
+        if compaction is not None:
+            compaction.join()
+        if self._journal is not None:
+            self._journal.close()
+        self._storage.close()
+
+    def _wait_until_durable(self, seq):
+        # outside of the lock, so concurrent bookings share the journal's fsyncs
+        if seq is None:
+            return
+        self._journal.wait(seq)
+        if self._journal.needs_compaction():
+            self._start_compaction()
+
+    def _start_compaction(self):
+        # the booking is already durable, so it mustn't wait for (or fail with) the compaction
+        with self._compaction_lock:
+            if self._compaction is not None and self._compaction.is_alive():
+                return
+            self._compaction = threading.Thread(target=self._compact_in_background, daemon=True)
+            self._compaction.start()
+
+    def _compact_in_background(self):
+        try:
+            self.compact()
+        except Exception as e:
+            # the journal is still complete, it's only compacted again later
+            print('[!!!] Could not compact the journal: {}'.format(str(e)))
+
+    def _check_journal(self):
+        # a record which couldn't be written was already applied in memory,
+        # it's only undone by a restart, so don't make any more changes
+        if self._journal is not None and self._journal.error is not None:
+            msg = 'Could not write the journal, bookings are disabled: {}'.format(
+                self._journal.error)
+            raise JournalError(msg)
+
+    def _journal_append(self, record):
+        # records are appended once the storage made the change, so a change
+        # which the storage rejects is never replayed. The journal was checked
+        # before the change (see _check_journal()), and appending only fails
+        # once it's closed. A record which then fails to be written is
+        # reported by _wait_until_durable()
+        if self._journal is None:
+            return None
+        return self._journal.append(record)
+
+    def _replay_journal(self, data):
+        bookings, records = self._journal.recover()
+        if bookings is not None:
+            # the snapshot has all of the bookings, the dataset's included
+            data['bookings'] = [booking_from_json(booking) for booking in bookings]
+        bookings = data['bookings']
+
+        bookings_by_id = {}
+        for booking in bookings:
+            bookings_by_id.setdefault(booking['id'], booking)
+        for record in records:
+            if record['op'] == BookingJournal.OP_CREATE:
+                booking = booking_from_json(record['booking'])
+                bookings.append(booking)
+                bookings_by_id.setdefault(booking['id'], booking)
+            elif record['op'] == BookingJournal.OP_CANCEL:
+                booking = bookings_by_id.get(record['id'], None)
+                if booking is None:
+                    msg = 'The journal cancels booking {}, which does not exist'.format(record['id'])
+                    raise JournalError(msg)
+                booking['cancelledAt'] = record['cancelledAt']
+                booking['cancelledReason'] = record['cancelledReason']
+
+    @write_locked
+    def _book(self, first_name, last_name, vehicle_id, pickup_date):
+        self._check_journal()
+        # vehicle ids are validated to be unique when the dataset is indexed
+        vehicle_and_dealer = self._storage.get_vehicle(vehicle_id)
+
+        if vehicle_and_dealer is None:
             raise VehicleNotFoundError('Vehicle with id {} was not found'.format(vehicle_id))
-        vehicle = vehicles_with_id[0]
-        bookings = self._dataset['bookings']
+        vehicle, dealer = vehicle_and_dealer
         booking_date = BookingDate(pickup_date)
-        booking_result = booking_date.is_booking_possible(vehicle, bookings)
+        booking_result = booking_date.is_booking_possible(vehicle,
+                                ledger=self._storage,
+                                availability=self._storage.availability_of(vehicle))
 
         booking_possible = booking_result.is_success
         if booking_possible:
             # all good, create a booking, and add it to bookings
-            new_booking = self._create_booking(first_name, last_name,
-                            vehicle_id, pickup_date, vehicle, bookings)
-            return new_booking
+            return self._create_booking(first_name, last_name,
+                            vehicle_id, pickup_date, vehicle)
 
         # here we know that hte booking is not possible, let's check the reason
         error_code = booking_result.error_code
@@ -128,7 +381,9 @@ class TestDrive(object):
             # let's not let the app crash here
             raise BookingError('Could not create booking.')
 
-    def cancel_booking(self, booking_id, reason):
+    @write_locked
+    def _cancel_booking(self, booking_id, reason):
+        self._check_journal()
         booking = self._get_booking(booking_id)
 
         if booking is None:
@@ -140,43 +395,45 @@ class TestDrive(object):
             msg = 'Booking with id {} has already been cancelled'.format(booking_id)
             raise BookingAlreadyCancelledError(msg)
 
-        booking['cancelledAt'] = datetime.datetime.today().isoformat()
+        cancelled_at = datetime.datetime.today().isoformat()
+        booking['cancelledAt'] = cancelled_at
         booking['cancelledReason'] = reason
+        self._storage.cancel_booking(booking)
+        self._version += 1
+        seq = self._journal_append({'op': BookingJournal.OP_CANCEL, 'id': booking['id'],
+                                    'cancelledAt': cancelled_at, 'cancelledReason': reason})
 
-        return booking
+        return booking, seq
 
     def _get_booking(self, booking_id):
-        for booking in self._dataset['bookings']:
-            if is_str_equal_ignore_case(booking['id'], booking_id):
-                return booking
-        return None
+        return self._storage.get_booking(booking_id)
 
-    def _create_booking(self, first_name, last_name, vehicle_id, pickup_date, vehicle, bookings):
+    def _create_booking(self, first_name, last_name, vehicle_id, pickup_date, vehicle):
         new_booking = self._create_booking_obj(first_name, last_name, vehicle_id, pickup_date)
         # insert booking into db
-        bookings.append(new_booking)
-        return new_booking
+        self._storage.add_booking(new_booking, pickup_date)
+        self._version += 1
+        seq = self._journal_append({'op': BookingJournal.OP_CREATE, 'booking': new_booking})
+        return new_booking, seq
 
 
     def _create_booking_obj(self, first_name, last_name, vehicle_id, pickup_date):
-        booking = {
+        booking = Booking({
                     'id': str(uuid.uuid4()),
                     'firstName': first_name,
                     'lastName': last_name,
                     'vehicleId': vehicle_id,
                     'pickupDate': pickup_date.isoformat(),
                     'createdAt': datetime.datetime.today().isoformat()
-        }
+        })
         return booking
 
 
     def _sort_dealers_by_distance(self, latitude, longitude):
-        my_coord = Coordinate(latitude, longitude)
         sorted_dealers = defaultdict(list)
-        # go through the dealers list and compute the distances
-        for dealer in self._dataset['dealers']:
-            dealer_coord = Coordinate(dealer['latitude'], dealer['longitude'])
-            distance = my_coord.distance_to(dealer_coord)
+        # compute the distances to all of the dealers in one go
+        distances = self._dealer_coordinates.distances_from(latitude, longitude)
+        for dealer, distance in zip(self._data['dealers'], distances):
             sorted_dealers[distance].append(dealer)
         sorted_dealers = OrderedDict(sorted(sorted_dealers.items()))
         sorted_dealers = [dealer for dealer in sorted_dealers.values()]
@@ -188,22 +445,27 @@ class TestDrive(object):
         """
         Iterator over the list of all vehicles in the dataset.
         """
-        for dealer in self._dataset['dealers']:
+        for dealer in self._data['dealers']:
             for vehicle in dealer['vehicles']:
                 yield vehicle
 
     def _load_dataset(self, path):
-        try:
-            with open(path, 'r') as f:
-                try:
-                    dataset = json.load(f)
-                except json.JSONDecodeError:
-                    msg = 'Error in when decoding JSON file: {}'.format(path)
-                    raise InvalidDataSetError(msg)
-            return dataset
-        except FileNotFoundError:
-            msg = 'Dataset at {} not found. Make sure that the file path is correct.'.format(path)
-            raise DatasetNotFoundError(msg)
+        if self._snapshot is not None:
+            data = self._snapshot.load()
+            if data is not None:
+                return data
+
+        # the dealers, vehicles and bookings are converted to compact records as they're read
+        hooks = {'dealers': dealer_from_json, 'bookings': booking_from_json}
+        data = DatasetLoader(path, progress=self._progress, hooks=hooks).load()
+        if self._snapshot is not None:
+            # before the journal is replayed, the snapshot is only of the dataset
+            try:
+                self._snapshot.write(data)
+            except OSError as e:
+                # the snapshot only makes the next start faster
+                print('[!!!] Could not write the dataset snapshot: {}'.format(str(e)))
+        return data
 
 
     def _filter_vehicles_by_property_value(self, name, value, vehicles=None):
@@ -211,24 +473,35 @@ class TestDrive(object):
         Filter vehicles by the value of their property.
         """
         vehicles = vehicles if vehicles is not None else self._all_vehicles
+        value = normalize_key(value)
 
         res = []
         for vehicle in vehicles:
-            if is_str_equal_ignore_case(vehicle[name], value):
+            if getattr(self._storage.keys_of(vehicle), name) == value:
                 res += [vehicle]
         return res
 
+    def _normalize_filters(self, *filters):
+        """
+        Normalize the query filters once per request, leaving the unset (None) ones as they are.
+        """
+        return tuple(normalize_key(value) if value is not None else None for value in filters)
+
     def _dealer_has_vehicle(self, dealer, model, fuel, transmission):
-        vehicles = dealer['vehicles']
-        for vehicle in vehicles:
+        """
+        Check if a dealer has a vehicle with the provided attributes.
+
+        The attributes must be already normalized with _normalize_filters().
+        """
+        for keys in self._storage.dealer_keys(dealer):
             if model is not None:
-                if not is_str_equal_ignore_case(vehicle['model'], model):
+                if keys.model != model:
                     continue
             if fuel is not None:
-                if not is_str_equal_ignore_case(vehicle['fuel'], fuel):
+                if keys.fuel != fuel:
                     continue
             if transmission is not None:
-                if not is_str_equal_ignore_case(vehicle['transmission'], transmission):
+                if keys.transmission != transmission:
                     continue
             return True
         return False
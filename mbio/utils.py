@@ -1,9 +1,39 @@
 """Utility functionality."""
+import sys
 import unicodedata
 
 def nfdk_normalize_ignore_case(string):
     return unicodedata.normalize("NFKD", string.casefold())
 
+def is_ascii(string):
+    """Checks if all of the characters of a string are ASCII, like str.isascii() of Python 3.7."""
+    try:
+        # ASCII strings are copied as they are, others fail at the first other character
+        string.encode('ascii')
+    except UnicodeEncodeError:
+        return False
+    return True
+
+def normalize_key(string):
+    """
+    Returns the key used to compare strings ignoring letter case.
+
+    Two strings are equal according to is_str_equal_ignore_case() if and only
+    if their keys are equal. Pure ASCII strings are not affected by the NFKD
+    normalization and casefold() is the same as lower() for them, so they
+    skip the unicode machinery.
+    """
+    if is_ascii(string):
+        key = string.lower()
+    else:
+        key = nfdk_normalize_ignore_case(string)
+    # avoid keeping two copies of strings which are already normalized
+    return string if key == string else key
+
+def intern_key(string):
+    """Returns the interned normalize_key() of a dataset string."""
+    return sys.intern(normalize_key(string))
+
 def is_str_equal_ignore_case(str1, str2):
     """
     Compares if strings are equal ignoring letter case.
@@ -13,11 +43,20 @@ def is_str_equal_ignore_case(str1, str2):
     return nfdk_normalize_ignore_case(str1) == nfdk_normalize_ignore_case(str2)
 
 def are_list_items_unique(lst):
-    num_coords = len(lst)
-    for i in range(num_coords):
-        for j in range(num_coords):
-            if i == j:
-                continue
+    """
+    Checks if all of the items of a list are distinct.
+
+    Hashable items are checked in linear time, otherwise every pair of items
+    is compared.
+    """
+    try:
+        return len(set(lst)) == len(lst)
+    except TypeError:
+        pass
+
+    num_items = len(lst)
+    for i in range(num_items):
+        for j in range(i + 1, num_items):
             if lst[i] == lst[j]:
                 return False
     return True
@@ -1,17 +1,57 @@
 #!/usr/bin/env python3
 
+import os
 import argparse
 from mbio.server.server import Server
+from mbio.server.httpserver import ThreadPoolHTTPServer
+from mbio.server.prefork import PreforkServer
+from mbio.server.aioserver import AsyncHTTPServer
+from mbio.storage.sqlitestorage import SQLiteStorage
 from http.server import HTTPServer
 
-def run(dataset_path, server_port):
+MODE_SINGLE = 'single'
+MODE_THREADED = 'threaded'
+MODE_PREFORK = 'prefork'
+MODE_ASYNCIO = 'asyncio'
+DEFAULT_WORKERS = os.cpu_count() or 1
+
+def print_loading_progress(step=10):
+    """Returns a progress callback which prints every step percent of the dataset loaded."""
+    printed = [None]
+
+    def progress(read, size):
+        percent = 100 * read // size if size else 100
+        percent -= percent % step
+        if percent != printed[0]:
+            printed[0] = percent
+            print('Loading the dataset... {}%'.format(percent))
+
+    return progress
+
+def run(dataset_path, server_port, mode=MODE_SINGLE, threads=ThreadPoolHTTPServer.DEFAULT_THREADS,
+        workers=DEFAULT_WORKERS, cache_size=Server.CACHE_SIZE, cache_precision=Server.CACHE_PRECISION,
+        journal_path=Server.JOURNAL_PATH, database_path=Server.DATABASE_PATH,
+        snapshot_path=Server.SNAPSHOT_PATH):
 
     print('Starting server on port {}...'.format(server_port))
     Server.DATASET_PATH = dataset_path
+    Server.CACHE_SIZE = cache_size
+    Server.CACHE_PRECISION = cache_precision
+    Server.JOURNAL_PATH = journal_path
+    Server.DATABASE_PATH = database_path
+    Server.SNAPSHOT_PATH = snapshot_path
+    Server.PROGRESS = print_loading_progress()
 
     # Server settings
     server_address = ('', server_port)
-    httpd = HTTPServer(server_address, Server)
+    if mode == MODE_THREADED:
+        httpd = ThreadPoolHTTPServer(server_address, Server, threads)
+    elif mode == MODE_PREFORK:
+        httpd = PreforkServer(server_address, Server, workers)
+    elif mode == MODE_ASYNCIO:
+        httpd = AsyncHTTPServer(server_address, Server, threads)
+    else:
+        httpd = HTTPServer(server_address, Server)
     print('Server is running!')
 
     try:
@@ -19,10 +59,33 @@ def run(dataset_path, server_port):
     except Exception as e:
         print('[!!!] Fatal error occured. The application will end.')
         print('\t{}'.format(str(e)))
+    finally:
+        httpd.server_close()
+        if Server.td is not None:
+            Server.td.close()
 
 if __name__=='__main__':
     parser = argparse.ArgumentParser(description='Mercedes-Benz IO TestDrive application. Developed as part of the MB IO challenge at SINFO 25.')
     parser.add_argument('-f', '--file', help='Path to the file containing the JSON dataset.', required=True)
     parser.add_argument('-p', '--port', help='Port on which to start the HTTP Server.', default=8081, type=int)
+    parser.add_argument('-m', '--mode', help='How requests are served: one at a time ({}), by a pool of threads ({}), by worker processes ({}) or over persistent HTTP/1.1 connections ({}).'.format(MODE_SINGLE, MODE_THREADED, MODE_PREFORK, MODE_ASYNCIO),
+                        choices=[MODE_SINGLE, MODE_THREADED, MODE_PREFORK, MODE_ASYNCIO], default=MODE_SINGLE)
+    parser.add_argument('-t', '--threads', help='Number of threads in the {} and {} modes.'.format(MODE_THREADED, MODE_ASYNCIO),
+                        default=ThreadPoolHTTPServer.DEFAULT_THREADS, type=int)
+    parser.add_argument('-w', '--workers', help='Number of worker processes in the {} mode.'.format(MODE_PREFORK),
+                        default=DEFAULT_WORKERS, type=int)
+    parser.add_argument('-c', '--cache-size', help='Number of geo query results to cache (0 disables the cache).',
+                        default=Server.CACHE_SIZE, type=int)
+    parser.add_argument('--cache-precision', help='Decimal places the coordinates of the cached geo queries are rounded to (not rounded by default).',
+                        default=Server.CACHE_PRECISION, type=int)
+    parser.add_argument('-j', '--journal', help='Path to the journal the bookings are written to, so they survive a restart (kept in memory only by default).',
+                        default=Server.JOURNAL_PATH)
+    parser.add_argument('-d', '--database', help='Keep the vehicle indexes and the bookings in a SQLite database at this path ({} for an in-memory one) instead of in memory.'.format(SQLiteStorage.MEMORY),
+                        default=Server.DATABASE_PATH)
+    parser.add_argument('-s', '--snapshot', help='Path to a binary snapshot of the dataset, which is loaded instead of the JSON file, and written again whenever the JSON file changes.',
+                        default=Server.SNAPSHOT_PATH)
     args = parser.parse_args()
-    run(args.file, args.port)
+    if args.mode == MODE_PREFORK and args.database == SQLiteStorage.MEMORY:
+        parser.error('an in-memory database can not be used in the {} mode'.format(MODE_PREFORK))
+    run(args.file, args.port, args.mode, args.threads, args.workers, args.cache_size,
+        args.cache_precision, args.journal, args.database, args.snapshot)
@@ -3,6 +3,8 @@ import copy
 import uuid
 import datetime
 import unittest
+import threading
+from collections.abc import Mapping
 from unittest.mock import patch
 from mbio.testdrive import TestDrive
 from mbio.exceptions import (VehicleNotFoundError, VehicleAlreadyBookedError,
@@ -158,6 +160,30 @@ class BookingsTestCase(unittest.TestCase):
         self.assertTrue(obtained_booking in bookings, 'New booking was not '
                         'added to the dataset.')
 
+    def test_concurrent_bookings_only_one_success(self):
+        td = TestDrive(dataset='./tests/resources/dataset_full.json')
+        vehicle_id = '778a04fd-0a6a-4dc7-92bb-a7517608efc2'
+        pickup_date = datetime.datetime(2019, 4, 9, 10, 0)
+        results = []
+        start = threading.Barrier(8)
+
+        def book():
+            start.wait()
+            try:
+                results.append(td.create_booking('Jayceon', 'Taylor', vehicle_id, pickup_date))
+            except VehicleAlreadyBookedError as e:
+                results.append(e)
+
+        threads = [threading.Thread(target=book) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        bookings = [res for res in results if isinstance(res, Mapping)]
+        self.assertEqual(8, len(results))
+        self.assertEqual(1, len(bookings))
+
     def test_cancel_booking_success(self):
         booking_id = '184b5438-35dc-49c4-aab0-e6cf62285aa6'
         reason = "Can't bang Dr.Dre with good enough sound quality."
@@ -250,6 +276,92 @@ class BookingsTestCase(unittest.TestCase):
         with self.assertRaises(BookingDoesNotExistError):
             td.cancel_booking(booking_id, 'I Grew Up On Wu-Tang')
 
+    @patch.object(uuid, 'uuid4', side_effect=MOCKED_UUIDS)
+    def test_cancel_new_booking_success(self, uuid):
+        td = TestDrive(dataset='./tests/resources/dataset_full.json')
+        vehicle_id = '136fbb51-8a06-42fd-b839-c01ab87e2c6c'
+        pickup_date = datetime.datetime(2019, 4, 9, 10, 0)
+        booking = td.create_booking(first_name='Jayceon', last_name='Taylor',
+                          vehicle_id=vehicle_id,
+                          pickup_date=pickup_date)
+
+        reason = 'Westside Story'
+        obtained = td.cancel_booking(booking['id'].upper(), reason=reason)
+        self.assertIs(booking, obtained)
+        self.assertEqual(reason, obtained['cancelledReason'])
+
     def test_cancel_booking_then_reserve_for_that_date(self):
-        # TODO
-        pass
+        td = TestDrive(dataset='./tests/resources/dataset_full.json')
+        vehicle_id = '778a04fd-0a6a-4dc7-92bb-a7517608efc2'
+        # reservation for April 9th at 10:00 (Tuesday)
+        pickup_date = datetime.datetime(2019, 4, 9, 10, 0)
+        booking = td.create_booking(first_name='Jayceon', last_name='Taylor',
+                          vehicle_id=vehicle_id,
+                          pickup_date=pickup_date)
+
+        with self.assertRaises(VehicleAlreadyBookedError):
+            td.create_booking(first_name='Jayceon', last_name='Taylor',
+                              vehicle_id=vehicle_id,
+                              pickup_date=pickup_date)
+
+        td.cancel_booking(booking['id'], 'Westside Story')
+        new_booking = td.create_booking(first_name='Jayceon', last_name='Taylor',
+                                        vehicle_id=vehicle_id,
+                                        pickup_date=pickup_date)
+        self.assertNotEqual(booking['id'], new_booking['id'])
+
+    def test_booking_other_vehicle_booked_on_date_success(self):
+        td = TestDrive(dataset='./tests/resources/dataset_full.json')
+        # other vehicles are booked on March 6th at 10:00, but not this one
+        vehicle_id = '778a04fd-0a6a-4dc7-92bb-a7517608efc2'
+        pickup_date = datetime.datetime(2018, 3, 6, 10, 0)
+        booking = td.create_booking(first_name='Jayceon', last_name='Taylor',
+                          vehicle_id=vehicle_id,
+                          pickup_date=pickup_date)
+        self.assertIn(booking, td._dataset['bookings'])
+
+    def test_bookings_change_version(self):
+        td = TestDrive(dataset='./tests/resources/dataset_full.json')
+        vehicle_id = '778a04fd-0a6a-4dc7-92bb-a7517608efc2'
+        pickup_date = datetime.datetime(2019, 4, 9, 10, 0)
+        version = td.version
+        dataset_version = td.dataset_version
+
+        booking = td.create_booking(first_name='Jayceon', last_name='Taylor',
+                          vehicle_id=vehicle_id,
+                          pickup_date=pickup_date)
+        self.assertGreater(td.version, version)
+        version = td.version
+
+        with self.assertRaises(VehicleAlreadyBookedError):
+            td.create_booking(first_name='Jayceon', last_name='Taylor',
+                              vehicle_id=vehicle_id,
+                              pickup_date=pickup_date)
+        self.assertEqual(version, td.version)
+
+        td.cancel_booking(booking['id'], 'Westside Story')
+        self.assertGreater(td.version, version)
+        version = td.version
+
+        # bookings don't change the dealers and vehicles
+        self.assertEqual(dataset_version, td.dataset_version)
+
+        td.reindex()
+        self.assertGreater(td.version, version)
+        self.assertGreater(td.dataset_version, dataset_version)
+
+    def test_duplicate_booking_id_does_not_take_slot(self):
+        td = TestDrive(dataset='./tests/resources/dataset_full.json')
+        vehicle_id = '778a04fd-0a6a-4dc7-92bb-a7517608efc2'
+        pickup_date = datetime.datetime(2019, 4, 16, 10, 0)
+        dataset = td._dataset
+        original = dataset['bookings'][0]
+        duplicate = dict(original, vehicleId=vehicle_id, pickupDate=pickup_date.isoformat())
+        td._dataset = dict(dataset, bookings=dataset['bookings'] + [duplicate])
+
+        # only the first booking with the id can be cancelled, the duplicate can't hold its slot
+        cancelled = td.cancel_booking(original['id'], reason='Busy')
+        self.assertEqual(original['pickupDate'], cancelled['pickupDate'])
+        booking = td.create_booking(first_name='Jayceon', last_name='Taylor',
+                                    vehicle_id=vehicle_id, pickup_date=pickup_date)
+        self.assertIn(booking, td._dataset['bookings'])
@@ -0,0 +1,56 @@
+"""Query result cache tests."""
+import unittest
+from mbio.cache import QueryCache
+
+
+class QueryCacheTestCase(unittest.TestCase):
+
+    def test_get_cached_value(self):
+        cache = QueryCache(4)
+        self.assertIs(QueryCache.MISSING, cache.get('a', 1))
+        cache.put('a', None, 1)
+        self.assertIsNone(cache.get('a', 1))
+        self.assertEqual(1, cache.hits)
+        self.assertEqual(1, cache.misses)
+
+    def test_least_recently_used_evicted(self):
+        cache = QueryCache(3, max_client_entries=3)
+        for key in 'abc':
+            cache.put(key, key.upper(), 1)
+        cache.get('a', 1)
+        cache.put('d', 'D', 1)
+
+        self.assertIs(QueryCache.MISSING, cache.get('b', 1))
+        for key in 'acd':
+            self.assertEqual(key.upper(), cache.get(key, 1))
+        self.assertEqual(1, cache.evictions)
+        self.assertEqual(3, len(cache))
+
+    def test_client_evicts_own_entries(self):
+        cache = QueryCache(4, max_client_entries=2)
+        cache.put('a', 'A', 1, client='10.0.0.1')
+        cache.put('b', 'B', 1, client='10.0.0.1')
+        for i in range(10):
+            cache.put(i, i, 1, client='10.0.0.2')
+
+        self.assertEqual('A', cache.get('a', 1))
+        self.assertEqual('B', cache.get('b', 1))
+        self.assertEqual(9, cache.get(9, 1))
+        self.assertEqual(8, cache.get(8, 1))
+        self.assertIs(QueryCache.MISSING, cache.get(7, 1))
+        self.assertEqual(8, cache.evictions)
+
+    def test_new_version_invalidates(self):
+        cache = QueryCache(4)
+        cache.put('a', 'A', 1)
+        self.assertIs(QueryCache.MISSING, cache.get('a', 2))
+        self.assertEqual(0, len(cache))
+
+        # results computed on an older version are not cached
+        cache.put('a', 'A', 1)
+        self.assertIs(QueryCache.MISSING, cache.get('a', 2))
+        self.assertIs(QueryCache.MISSING, cache.get('a', 1))
+
+    def test_quantize(self):
+        self.assertEqual(38.187787, QueryCache(4).quantize(38.187787))
+        self.assertEqual(38.188, QueryCache(4, precision=3).quantize(38.187787))
@@ -1,7 +1,13 @@
 """Coordinates class tests."""
 
 import unittest
+import random
+import struct
+from math import cos, sin, asin, sqrt
+from array import array
 from mbio.geo.coordinate import Coordinate
+from mbio.geo.coordinatearray import CoordinateArray, numpy
+from mbio.geo.polygon import Polygon
 from mbio.geo.exceptions import NotAPolygonError
 
 class CoordinatesTestCase(unittest.TestCase):
@@ -159,3 +165,118 @@ class CoordinatesTestCase(unittest.TestCase):
         coord = Coordinate(1, 2)
         d = {'a':'b'}
         self.assertNotEqual(coord, d)
+
+
+class CoordinateArrayTestCase(unittest.TestCase):
+
+    def test_distances_same_as_scalar(self):
+        rnd = random.Random(25)
+        coordinates = [(rnd.uniform(-90, 90), rnd.uniform(-180, 180)) for _ in range(1000)]
+        coordinates += [(29.7630556, -95.3630556), (14.628434, -90.522713), (0, 0)]
+        coord_array = CoordinateArray(coordinates)
+        self.assertEqual(len(coordinates), len(coord_array))
+
+        for latitude, longitude in coordinates[:20] + [(14.628434, -90.522713)]:
+            my_coord = Coordinate(latitude, longitude)
+            expected = [my_coord.distance_to(Coordinate(*coordinate)) for coordinate in coordinates]
+            obtained = coord_array.distances_from(latitude, longitude)
+            self.assertEqual(expected, list(obtained))
+
+    @unittest.skipUnless(numpy, 'NumPy is not installed')
+    def test_numpy_distances_next_to_rounding_boundaries(self):
+        def distance(coord, other):
+            # Coordinate.distance_to(), not rounded
+            dlat = coord.latitude_rad - other.latitude_rad
+            dlon = coord.longitude_rad - other.longitude_rad
+            a = sin(dlat/2)**2 + cos(coord.latitude_rad) * cos(other.latitude_rad) * sin(dlon/2)**2
+            return 2 * asin(sqrt(a)) * Coordinate.EARTH_RADIUS
+
+        def next_float(value, steps):
+            bits = struct.unpack('<q', struct.pack('<d', value))[0]
+            return struct.unpack('<d', struct.pack('<q', bits + steps))[0]
+
+        my_coord = Coordinate(38.746721, -9.229837)
+        coordinates = []
+        for boundary in (12.3455, 57.0005, 140.9995, 1024.5005):
+            # the longitude of the point at the boundary, due east
+            low, high = 0.0, 90.0
+            for _ in range(200):
+                middle = (low + high) / 2
+                if distance(my_coord, Coordinate(38.746721, -9.229837 + middle)) < boundary:
+                    low = middle
+                else:
+                    high = middle
+            coordinates.extend((38.746721, -9.229837 + next_float(low, steps))
+                               for steps in range(-50, 51))
+        coord_array = CoordinateArray(coordinates)
+
+        expected = [my_coord.distance_to(Coordinate(*coordinate)) for coordinate in coordinates]
+        self.assertEqual(expected, list(coord_array.distances_from(38.746721, -9.229837)))
+        positions = list(range(0, len(coordinates), 3))
+        self.assertEqual([expected[pos] for pos in positions],
+                         list(coord_array.distances_from(38.746721, -9.229837, positions)))
+
+    def test_distances_to_positions(self):
+        coord_array = CoordinateArray([(29.7630556, -95.3630556), (14.628434, -90.522713),
+                                       (38.746721, -9.229837)])
+        out = array('d', [1.0] * 10)
+        obtained = coord_array.distances_from(29.7630556, -95.3630556, [1, 0], out)
+        self.assertIs(out, obtained)
+        self.assertEqual([1754.502, 0.0], list(obtained))
+        self.assertEqual(Coordinate(38.746721, -9.229837), coord_array[2])
+
+
+class PolygonTestCase(unittest.TestCase):
+
+    FLORIDA = [
+            Coordinate(31.000213,-87.584839),
+            Coordinate(31.009629,-85.003052),
+            Coordinate(30.726726,-84.838257),
+            Coordinate(30.584962,-82.168579),
+            Coordinate(30.73617,-81.476441),
+            Coordinate(29.002375,-80.795288),
+            Coordinate(26.896598,-79.938355),
+            Coordinate(25.813738,-80.059204),
+            Coordinate(24.93028,-80.454712),
+            Coordinate(24.401135,-81.817017),
+            Coordinate(24.700927,-81.959839),
+            Coordinate(24.950203,-81.124878),
+            Coordinate(26.0015,-82.014771),
+            Coordinate(27.833247,-83.014527),
+            Coordinate(28.8389,-82.871704),
+            Coordinate(29.987293,-84.091187),
+            Coordinate(29.539053,-85.134888),
+            Coordinate(30.272352,-86.47522),
+            Coordinate(30.281839,-87.628784),
+    ]
+
+    def test_same_results_as_winding_angle(self):
+        polygon = Polygon(self.FLORIDA)
+        points = [Coordinate(30.82112,-87.255249), Coordinate(27.92065,-82.619019),
+                  Coordinate(25.853292,-80.223999), Coordinate(24.680963,-81.366577),
+                  Coordinate(24.311058,-81.17981), Coordinate(29.029276,-90.805666),
+                  Coordinate(25.159207,-79.916382), Coordinate(31.319856,-84.607544)]
+        # the vertices, which are on the boundary, and a grid over the polygon
+        points += self.FLORIDA
+        points += [Coordinate(24 + i / 10, -88 + j / 10) for i in range(80) for j in range(90)]
+
+        for point in points:
+            expected = point.is_inside_polygon(self.FLORIDA)
+            obtained = polygon.contains(point.latitude, point.longitude)
+            self.assertEqual(expected, obtained, 'Mismatch for {}, {}'.format(
+                                                point.latitude, point.longitude))
+
+    def test_self_intersecting_polygon(self):
+        bowtie = [Coordinate(0, 0), Coordinate(2, 2), Coordinate(2, 0), Coordinate(0, 2)]
+        polygon = Polygon(bowtie)
+        for latitude in (-0.5, 0, 0.5, 1, 1.5, 2):
+            for longitude in (-0.5, 0, 0.5, 1, 1.5, 2):
+                point = Coordinate(latitude, longitude)
+                self.assertEqual(point.is_inside_polygon(bowtie),
+                                 polygon.contains(latitude, longitude))
+
+    def test_not_a_polygon_fail(self):
+        with self.assertRaises(NotAPolygonError):
+            Polygon(self.FLORIDA[:2])
+        with self.assertRaises(NotAPolygonError):
+            Polygon(self.FLORIDA + self.FLORIDA[:1])
@@ -4,6 +4,7 @@ import json
 import datetime
 from mbio.testdrive import TestDrive
 from mbio.date.bookingdate import BookingDate, BookingResponse
+from mbio.date.availability import WeeklyAvailability
 
 class DateTimeTestCase(unittest.TestCase):
     """Tests related to the datetime.datetime wrapper."""
@@ -131,3 +132,33 @@ class DateTimeTestCase(unittest.TestCase):
 
         self.assertTrue(booking_available, 'Booking should be available, but '
                                            'is not.')
+
+    def test_weekly_availability_half_hour_slots(self):
+        availability = WeeklyAvailability({'Tuesday': ['1000', '1030'],
+                                           'monday': ['0000', '2330']})
+        self.assertEqual(30, availability.resolution)
+
+        # April 8th 2019 is a Monday
+        self.assertTrue(availability.is_available(datetime.datetime(2019, 4, 8, 0, 0)))
+        self.assertTrue(availability.is_available(datetime.datetime(2019, 4, 8, 23, 30)))
+        self.assertTrue(availability.is_available(datetime.datetime(2019, 4, 9, 10, 30)))
+        self.assertFalse(availability.is_available(datetime.datetime(2019, 4, 8, 10, 0)))
+        self.assertFalse(availability.is_available(datetime.datetime(2019, 4, 9, 10, 15)))
+        self.assertFalse(availability.is_available(datetime.datetime(2019, 4, 10, 10, 0)))
+
+    def test_weekly_availability_finer_slots(self):
+        availability = WeeklyAvailability({'sunday': ['1015', '1045', '2359']})
+        self.assertEqual(1, availability.resolution)
+
+        # April 14th 2019 is a Sunday
+        self.assertTrue(availability.is_available(datetime.datetime(2019, 4, 14, 10, 15)))
+        self.assertTrue(availability.is_available(datetime.datetime(2019, 4, 14, 10, 45)))
+        self.assertTrue(availability.is_available(datetime.datetime(2019, 4, 14, 23, 59)))
+        self.assertFalse(availability.is_available(datetime.datetime(2019, 4, 14, 10, 30)))
+        self.assertFalse(availability.is_available(datetime.datetime(2019, 4, 15, 0, 0)))
+
+    def test_weekly_availability_invalid_times_never_available(self):
+        availability = WeeklyAvailability({'monday': ['9300', '1060', '1000']})
+        self.assertTrue(availability.is_available(datetime.datetime(2019, 4, 8, 10, 0)))
+        self.assertFalse(availability.is_available(datetime.datetime(2019, 4, 10, 21, 0)))
+        self.assertFalse(availability.is_available(datetime.datetime(2019, 4, 8, 11, 0)))
@@ -0,0 +1,41 @@
+"""Pre-encoded JSON tests."""
+import json
+import unittest
+from mbio.models import to_json
+from mbio.testdrive import TestDrive
+from mbio.server.fragments import JSONFragments
+
+
+class JSONFragmentsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.td = TestDrive(dataset='./tests/resources/dataset_full.json')
+        self.fragments = JSONFragments(self.td.dealers)
+
+    def test_dealers(self):
+        dealers = self.td.get_closest_dealers_with_vehicle(38.187787, -8.104157)
+        for response in ({'dealers': dealers}, {'dealers': []}, {'dealer': dealers[0]},
+                         {'dealer': None}):
+            self.assertEqual(json.dumps(response, default=to_json).encode(), self.fragments.dumps(response))
+
+    def test_vehicles(self):
+        vehicles = self.td.get_vehicles_by_attributes()
+        self.assertEqual(len(self.td.dealers) + len(vehicles), len(self.fragments))
+        response = {'vehicles': vehicles}
+        self.assertEqual(json.dumps(response, default=to_json).encode(), self.fragments.dumps(response))
+
+    def test_other_objects(self):
+        responses = [
+            {'error': 'Booking for 2019-04-08T10:30:00 já existe'},
+            {'id': 'b00d3e76', 'pickupDate': '2018-03-03T10:30:00', 'cancelled': True},
+            {'dealers': [{'id': 1, 'name': 'Lisboa', 'latitude': 38.7, 'closed': False}]},
+            {'counts': {1: 2, None: 3}},
+            [1.5, None, 'E'],
+        ]
+        for response in responses:
+            self.assertEqual(json.dumps(response, default=to_json).encode(), self.fragments.dumps(response))
+
+    def test_replaced_object_not_reused(self):
+        dealer = dict(self.td.dealers[0], name='Still D.R.E.')
+        response = {'dealer': dealer}
+        self.assertEqual(json.dumps(response, default=to_json).encode(), self.fragments.dumps(response))
@@ -0,0 +1,211 @@
+"""Bookings journal tests."""
+import os
+import errno
+import shutil
+import datetime
+import tempfile
+import unittest
+import threading
+from unittest.mock import patch
+from mbio.testdrive import TestDrive
+from mbio.journal import BookingJournal
+from mbio.storage.sqlitestorage import SQLiteStorage
+from mbio.exceptions import (VehicleAlreadyBookedError, BookingAlreadyCancelledError,
+                             JournalError)
+
+DATASET_PATH = './tests/resources/dataset_full.json'
+VEHICLE_ID = '136fbb51-8a06-42fd-b839-c01ab87e2c6c'
+# Tuesdays, the vehicle is available at 10:00
+PICKUP_DATES = [datetime.datetime(2019, 4, 2, 10, 0), datetime.datetime(2019, 4, 9, 10, 0),
+                datetime.datetime(2019, 4, 16, 10, 0), datetime.datetime(2019, 4, 23, 10, 0)]
+
+
+class BookingJournalTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'bookings.journal')
+        self.test_drives = []
+
+    def tearDown(self):
+        for td in self.test_drives:
+            td.close()
+        shutil.rmtree(self.directory)
+
+    def _test_drive(self, **kwargs):
+        td = TestDrive(DATASET_PATH, journal=self.path, **kwargs)
+        self.test_drives.append(td)
+        return td
+
+    def _book(self, td, pickup_date):
+        return td.create_booking(first_name='Jayceon', last_name='Taylor',
+                                 vehicle_id=VEHICLE_ID, pickup_date=pickup_date)
+
+    def test_bookings_recovered(self):
+        td = self._test_drive()
+        booking = self._book(td, PICKUP_DATES[0])
+        cancelled = td.cancel_booking('184b5438-35dc-49c4-aab0-e6cf62285aa6', reason='Busy')
+        bookings = td._dataset['bookings']
+        td.close()
+
+        recovered = self._test_drive()
+        self.assertEqual(bookings, recovered._dataset['bookings'])
+        self.assertIn(booking, recovered._dataset['bookings'])
+        self.assertEqual(cancelled, recovered._get_booking(cancelled['id']))
+        with self.assertRaises(VehicleAlreadyBookedError):
+            self._book(recovered, PICKUP_DATES[0])
+        with self.assertRaises(BookingAlreadyCancelledError):
+            recovered.cancel_booking(cancelled['id'], reason='Busy')
+
+    def test_without_journal_nothing_written(self):
+        td = TestDrive(DATASET_PATH)
+        self._book(td, PICKUP_DATES[0])
+        self.assertEqual([], os.listdir(self.directory))
+
+    def test_torn_record_truncated(self):
+        td = self._test_drive()
+        first = self._book(td, PICKUP_DATES[0])
+        second = self._book(td, PICKUP_DATES[1])
+        td.close()
+        # a crash in the middle of writing the second record
+        size = os.path.getsize(self.path)
+        with open(self.path, 'r+b') as f:
+            f.truncate(size - 10)
+
+        recovered = self._test_drive()
+        self.assertIn(first, recovered._dataset['bookings'])
+        self.assertNotIn(second, recovered._dataset['bookings'])
+
+        # the torn record is gone, so new records are readable
+        third = self._book(recovered, PICKUP_DATES[2])
+        recovered.close()
+        bookings = self._test_drive()._dataset['bookings']
+        self.assertIn(first, bookings)
+        self.assertIn(third, bookings)
+
+    def test_corrupted_record_dropped(self):
+        td = self._test_drive()
+        first = self._book(td, PICKUP_DATES[0])
+        second = self._book(td, PICKUP_DATES[1])
+        td.close()
+        with open(self.path, 'r+b') as f:
+            f.seek(-2, os.SEEK_END)
+            f.write(b'!!')
+
+        bookings = self._test_drive()._dataset['bookings']
+        self.assertIn(first, bookings)
+        self.assertNotIn(second, bookings)
+
+    def test_compaction(self):
+        td = self._test_drive(compact_every=3)
+        bookings = [self._book(td, pickup_date) for pickup_date in PICKUP_DATES[:3]]
+        # the compaction runs in the background
+        td._compaction.join()
+        bookings.append(self._book(td, PICKUP_DATES[3]))
+        all_bookings = td._dataset['bookings']
+        td.close()
+
+        self.assertTrue(os.path.exists(self.path + BookingJournal.SNAPSHOT_SUFFIX))
+        # only the record after the snapshot is left in the journal
+        journal = BookingJournal(self.path)
+        snapshot_bookings, records = journal.recover()
+        journal.close()
+        self.assertEqual(1, len(records))
+        self.assertEqual(bookings[3], records[0]['booking'])
+        self.assertIn(bookings[2], snapshot_bookings)
+
+        recovered = self._test_drive()
+        self.assertEqual(all_bookings, recovered._dataset['bookings'])
+
+    def test_compaction_replaces_dataset_bookings(self):
+        td = self._test_drive()
+        td.cancel_booking('184b5438-35dc-49c4-aab0-e6cf62285aa6', reason='Busy')
+        self.assertTrue(td.compact())
+        self._book(td, PICKUP_DATES[0])
+        bookings = td._dataset['bookings']
+        td.close()
+
+        recovered = self._test_drive()
+        self.assertEqual(bookings, recovered._dataset['bookings'])
+
+    def test_compaction_does_not_decode_bookings(self):
+        td = self._test_drive(storage=SQLiteStorage(':memory:'))
+        td.cancel_booking('184b5438-35dc-49c4-aab0-e6cf62285aa6', reason='Busy')
+        booking = self._book(td, PICKUP_DATES[0])
+        bookings = td._dataset['bookings']
+        # the stored JSON is written to the snapshot as it is
+        with patch('mbio.storage.sqlitestorage.json.loads', side_effect=AssertionError):
+            self.assertTrue(td.compact())
+        td.close()
+
+        recovered = self._test_drive()
+        self.assertEqual(bookings, recovered._dataset['bookings'])
+        self.assertIn(booking, recovered._dataset['bookings'])
+
+    def test_failed_compaction_does_not_fail_bookings(self):
+        td = self._test_drive(compact_every=1)
+        with patch.object(BookingJournal, 'compact', side_effect=OSError(errno.ENOSPC, 'No space')):
+            booking = self._book(td, PICKUP_DATES[0])
+            td._compaction.join()
+        bookings = td._dataset['bookings']
+        td.close()
+
+        self.assertFalse(os.path.exists(self.path + BookingJournal.SNAPSHOT_SUFFIX))
+        recovered = self._test_drive()
+        self.assertIn(booking, recovered._dataset['bookings'])
+        self.assertEqual(bookings, recovered._dataset['bookings'])
+
+    def test_failed_fsync_disables_bookings(self):
+        td = self._test_drive()
+        booking = self._book(td, PICKUP_DATES[0])
+        with patch('os.fsync', side_effect=OSError(errno.EIO, 'I/O error')):
+            with self.assertRaises(JournalError):
+                self._book(td, PICKUP_DATES[1])
+
+        # the failed booking was made in memory, but it isn't durable
+        with self.assertRaises(JournalError):
+            self._book(td, PICKUP_DATES[1])
+        with self.assertRaises(JournalError):
+            td.cancel_booking(booking['id'], reason='Busy')
+        td.close()
+
+        bookings = self._test_drive()._dataset['bookings']
+        self.assertIn(booking, bookings)
+        self.assertNotIn(PICKUP_DATES[1].isoformat(),
+                         [b['pickupDate'] for b in bookings if b['vehicleId'] == VEHICLE_ID])
+
+    def test_rejected_booking_not_journaled(self):
+        td = self._test_drive(storage=SQLiteStorage(':memory:'))
+        first = self._book(td, PICKUP_DATES[0])
+        with patch.object(SQLiteStorage, 'add_booking',
+                          side_effect=VehicleAlreadyBookedError('Booking already exists')):
+            with self.assertRaises(VehicleAlreadyBookedError):
+                self._book(td, PICKUP_DATES[1])
+        td.close()
+
+        recovered = self._test_drive()
+        pickup_dates = [booking['pickupDate'] for booking in recovered._dataset['bookings']
+                        if booking['vehicleId'] == VEHICLE_ID]
+        self.assertIn(first['pickupDate'], pickup_dates)
+        self.assertNotIn(PICKUP_DATES[1].isoformat(), pickup_dates)
+        self._book(recovered, PICKUP_DATES[1])
+
+    def test_concurrent_bookings_durable(self):
+        td = self._test_drive()
+        results = []
+
+        def book(pickup_date):
+            results.append(self._book(td, pickup_date))
+
+        threads = [threading.Thread(target=book, args=(pickup_date,))
+                   for pickup_date in PICKUP_DATES]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        td.close()
+
+        bookings = self._test_drive()._dataset['bookings']
+        self.assertEqual(len(PICKUP_DATES), len(results))
+        for booking in results:
+            self.assertIn(booking, bookings)
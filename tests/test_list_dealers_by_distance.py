@@ -267,3 +267,36 @@ class TestListDealersByDistance(unittest.TestCase):
         ]
         with self.assertRaises(TestDriveError):
             obtained = td.get_dealers_in_polygon_with_vehicle(portugal, model='a', fuel='gasoline', transmission='manual')
+
+    def test_get_closest_dealers_limit(self):
+        EXPECTED_JSON_FILE_PATH  = './tests/resources/dataset_full_modified_porto_albufeira.json'
+        td = TestDrive(dataset='./tests/resources/dataset_full_modified_porto_albufeira.json')
+        with open(EXPECTED_JSON_FILE_PATH, 'r') as f:
+            dealers_list = json.load(f)
+        expected = [dealers_list['dealers'][2], dealers_list['dealers'][1]]
+        obtained = td.get_closest_dealers_with_vehicle(self.LOC_2[0],
+            self.LOC_2[1], limit=2)
+        self.assertEqual(expected, obtained, 'Wrong closest dealers '
+                                             'returned.')
+
+        obtained = td.get_closest_dealers_with_vehicle(self.LOC_2[0],
+            self.LOC_2[1], limit=10)
+        self.assertEqual(td.get_closest_dealers_with_vehicle(self.LOC_2[0],
+            self.LOC_2[1]), obtained, 'Wrong closest dealers returned.')
+
+    def test_get_closest_dealers_max_distance(self):
+        td = TestDrive(dataset='./tests/resources/dataset_full.json')
+        all_dealers = td.get_closest_dealers_with_vehicle(self.LOC_1[0], self.LOC_1[1])
+
+        obtained = td.get_closest_dealers_with_vehicle(self.LOC_1[0],
+            self.LOC_1[1], max_distance=120)
+        # MB Lisboa is about 116km away, the other dealers are farther away
+        self.assertEqual(all_dealers[:1], obtained)
+
+        obtained = td.get_closest_dealers_with_vehicle(self.LOC_1[0],
+            self.LOC_1[1], max_distance=1)
+        self.assertEqual([], obtained)
+
+        obtained = td.get_closest_dealers_with_vehicle(self.LOC_1[0],
+            self.LOC_1[1], limit=2, max_distance=10000)
+        self.assertEqual(all_dealers[:2], obtained)
@@ -2,6 +2,7 @@
 import unittest
 import json
 from mbio.testdrive import TestDrive
+from mbio.exceptions import VehicleNotFoundError
 
 
 class TestListVehiles(unittest.TestCase):
@@ -246,3 +247,50 @@ class TestListVehiles(unittest.TestCase):
         expected = [vehicle_list['vehicles'][0], vehicle_list['vehicles'][1]]
         obtained = td.get_vehicles_by_attributes(dealer='846679bd-5831-4286-969b-056e9c89d74c',
         fuel='EleCtRIc')
+
+    def test_attr_list_vehicles_matches_linear_scan(self):
+        td = TestDrive(dataset='./tests/resources/dataset_full.json')
+        all_vehicles = list(td._all_vehicles)
+        for model in ('E', 'amg', 'A', None):
+            for fuel in ('electric', 'GASOLINE', None):
+                for transmission in ('auto', 'MANUAL', None):
+                    expected = [vehicle for vehicle in all_vehicles
+                        if (model is None or vehicle['model'].lower() == model.lower())
+                        and (fuel is None or vehicle['fuel'].lower() == fuel.lower())
+                        and (transmission is None or
+                             vehicle['transmission'].lower() == transmission.lower())]
+                    obtained = td.get_vehicles_by_attributes(model=model, fuel=fuel,
+                                                        transmission=transmission)
+                    self.assertEqual(expected, obtained)
+
+    def test_attr_list_vehicles_after_dataset_change(self):
+        td = TestDrive(dataset='./tests/resources/dataset_full.json')
+        self.assertEqual(0, len(td.get_vehicles_by_attributes(model='Z')))
+
+        dataset = td._load_dataset('./tests/resources/dataset_full.json')
+        dataset['dealers'][0]['vehicles'][0]['model'] = 'Z'
+        td._dataset = dataset
+
+        obtained = td.get_vehicles_by_attributes(model='z')
+        self.assertEqual([dataset['dealers'][0]['vehicles'][0]], obtained)
+
+    def test_attr_list_vehicles_pages(self):
+        td = TestDrive(dataset='./tests/resources/dataset_full.json')
+        for filters in ({}, {'fuel': 'gasoline'}, {'model': 'AMG', 'transmission': 'manual'},
+                        {'dealer': '846679bd-5831-4286-969b-056e9c89d74c', 'fuel': 'electric'}):
+            expected = td.get_vehicles_by_attributes(**filters)
+            for limit in (1, 2, 3, 100):
+                obtained = []
+                after = None
+                while True:
+                    page, after = td.get_vehicles_page(limit, after, **filters)
+                    self.assertLessEqual(len(page), limit)
+                    obtained += page
+                    if after is None:
+                        break
+                self.assertEqual(expected, obtained)
+
+    def test_attr_list_vehicles_page_unknown_cursor(self):
+        td = TestDrive(dataset='./tests/resources/dataset_full.json')
+        with self.assertRaises(VehicleNotFoundError):
+            td.get_vehicles_page(2, 'Deep Cover')
@@ -0,0 +1,65 @@
+"""Streaming dataset loader tests."""
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from mbio.loader import DatasetLoader
+from mbio.exceptions import InvalidDataSetError, DatasetNotFoundError
+
+DATASET_PATH = './tests/resources/dataset_full.json'
+
+
+class DatasetLoaderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def _write(self, content):
+        path = os.path.join(self.directory, 'dataset.json')
+        with open(path, 'wb') as f:
+            f.write(content.encode())
+        return path
+
+    def test_same_as_json_load(self):
+        with open(DATASET_PATH, 'r') as f:
+            expected = json.load(f)
+        for chunk_size in (1, 7, 4096, DatasetLoader.CHUNK_SIZE):
+            self.assertEqual(expected, DatasetLoader(DATASET_PATH, chunk_size=chunk_size).load())
+
+    def test_values_across_chunks(self):
+        content = ('{"dealers": [{"name": "Luís"}, 12345, [], {}],\n "count": 12345,'
+                   ' "empty": [], "bookings": [1.5e3, -0.25, 2E+10, "a", null, true]}')
+        path = self._write(content)
+        for chunk_size in range(1, 12):
+            self.assertEqual(json.loads(content), DatasetLoader(path, chunk_size=chunk_size).load())
+        self.assertEqual({}, DatasetLoader(self._write(' { } '), chunk_size=1).load())
+
+    def test_progress(self):
+        progress = []
+        DatasetLoader(DATASET_PATH, progress=lambda read, size: progress.append((read, size)),
+                      chunk_size=4096).load()
+
+        size = os.path.getsize(DATASET_PATH)
+        self.assertEqual((size, size), progress[-1])
+        self.assertEqual(sorted(progress), progress)
+
+    def test_invalid_dataset(self):
+        for content in ('', '[]', '{"dealers": [{"id": 1}', '{"dealers": [{"id": 1}]',
+                        '{"dealers": [1 2]}', '{"dealers": [1,]}', '{1: 2}', '{"a": 1} {}',
+                        '{"a" 1}', '{"a": tru}', '﻿{}'):
+            path = self._write(content)
+            with self.assertRaises(InvalidDataSetError, msg=content):
+                DatasetLoader(path, chunk_size=3).load()
+
+    def test_invalid_utf8(self):
+        path = os.path.join(self.directory, 'dataset.json')
+        with open(path, 'wb') as f:
+            f.write(b'{"dealers": ["\xff"]}')
+        with self.assertRaises(InvalidDataSetError):
+            DatasetLoader(path).load()
+
+    def test_dataset_not_found(self):
+        with self.assertRaises(DatasetNotFoundError):
+            DatasetLoader(os.path.join(self.directory, 'missing.json')).load()
@@ -0,0 +1,41 @@
+"""Readers-writer lock tests."""
+import unittest
+import threading
+from mbio.lock import ReadWriteLock
+
+
+class ReadWriteLockTestCase(unittest.TestCase):
+
+    def test_readers_share_the_lock(self):
+        lock = ReadWriteLock()
+        both_reading = threading.Barrier(2, timeout=5)
+
+        def read():
+            with lock.read_locked():
+                # would time out if the readers excluded each other
+                both_reading.wait()
+
+        threads = [threading.Thread(target=read) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertFalse(both_reading.broken)
+
+    def test_writer_excludes_readers(self):
+        lock = ReadWriteLock()
+        events = []
+        lock.acquire_write()
+
+        def read():
+            with lock.read_locked():
+                events.append('read')
+
+        reader = threading.Thread(target=read)
+        reader.start()
+        reader.join(0.1)
+        events.append('write')
+        lock.release_write()
+        reader.join()
+
+        self.assertEqual(['write', 'read'], events)
@@ -0,0 +1,110 @@
+"""Compact dataset records tests."""
+import gc
+import copy
+import json
+import random
+import unittest
+import tracemalloc
+from unittest.mock import patch
+from mbio.models import (Availability, Vehicle, Dealer, Booking, to_json, dealer_from_json,
+                         weekly_availability)
+
+DATASET_PATH = './tests/resources/dataset_full.json'
+
+
+class ModelsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        with open(DATASET_PATH, 'r') as f:
+            self.dataset = json.load(f)
+
+    def test_same_json(self):
+        for dealer in self.dataset['dealers']:
+            record = dealer_from_json(copy.deepcopy(dealer))
+            self.assertIsInstance(record, Dealer)
+            self.assertIsInstance(record['vehicles'][0], Vehicle)
+            self.assertEqual(dealer, record)
+            self.assertEqual(list(dealer), list(record))
+            self.assertEqual(json.dumps(dealer), json.dumps(record, default=to_json))
+        for booking in self.dataset['bookings']:
+            self.assertEqual(json.dumps(booking), json.dumps(Booking(booking), default=to_json))
+
+    def test_shared_values(self):
+        vehicles = [Vehicle(vehicle) for dealer in copy.deepcopy(self.dataset['dealers'])
+                    for vehicle in dealer['vehicles']]
+        availability = vehicles[0]['availability']
+        same = [v for v in vehicles[1:] if v['availability'] == availability]
+        self.assertTrue(same)
+        for vehicle in same:
+            self.assertIs(availability, vehicle['availability'])
+        for vehicle in vehicles:
+            fuel = vehicle['fuel']
+            self.assertIs(fuel, next(v['fuel'] for v in vehicles if v['fuel'] == fuel))
+        self.assertIs(availability.weekly, weekly_availability(availability))
+
+    def test_shared_availability_released(self):
+        availability = {'monday': ['1000', '1030'], 'sunday': ['0930']}
+        vehicle = Vehicle({'id': 'v1', 'availability': availability})
+        self.assertIs(vehicle['availability'], Availability.of(copy.deepcopy(availability)))
+        vehicle['availability'].weekly
+
+        del vehicle
+        gc.collect()
+        self.assertFalse(any(a == availability for a in Availability._shared.values()))
+
+    def test_shared_keys_bounded(self):
+        with patch.dict(Booking._shared_keys, clear=True), \
+                patch.object(Booking, 'MAX_SHARED_KEYS', 2):
+            bookings = [Booking({'id': 'b1', 'note{}'.format(i): 'extra'}) for i in range(3)]
+            self.assertEqual(2, len(Booking._shared_keys))
+            self.assertEqual(['id', 'note2'], list(bookings[2]))
+            self.assertIs(bookings[0]._keys, Booking({'id': 'b2', 'note0': 'extra'})._keys)
+
+    def test_modified(self):
+        booking = Booking({'id': 'b1', 'vehicleId': 'v1'})
+        booking['cancelledAt'] = '2018-10-03T19:22:19'
+        booking['note'] = 'extra'
+        self.assertEqual(['id', 'vehicleId', 'cancelledAt', 'note'], list(booking))
+        self.assertEqual('extra', booking['note'])
+
+        del booking['vehicleId']
+        del booking['note']
+        self.assertNotIn('vehicleId', booking)
+        self.assertEqual({'id': 'b1', 'cancelledAt': '2018-10-03T19:22:19'}, booking)
+        with self.assertRaises(KeyError):
+            booking['vehicleId']
+        with self.assertRaises(KeyError):
+            del booking['note']
+
+    def test_invalid_values_kept(self):
+        vehicle = Vehicle({'id': 1, 'model': None, 'availability': {'monday': 1000}})
+        self.assertEqual({'id': 1, 'model': None, 'availability': {'monday': 1000}}, vehicle)
+        self.assertNotIsInstance(vehicle['availability'], Availability)
+        with self.assertRaises(TypeError):
+            to_json(object())
+
+    def test_memory_per_vehicle(self):
+        rnd = random.Random(2)
+        days = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+        times = ['1000', '1030', '1100', '1130', '1200', '1230', '1300', '1330', '1400']
+        availabilities = [{day: sorted(rnd.sample(times, 3)) for day in rnd.sample(days, 3)}
+                          for _ in range(20)]
+        text = json.dumps([{
+            'id': '{:032x}'.format(rnd.getrandbits(128)),
+            'model': rnd.choice(['E', 'A', 'B', 'S', 'AMG']),
+            'fuel': rnd.choice(['ELECTRIC', 'GASOLINE', 'DIESEL']),
+            'transmission': rnd.choice(['AUTO', 'MANUAL']),
+            'availability': rnd.choice(availabilities),
+        } for _ in range(5000)])
+
+        tracemalloc.start()
+        try:
+            vehicles = json.loads(text)
+            dicts_size = tracemalloc.get_traced_memory()[0]
+            del vehicles
+            tracemalloc.clear_traces()
+            vehicles = [Vehicle(vehicle) for vehicle in json.loads(text)]
+            records_size = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        self.assertGreaterEqual(dicts_size / records_size, 3)
@@ -1,7 +1,13 @@
 """Tests for the HTTP server."""
 
+import os
+import sys
+import time
+import socket
 import unittest
 import threading
+import subprocess
+import http.client
 import json
 import urllib.request
 import urllib.parse
@@ -14,6 +20,11 @@ from unittest.mock import patch
 
 from mbio.server.endpoint import Endpoint
 from mbio.server.server import Server
+from mbio.server.httpserver import ThreadPoolHTTPServer
+from mbio.server.aioserver import AsyncHTTPServer, _ResponseWriter
+from mbio.server.fragments import JSONFragments
+from mbio.server.prefork import PreforkServer
+from mbio.storage.sqlitestorage import SQLiteStorage
 
 MOCKED_UUIDS = ['136fbb51-8a06-42fd-b839-d01ab87e2c6c', '136fbb51-8a06-42fd-b839-c01ab87e2c6b',
 '132fbb51-8a06-42fd-b839-c01ab87e2c6c']
@@ -55,6 +66,13 @@ class RESTServerTestCase(unittest.TestCase):
             Server.DATASET_PATH = 'Still Dre Day'
             Server()
 
+    def test_load_dataset_progress(self):
+        progress = []
+        with patch.object(Server, 'PROGRESS', lambda read, size: progress.append((read, size))):
+            Server.load_dataset()
+        size = os.path.getsize(Server.DATASET_PATH)
+        self.assertEqual((size, size), progress[-1])
+
     def test_server_error_get_on_post(self):
         expected = {
                     "error": "This endpoint only supports the POST method."
@@ -231,6 +249,244 @@ class RESTServerTestCase(unittest.TestCase):
 
         self.assertEqual(expected, obtained)
 
+    def test_get_closest_dealer_list_limit(self):
+        url = '{}?latitude=38.187787&longitude=-8.104157&model=amg&fuel=gasoline&limit=1'.format(Endpoint.DEALERS_CLOSEST_LIST)
+
+        EXPECTED_JSON_FILE_PATH = './tests/resources/closest_dealer_list.json'
+        with open(EXPECTED_JSON_FILE_PATH, 'r') as f:
+            expected = json.load(f)
+        expected['dealers'] = expected['dealers'][:1]
+
+        res = self._get_request(url)
+        obtained = json.loads(res)
+
+        self.assertEqual(expected, obtained)
+
+    def test_get_vehicles_pages(self):
+        EXPECTED_JSON_FILE_PATH = './tests/resources/expected_all_vehicles.json'
+        with open(EXPECTED_JSON_FILE_PATH, 'r') as f:
+            expected = json.load(f)
+
+        obtained = []
+        url = '{}?limit=4'.format(Endpoint.VEHICLES)
+        while True:
+            page = json.loads(self._get_request(url))
+            self.assertLessEqual(len(page['vehicles']), 4)
+            obtained += page['vehicles']
+            if page['next_cursor'] is None:
+                break
+            url = '{}?limit=4&cursor={}'.format(Endpoint.VEHICLES, page['next_cursor'])
+        self.assertEqual(expected['vehicles'], obtained)
+
+    def test_get_vehicles_invalid_page(self):
+        for query in ('limit=0', 'limit=two', 'limit=2&cursor=Still%20Dre', 'cursor=U25vb3A'):
+            res = self._get_request('{}?{}'.format(Endpoint.VEHICLES, query))
+            obtained = json.loads(res)
+            self.assertIn('error', obtained)
+
+    def test_get_closest_dealer_list_invalid_limit(self):
+        url = '{}?latitude=38.187787&longitude=-8.104157&limit=zero'.format(Endpoint.DEALERS_CLOSEST_LIST)
+        res = self._get_request(url)
+        obtained = json.loads(res)
+        self.assertIn('error', obtained)
+
+        url = '{}?latitude=38.187787&longitude=-8.104157&max_distance_km=-1'.format(Endpoint.DEALERS_CLOSEST_LIST)
+        res = self._get_request(url)
+        obtained = json.loads(res)
+        self.assertIn('error', obtained)
+
+    def test_connection_closed_by_single_threaded_server(self):
+        connection = http.client.HTTPConnection('localhost', RESTServerTestCase.SERVER_PORT)
+        try:
+            connection.request('GET', Endpoint.VEHICLES)
+            response = connection.getresponse()
+            response.read()
+            self.assertEqual(11, response.version)
+            self.assertEqual('close', response.getheader('Connection'))
+        finally:
+            connection.close()
+
+    def test_idle_connection_does_not_block_other_clients(self):
+        idle = http.client.HTTPConnection('localhost', RESTServerTestCase.SERVER_PORT)
+        try:
+            idle.request('GET', Endpoint.VEHICLES)
+            idle.getresponse().read()
+
+            start = time.monotonic()
+            self._get_request(Endpoint.VEHICLES)
+            self.assertLess(time.monotonic() - start, 1)
+        finally:
+            idle.close()
+
+    @patch.object(uuid, 'uuid4', side_effect=MOCKED_UUIDS)
+    def test_conditional_get(self, uuid):
+        url = '{}?model=E&fuel=electric'.format(Endpoint.VEHICLES)
+        connection = http.client.HTTPConnection('localhost', RESTServerTestCase.SERVER_PORT)
+        try:
+            connection.request('GET', url)
+            response = connection.getresponse()
+            expected = response.read()
+            etag = response.getheader('ETag')
+            self.assertIsNotNone(etag)
+
+            connection.request('GET', url, headers={'If-None-Match': etag})
+            response = connection.getresponse()
+            self.assertEqual(304, response.status)
+            self.assertEqual(b'', response.read())
+            self.assertEqual(etag, response.getheader('ETag'))
+
+            # a different query has a different ETag
+            connection.request('GET', '{}?model=A'.format(Endpoint.VEHICLES),
+                               headers={'If-None-Match': etag})
+            response = connection.getresponse()
+            self.assertEqual(200, response.status)
+            self.assertNotEqual(etag, response.getheader('ETag'))
+            response.read()
+
+            data = json.dumps({
+                "first_name": "Jayceon",
+                "last_name": "Taylor",
+                "vehicle_id": "136fbb51-8a06-42fd-b839-c01ab87e2c6c",
+                "pickup_date": "2019-04-09T10:00:00"
+            })
+            connection.request('POST', Endpoint.BOOKINGS_CREATE, data)
+            response = connection.getresponse()
+            self.assertIsNone(response.getheader('ETag'))
+            response.read()
+
+            # the booking changed the data version
+            connection.request('GET', url, headers={'If-None-Match': etag})
+            response = connection.getresponse()
+            self.assertEqual(200, response.status)
+            self.assertNotEqual(etag, response.getheader('ETag'))
+            self.assertEqual(expected, response.read())
+        finally:
+            connection.close()
+
+    def test_conditional_get_any(self):
+        connection = http.client.HTTPConnection('localhost', RESTServerTestCase.SERVER_PORT)
+        try:
+            connection.request('GET', Endpoint.VEHICLES, headers={'If-None-Match': '*'})
+            response = connection.getresponse()
+            self.assertEqual(304, response.status)
+            self.assertEqual(b'', response.read())
+            self.assertIsNotNone(response.getheader('ETag'))
+
+            # errors have no representation to match
+            url = '{}?latitude=38.187787&longitude=-8.104157&max_distance_km=-1'.format(
+                Endpoint.DEALERS_CLOSEST_LIST)
+            for path in (url, '/api/nothing/'):
+                connection.request('GET', path, headers={'If-None-Match': '*'})
+                response = connection.getresponse()
+                self.assertEqual(400, response.status)
+                self.assertIn('error', json.loads(response.read().decode()))
+        finally:
+            connection.close()
+
+    def test_geo_queries_cached(self):
+        url = '{}?latitude=38.187787&longitude=-8.104157&model=amg&fuel=gasoline&transmission=manual'.format(Endpoint.DEALER_CLOSEST)
+        expected = json.loads(self._get_request(url))
+        hits = Server.cache.hits
+
+        url = '{}?latitude=38.187787&longitude=-8.104157&model=AMG&fuel=Gasoline&transmission=manual'.format(Endpoint.DEALER_CLOSEST)
+        self.assertEqual(expected, json.loads(self._get_request(url)))
+        self.assertEqual(hits + 1, Server.cache.hits)
+
+    @patch.object(Server, 'CACHE_PRECISION', 2)
+    def test_geo_queries_quantized(self):
+        Server.td = None
+        url = '{}?latitude=38.187787&longitude=-8.104157&model=amg&fuel=gasoline&transmission=manual'.format(Endpoint.DEALER_CLOSEST)
+        expected = json.loads(self._get_request(url))
+        self.assertEqual(0, Server.cache.hits)
+
+        url = '{}?latitude=38.1851&longitude=-8.1012&model=amg&fuel=gasoline&transmission=manual'.format(Endpoint.DEALER_CLOSEST)
+        self.assertEqual(expected, json.loads(self._get_request(url)))
+        self.assertEqual(1, Server.cache.hits)
+        Server.td = None
+
+    @patch.object(Server, 'CACHE_PRECISION', 2)
+    def test_polygon_queries_quantized(self):
+        Server.td = None
+        lisboa = json.loads(self._post_request(Endpoint.DEALERS_IN_POLYGON, {'coordinates': [
+            [38.7455, -9.2449], [38.7455, -9.2151], [38.7649, -9.2151], [38.7649, -9.2449]]}))
+        # MB Lisboa is only inside of the exact polygon, not of the rounded one
+        self.assertEqual(['MB Lisboa'], [dealer['name'] for dealer in lisboa['dealers']])
+
+        res = json.loads(self._post_request(Endpoint.DEALERS_IN_POLYGON, {'coordinates': [
+            [38.7548, -9.2449], [38.7455, -9.2151], [38.7649, -9.2151], [38.7649, -9.2449]]}))
+        self.assertEqual(lisboa, res)
+        self.assertEqual(1, Server.cache.hits)
+
+        # vertices which are only distinct before rounding
+        coordinates = [[38.7455, -9.2449], [38.7455, -9.2151], [38.7649, -9.2151],
+                       [38.7651, -9.2151], [38.7649, -9.2449]]
+        res = json.loads(self._post_request(Endpoint.DEALERS_IN_POLYGON,
+                                            {'coordinates': coordinates}))
+        self.assertEqual(lisboa, res)
+        coordinates[3] = coordinates[2]
+        res = json.loads(self._post_request(Endpoint.DEALERS_IN_POLYGON,
+                                            {'coordinates': coordinates}))
+        self.assertIn('error', res)
+        Server.td = None
+
+    def test_response_encoding(self):
+        url = 'http://localhost:{}{}?latitude=38.187787&longitude=-8.104157'.format(
+            RESTServerTestCase.SERVER_PORT, Endpoint.DEALERS_CLOSEST_LIST)
+        with urllib.request.urlopen(url) as response:
+            body = response.read()
+        # the pre-encoded dealers are formatted the same as by json.dumps()
+        self.assertEqual(json.dumps(json.loads(body.decode())).encode(), body)
+
+    @patch.object(Server, 'STREAM_MIN_ITEMS', 0)
+    @patch.object(Server, 'STREAM_CHUNK_SIZE', 100)
+    def test_streamed_response(self):
+        EXPECTED_JSON_FILE_PATH = './tests/resources/expected_all_vehicles.json'
+        with open(EXPECTED_JSON_FILE_PATH, 'r') as f:
+            expected = json.load(f)
+
+        connection = http.client.HTTPConnection('localhost', RESTServerTestCase.SERVER_PORT)
+        try:
+            for _ in range(2):
+                connection.request('GET', Endpoint.VEHICLES)
+                response = connection.getresponse()
+                self.assertEqual('chunked', response.getheader('Transfer-Encoding'))
+                self.assertIsNone(response.getheader('Content-Length'))
+                self.assertEqual(expected, json.loads(response.read().decode()))
+        finally:
+            connection.close()
+
+    @patch.object(Server, 'STREAM_MIN_ITEMS', 0)
+    def test_streamed_response_http_1_0(self):
+        url = '{}?latitude=38.187787&longitude=-8.104157'.format(Endpoint.DEALERS_CLOSEST_LIST)
+        expected = json.loads(self._get_request(url))
+
+        request = 'GET {} HTTP/1.0\r\n\r\n'.format(url).encode()
+        with socket.create_connection(('localhost', RESTServerTestCase.SERVER_PORT)) as sock:
+            sock.sendall(request)
+            response = sock.makefile('rb').read()
+
+        head, _, body = response.partition(b'\r\n\r\n')
+        # the body ends with the connection
+        self.assertNotIn(b'Transfer-Encoding', head)
+        self.assertNotIn(b'Content-Length', head)
+        self.assertEqual(expected, json.loads(body.decode()))
+
+    def test_internal_error_closes_connection(self):
+        # make sure that the dataset is loaded
+        self._get_request(Endpoint.VEHICLES)
+        connection = http.client.HTTPConnection('localhost', RESTServerTestCase.SERVER_PORT)
+        try:
+            with patch.object(Server.td, 'get_vehicles_by_attributes', side_effect=RuntimeError('boom')):
+                connection.request('GET', Endpoint.VEHICLES)
+                response = connection.getresponse()
+                obtained = json.loads(response.read().decode())
+
+            self.assertEqual(500, response.status)
+            self.assertEqual('close', response.getheader('Connection'))
+            self.assertEqual({'error': 'An internal application error has occured.'}, obtained)
+        finally:
+            connection.close()
+
     def _get_request(self, endpoint):
         url = 'http://localhost:{}{}'.format(RESTServerTestCase.SERVER_PORT, endpoint)
         req = urllib.request.Request(url)
@@ -266,3 +522,322 @@ class RESTServerTestCase(unittest.TestCase):
             json_res = e.read().decode()
 
         return json_res
+
+
+class ThreadPoolServerTestCase(unittest.TestCase):
+    SERVER_PORT = 1235
+
+    def setUp(self):
+        Server.DATASET_PATH = './tests/resources/dataset_full.json'
+
+        server_address = ('', ThreadPoolServerTestCase.SERVER_PORT)
+        self.httpd = ThreadPoolHTTPServer(server_address, Server, threads=4)
+        self.thr = threading.Thread(target=self.httpd.serve_forever)
+        self.thr.start()
+
+    def tearDown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.thr.join()
+
+    def test_concurrent_requests(self):
+        EXPECTED_JSON_FILE_PATH = './tests/resources/expected_all_vehicles.json'
+        with open(EXPECTED_JSON_FILE_PATH, 'r') as f:
+            expected = json.load(f)
+
+        url = 'http://localhost:{}{}'.format(ThreadPoolServerTestCase.SERVER_PORT,
+                                             Endpoint.VEHICLES)
+        results = []
+
+        def get():
+            with urllib.request.urlopen(url) as response:
+                results.append(json.loads(response.read().decode()))
+
+        threads = [threading.Thread(target=get) for _ in range(12)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([expected] * 12, results)
+
+    def test_persistent_connection(self):
+        EXPECTED_JSON_FILE_PATH = './tests/resources/expected_all_vehicles.json'
+        with open(EXPECTED_JSON_FILE_PATH, 'r') as f:
+            expected = json.load(f)
+
+        connection = http.client.HTTPConnection('localhost', ThreadPoolServerTestCase.SERVER_PORT)
+        try:
+            for _ in range(3):
+                connection.request('GET', Endpoint.VEHICLES)
+                sock = connection.sock
+                response = connection.getresponse()
+                self.assertEqual(11, response.version)
+                self.assertIsNotNone(response.getheader('Content-Length'))
+                self.assertEqual(expected, json.loads(response.read().decode()))
+                self.assertIs(sock, connection.sock)
+        finally:
+            connection.close()
+
+    @patch.object(Server, 'MAX_KEEP_ALIVE_REQUESTS', 2)
+    def test_max_requests_per_connection(self):
+        connection = http.client.HTTPConnection('localhost', ThreadPoolServerTestCase.SERVER_PORT)
+        try:
+            connection.request('GET', Endpoint.VEHICLES)
+            response = connection.getresponse()
+            response.read()
+            self.assertIsNone(response.getheader('Connection'))
+
+            connection.request('GET', Endpoint.VEHICLES)
+            response = connection.getresponse()
+            response.read()
+            self.assertEqual('close', response.getheader('Connection'))
+        finally:
+            connection.close()
+
+    def test_idle_connections_do_not_block_other_clients(self):
+        # every thread is held by an idle persistent connection
+        idle = [http.client.HTTPConnection('localhost', ThreadPoolServerTestCase.SERVER_PORT)
+                for _ in range(4)]
+        try:
+            for connection in idle:
+                connection.request('GET', Endpoint.VEHICLES)
+                connection.getresponse().read()
+
+            start = time.monotonic()
+            url = 'http://localhost:{}{}'.format(ThreadPoolServerTestCase.SERVER_PORT,
+                                                 Endpoint.VEHICLES)
+            with urllib.request.urlopen(url) as response:
+                response.read()
+            self.assertLess(time.monotonic() - start,
+                            ThreadPoolHTTPServer.KEEP_ALIVE_TIMEOUT + 1)
+        finally:
+            for connection in idle:
+                connection.close()
+
+
+@unittest.skipUnless(hasattr(os, 'fork'), 'the prefork mode needs os.fork()')
+class PreforkServerTestCase(unittest.TestCase):
+    SERVER_PORT = 1236
+
+    def setUp(self):
+        self.process = subprocess.Popen([sys.executable, 'run.py', '-f', './tests/resources/dataset_full.json',
+                                         '-p', str(PreforkServerTestCase.SERVER_PORT),
+                                         '-m', 'prefork', '-w', '3'],
+                                        stdout=subprocess.DEVNULL)
+        # wait until the workers accept connections
+        for _ in range(100):
+            try:
+                socket.create_connection(('localhost', PreforkServerTestCase.SERVER_PORT)).close()
+                break
+            except OSError:
+                time.sleep(0.1)
+
+    def tearDown(self):
+        self.process.terminate()
+        self.process.wait()
+
+    def test_get_vehicles(self):
+        EXPECTED_JSON_FILE_PATH = './tests/resources/expected_all_vehicles.json'
+        with open(EXPECTED_JSON_FILE_PATH, 'r') as f:
+            expected = json.load(f)
+
+        for _ in range(6):
+            obtained = json.loads(self._request(Endpoint.VEHICLES))
+            self.assertEqual(expected, obtained)
+
+    def test_bookings_are_shared_by_the_workers(self):
+        data = {
+                "first_name": "Jayceon",
+                "last_name": "Taylor",
+                "vehicle_id": "136fbb51-8a06-42fd-b839-c01ab87e2c6c",
+                "pickup_date": "2019-04-08T10:30:00"
+               }
+
+        booking = json.loads(self._request(Endpoint.BOOKINGS_CREATE, data))
+        self.assertEqual(data['vehicle_id'], booking['vehicleId'])
+
+        # whichever worker handles them, the vehicle is already booked
+        for _ in range(6):
+            obtained = json.loads(self._request(Endpoint.BOOKINGS_CREATE, data))
+            self.assertEqual({'error': 'Booking for 2019-04-08T10:30:00 already exists'}, obtained)
+
+        cancel_data = {'booking_id': booking['id'], 'reason': 'Changed my mind'}
+        cancelled = json.loads(self._request(Endpoint.BOOKINGS_CANCEL, cancel_data, method='PUT'))
+        self.assertEqual('Changed my mind', cancelled['cancelledReason'])
+
+        obtained = json.loads(self._request(Endpoint.BOOKINGS_CREATE, data))
+        self.assertNotEqual(booking['id'], obtained['id'])
+
+    def test_memory_database_rejected(self):
+        httpd = PreforkServer(('', 0), Server, 1)
+        self.addCleanup(httpd.server_close)
+        # rejected before the dataset is loaded and the workers are forked
+        with patch.object(Server, 'DATABASE_PATH', SQLiteStorage.MEMORY), \
+                patch.object(Server, 'load_dataset', side_effect=AssertionError('dataset loaded')):
+            with self.assertRaises(ValueError):
+                httpd.serve_forever()
+
+        process = subprocess.run([sys.executable, 'run.py', '-f', './tests/resources/dataset_full.json',
+                                  '-m', 'prefork', '-d', SQLiteStorage.MEMORY],
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.assertEqual(2, process.returncode)
+
+    def _request(self, endpoint, data=None, method=None):
+        url = 'http://localhost:{}{}'.format(PreforkServerTestCase.SERVER_PORT, endpoint)
+        if data is not None:
+            data = json.dumps(data).encode()
+
+        try:
+            with urlopen(Request(url, data, method=method)) as response:
+                json_res = response.read().decode()
+        except HTTPError as e:
+            json_res = e.read().decode()
+
+        return json_res
+
+
+class AsyncServerTestCase(unittest.TestCase):
+    SERVER_PORT = 1237
+
+    def setUp(self):
+        Server.DATASET_PATH = './tests/resources/dataset_full.json'
+
+        server_address = ('', AsyncServerTestCase.SERVER_PORT)
+        self.httpd = AsyncHTTPServer(server_address, Server, threads=4)
+        self.thr = threading.Thread(target=self.httpd.serve_forever)
+        self.thr.start()
+
+    def tearDown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.thr.join()
+
+    def test_persistent_connection(self):
+        EXPECTED_JSON_FILE_PATH = './tests/resources/expected_all_vehicles.json'
+        with open(EXPECTED_JSON_FILE_PATH, 'r') as f:
+            expected = json.load(f)
+
+        connection = http.client.HTTPConnection('localhost', AsyncServerTestCase.SERVER_PORT)
+        try:
+            for _ in range(3):
+                connection.request('GET', Endpoint.VEHICLES)
+                sock = connection.sock
+                response = connection.getresponse()
+                self.assertEqual(200, response.status)
+                self.assertEqual(expected, json.loads(response.read().decode()))
+                # the same connection is used for the next request
+                self.assertIs(sock, connection.sock)
+
+            data = json.dumps({'booking_id': 'b00d3e76-9605-49c7-910b-03b51679f6d6'})
+            connection.request('PUT', Endpoint.BOOKINGS_CANCEL, data)
+            response = connection.getresponse()
+            self.assertEqual(400, response.status)
+            self.assertIn('error', json.loads(response.read().decode()))
+        finally:
+            connection.close()
+
+    @patch.object(Server, 'STREAM_MIN_ITEMS', 0)
+    def test_streamed_response(self):
+        EXPECTED_JSON_FILE_PATH = './tests/resources/expected_all_vehicles.json'
+        with open(EXPECTED_JSON_FILE_PATH, 'r') as f:
+            expected = json.load(f)
+
+        connection = http.client.HTTPConnection('localhost', AsyncServerTestCase.SERVER_PORT)
+        try:
+            for _ in range(2):
+                connection.request('GET', Endpoint.VEHICLES)
+                response = connection.getresponse()
+                self.assertIsNone(response.getheader('Connection'))
+                self.assertEqual('chunked', response.getheader('Transfer-Encoding'))
+                self.assertEqual(expected, json.loads(response.read().decode()))
+        finally:
+            connection.close()
+
+    @patch.object(Server, 'STREAM_MIN_ITEMS', 0)
+    @patch.object(Server, 'STREAM_CHUNK_SIZE', 100)
+    @patch.object(_ResponseWriter, 'BUFFER_SIZE', 100)
+    def test_failed_streamed_response_closes_connection(self):
+        iterdumps = JSONFragments.iterdumps
+
+        def failing_iterdumps(fragments, obj):
+            for i, piece in enumerate(iterdumps(fragments, obj)):
+                if i == 20:
+                    raise RuntimeError('boom')
+                yield piece
+
+        request = 'GET {} HTTP/1.1\r\nHost: localhost\r\n\r\n'.format(Endpoint.VEHICLES).encode()
+        with patch.object(JSONFragments, 'iterdumps', failing_iterdumps), \
+                socket.create_connection(('localhost', AsyncServerTestCase.SERVER_PORT)) as sock:
+            sock.settimeout(5)
+            # the second request is never answered
+            sock.sendall(request * 2)
+            response = sock.makefile('rb').read()
+
+        head, _, body = response.partition(b'\r\n\r\n')
+        self.assertTrue(head.startswith(b'HTTP/1.1 200'))
+        self.assertIn(b'Transfer-Encoding: chunked', head)
+        self.assertGreater(len(body), 100)
+        # the body is cut short, without its last chunk
+        self.assertFalse(body.endswith(b'0\r\n\r\n'))
+        self.assertEqual(1, response.count(b'HTTP/1.1 '))
+
+    def test_http_1_0_keep_alive(self):
+        request = 'GET {} HTTP/1.0\r\nConnection: keep-alive\r\n\r\n'.format(
+            Endpoint.VEHICLES).encode()
+        with socket.create_connection(('localhost', AsyncServerTestCase.SERVER_PORT)) as sock:
+            rfile = sock.makefile('rb')
+            for _ in range(2):
+                sock.sendall(request)
+                status, headers, body = self._read_response(rfile)
+                self.assertEqual(200, status)
+                self.assertEqual('keep-alive', headers['connection'])
+                self.assertEqual(json.loads(self._get_request(Endpoint.VEHICLES)),
+                                 json.loads(body.decode()))
+
+    def test_pipelined_requests(self):
+        paths = ['{}?model=E&fuel=electric'.format(Endpoint.VEHICLES),
+                 '{}?latitude=38.187787&longitude=-8.104157&model=amg'.format(Endpoint.DEALER_CLOSEST),
+                 '{}?model=A'.format(Endpoint.VEHICLES)]
+        requests = b''.join('GET {} HTTP/1.1\r\nHost: localhost\r\n\r\n'.format(path).encode()
+                            for path in paths)
+
+        with socket.create_connection(('localhost', AsyncServerTestCase.SERVER_PORT)) as sock:
+            sock.sendall(requests)
+            rfile = sock.makefile('rb')
+            responses = [self._read_response(rfile) for _ in paths]
+
+        for path, (status, headers, body) in zip(paths, responses):
+            self.assertEqual(200, status)
+            self.assertEqual(json.loads(self._get_request(path)), json.loads(body.decode()))
+
+    def test_connection_close(self):
+        request = 'GET {} HTTP/1.1\r\nConnection: close\r\n\r\n'.format(Endpoint.VEHICLES).encode()
+        with socket.create_connection(('localhost', AsyncServerTestCase.SERVER_PORT)) as sock:
+            sock.sendall(request)
+            rfile = sock.makefile('rb')
+            status, headers, _ = self._read_response(rfile)
+            self.assertEqual(200, status)
+            self.assertEqual('close', headers['connection'])
+            self.assertEqual(b'', rfile.read())
+
+    def test_bad_request(self):
+        with socket.create_connection(('localhost', AsyncServerTestCase.SERVER_PORT)) as sock:
+            sock.sendall(b'GET\r\n\r\n')
+            rfile = sock.makefile('rb')
+            status, _, _ = self._read_response(rfile)
+            self.assertEqual(400, status)
+
+    def _read_response(self, rfile):
+        status = int(rfile.readline().split()[1])
+        headers = {}
+        for line in iter(rfile.readline, b'\r\n'):
+            name, _, value = line.decode().partition(':')
+            headers[name.strip().lower()] = value.strip()
+        body = rfile.read(int(headers['content-length']))
+        return status, headers, body
+
+    def _get_request(self, endpoint):
+        url = 'http://localhost:{}{}'.format(AsyncServerTestCase.SERVER_PORT, endpoint)
+        with urllib.request.urlopen(url) as response:
+            return response.read().decode()
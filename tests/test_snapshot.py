@@ -0,0 +1,131 @@
+"""Binary dataset snapshot tests."""
+import os
+import errno
+import json
+import shutil
+import datetime
+import tempfile
+import unittest
+from unittest.mock import patch
+from mbio.testdrive import TestDrive
+from mbio.loader import DatasetLoader
+from mbio.snapshot import DatasetSnapshot
+from mbio.models import Dealer, to_json
+
+DATASET_PATH = './tests/resources/dataset_full.json'
+VEHICLE_ID = '136fbb51-8a06-42fd-b839-c01ab87e2c6c'
+
+
+class DatasetSnapshotTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.dataset_path = os.path.join(self.directory, 'dataset.json')
+        shutil.copy(DATASET_PATH, self.dataset_path)
+        self.path = os.path.join(self.directory, 'dataset.snapshot')
+        with open(DATASET_PATH, 'r') as f:
+            self.dataset = json.load(f)
+
+    def _test_drive(self, **kwargs):
+        td = TestDrive(self.dataset_path, snapshot=self.path, **kwargs)
+        self.addCleanup(td.close)
+        return td
+
+    def _loaded_from_snapshot(self):
+        with patch.object(DatasetLoader, 'load', side_effect=AssertionError('JSON parsed')):
+            return self._test_drive()
+
+    def _write_dataset(self, dataset):
+        with open(self.dataset_path, 'w') as f:
+            json.dump(dataset, f)
+
+    def test_same_dataset(self):
+        self._test_drive()
+        self.assertTrue(os.path.exists(self.path))
+
+        td = self._loaded_from_snapshot()
+        self.assertIsInstance(td.dealers[0], Dealer)
+        self.assertEqual(json.dumps(self.dataset), json.dumps(td._dataset, default=to_json))
+        self.assertEqual(self.dataset['dealers'][0]['vehicles'],
+                         td.get_vehicles_by_dealer(self.dataset['dealers'][0]['id']))
+
+    def test_rebuilt_when_dataset_changes(self):
+        self._test_drive()
+        self.dataset['dealers'][0]['name'] = 'MB Lisboa Norte'
+        self._write_dataset(self.dataset)
+
+        self.assertEqual('MB Lisboa Norte', self._test_drive().dealers[0]['name'])
+        self.assertEqual('MB Lisboa Norte', self._loaded_from_snapshot().dealers[0]['name'])
+
+    def test_checksum_same_after_touch(self):
+        self._test_drive()
+        stat = os.stat(self.dataset_path)
+        os.utime(self.dataset_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self._loaded_from_snapshot()
+
+    def test_damaged_snapshot_rebuilt(self):
+        self._test_drive()
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        header = DatasetSnapshot.HEADER.size
+        other_version = data[:8] + (DatasetSnapshot.VERSION + 1).to_bytes(4, 'little') + data[12:]
+        for damaged in (b'', data[:header - 1], data[:-1], other_version,
+                        data[:header] + b'\xff' * (len(data) - header)):
+            with open(self.path, 'wb') as f:
+                f.write(damaged)
+            self.assertIsNone(DatasetSnapshot(self.path, self.dataset_path).load())
+            self.assertEqual(json.dumps(self.dataset),
+                             json.dumps(self._test_drive()._dataset, default=to_json))
+            self._loaded_from_snapshot()
+
+    def test_unsupported_dataset_not_written(self):
+        self.dataset['dealers'][0]['latitude'] = 38
+        self.dataset['bookings'][0]['notes'] = 'Window seat'
+        self._write_dataset(self.dataset)
+
+        td = self._test_drive()
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(json.dumps(self.dataset), json.dumps(td._dataset, default=to_json))
+
+    def test_unwritable_snapshot_loaded_from_json(self):
+        self.path = os.path.join(self.directory, 'missing', 'dataset.snapshot')
+        with patch('builtins.print') as print_:
+            td = self._test_drive()
+        self.assertIn('Could not write the dataset snapshot', print_.call_args[0][0])
+        self.assertEqual(json.dumps(self.dataset), json.dumps(td._dataset, default=to_json))
+
+    def test_failed_fsync_keeps_old_snapshot(self):
+        self._test_drive()
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        self.dataset['dealers'][0]['name'] = 'MB Lisboa Norte'
+        self._write_dataset(self.dataset)
+
+        with patch('os.fsync', side_effect=OSError(errno.EIO, 'I/O error')), \
+                patch('builtins.print'):
+            self.assertEqual('MB Lisboa Norte', self._test_drive().dealers[0]['name'])
+        with open(self.path, 'rb') as f:
+            self.assertEqual(data, f.read())
+        self.assertEqual(['dataset.json', 'dataset.snapshot'], sorted(os.listdir(self.directory)))
+
+    def test_cancelled_bookings(self):
+        self.dataset['bookings'][0]['cancelledAt'] = '2018-03-01T10:00:00'
+        self.dataset['bookings'][0]['cancelledReason'] = 'Busy'
+        self._write_dataset(self.dataset)
+        self._test_drive()
+
+        td = self._loaded_from_snapshot()
+        self.assertEqual(self.dataset['bookings'], td._dataset['bookings'])
+
+    def test_journal_replayed_on_snapshot(self):
+        journal = os.path.join(self.directory, 'bookings.journal')
+        td = self._test_drive(journal=journal)
+        booking = td.create_booking('Jayceon', 'Taylor', VEHICLE_ID,
+                                    datetime.datetime(2019, 4, 30, 10, 0))
+        td.close()
+
+        with patch.object(DatasetLoader, 'load', side_effect=AssertionError('JSON parsed')):
+            td = self._test_drive(journal=journal)
+        self.assertEqual(booking, td._get_booking(booking['id']))
+        self.assertEqual(len(self.dataset['bookings']) + 1, len(td._dataset['bookings']))
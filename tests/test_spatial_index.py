@@ -0,0 +1,44 @@
+"""Spatial index tests."""
+import unittest
+import random
+from mbio.geo.coordinate import Coordinate
+from mbio.geo.spatialindex import SpatialIndex
+
+
+class SpatialIndexTestCase(unittest.TestCase):
+    """Nearest neighbour search tests."""
+
+    def _sorted_by_distance(self, coordinates, latitude, longitude):
+        my_coord = Coordinate(latitude, longitude)
+        distances = [(my_coord.distance_to(Coordinate(*coordinate)), pos)
+                     for pos, coordinate in enumerate(coordinates)]
+        return sorted(distances)
+
+    def test_nearest_same_order_as_sorting(self):
+        rnd = random.Random(2018)
+        coordinates = [(rnd.uniform(-90, 90), rnd.uniform(-180, 180)) for _ in range(500)]
+        # repeated points, which are at the same distance from every query
+        coordinates += coordinates[:50]
+        # points clustered around Lisbon, which are at similar distances
+        coordinates += [(38.7 + rnd.uniform(0, 0.001), -9.1 + rnd.uniform(0, 0.001))
+                        for _ in range(200)]
+        rnd.shuffle(coordinates)
+
+        index = SpatialIndex(coordinates)
+        queries = [(38.7, -9.1), (-38.7, 170.9), (90, 0), (0, 180), (37.104404, -8.236308)]
+        queries += [(rnd.uniform(-90, 90), rnd.uniform(-180, 180)) for _ in range(20)]
+        for latitude, longitude in queries:
+            expected = self._sorted_by_distance(coordinates, latitude, longitude)
+            obtained = list(index.nearest(latitude, longitude))
+            self.assertEqual(expected, obtained)
+
+    def test_nearest_first_point(self):
+        coordinates = [(lat / 10, lon / 10) for lat in range(100) for lon in range(100)]
+        index = SpatialIndex(coordinates)
+        distance, pos = next(index.nearest(5.01, 5.01))
+        self.assertEqual((5.0, 5.0), coordinates[pos])
+        self.assertEqual(Coordinate(5.01, 5.01).distance_to(Coordinate(5.0, 5.0)), distance)
+
+    def test_nearest_no_points(self):
+        index = SpatialIndex([])
+        self.assertEqual([], list(index.nearest(38.7, -9.1)))
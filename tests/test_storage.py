@@ -0,0 +1,161 @@
+"""Storage backend tests, and the TestDrive tests run against the SQLite storage."""
+import os
+import uuid
+import shutil
+import sqlite3
+import datetime
+import tempfile
+import unittest
+from unittest.mock import patch
+from mbio.testdrive import TestDrive
+from mbio.storage.memorystorage import MemoryStorage
+from mbio.storage.sqlitestorage import SQLiteStorage
+from mbio.exceptions import VehicleAlreadyBookedError, InvalidDataSetError
+from tests import (test_bookings, test_listing, test_list_dealers_by_distance, test_test_drive,
+                   test_journal)
+
+DATASET_PATH = './tests/resources/dataset_full.json'
+VEHICLE_ID = '136fbb51-8a06-42fd-b839-c01ab87e2c6c'
+
+
+class SQLiteStorageMixin(object):
+    """Makes the TestDrives of a test case use a SQLiteStorage."""
+
+    def setUp(self):
+        patcher = patch.object(TestDrive, 'DEFAULT_STORAGE', SQLiteStorage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        super(SQLiteStorageMixin, self).setUp()
+
+
+class SQLiteBookingsTestCase(SQLiteStorageMixin, test_bookings.BookingsTestCase):
+
+    @patch.object(uuid, 'uuid4', side_effect=test_bookings.MOCKED_UUIDS)
+    def test_cancel_new_booking_success(self, uuid):
+        td = TestDrive(dataset='./tests/resources/dataset_full.json')
+        pickup_date = datetime.datetime(2019, 4, 9, 10, 0)
+        booking = td.create_booking(first_name='Jayceon', last_name='Taylor',
+                                    vehicle_id=VEHICLE_ID, pickup_date=pickup_date)
+
+        reason = 'Westside Story'
+        obtained = td.cancel_booking(booking['id'].upper(), reason=reason)
+        # the bookings are copies of the ones in the database
+        self.assertEqual(booking['id'], obtained['id'])
+        self.assertEqual(reason, obtained['cancelledReason'])
+        self.assertIn(obtained, td._dataset['bookings'])
+
+
+class SQLiteListVehiclesTestCase(SQLiteStorageMixin, test_listing.TestListVehiles):
+    pass
+
+
+class SQLiteListDealersByDistanceTestCase(SQLiteStorageMixin,
+                                          test_list_dealers_by_distance.TestListDealersByDistance):
+    pass
+
+
+class SQLiteTestDriveTestCase(SQLiteStorageMixin, test_test_drive.TestDriveTestCase):
+    pass
+
+
+class SQLiteBookingJournalTestCase(SQLiteStorageMixin, test_journal.BookingJournalTestCase):
+    pass
+
+
+class SQLiteStorageTestCase(unittest.TestCase):
+
+    def _booking(self, booking_id, pickup_date, **kwargs):
+        booking = {'id': booking_id, 'firstName': 'Jayceon', 'lastName': 'Taylor',
+                   'vehicleId': VEHICLE_ID, 'pickupDate': pickup_date.isoformat(),
+                   'createdAt': '2019-03-01T10:00:00'}
+        booking.update(kwargs)
+        return booking
+
+    def test_same_lookups_as_memory(self):
+        td = TestDrive(DATASET_PATH)
+        sqlite_td = TestDrive(DATASET_PATH, storage=SQLiteStorage())
+        filters = [{}, {'model': 'E'}, {'fuel': 'ELECTRIC'}, {'transmission': 'manual'},
+                   {'dealer': '846679bd-5831-4286-969b-056e9c89d74c', 'fuel': 'gasoline'},
+                   {'dealer': 'unknown'}, {'model': 'unknown'}]
+        for kwargs in filters:
+            self.assertEqual(td.get_vehicles_by_attributes(**kwargs),
+                             sqlite_td.get_vehicles_by_attributes(**kwargs))
+            self.assertEqual(td.get_vehicles_page(2, **kwargs),
+                             sqlite_td.get_vehicles_page(2, **kwargs))
+
+    def test_geo_queries_without_sql(self):
+        td = TestDrive(DATASET_PATH)
+        storage = SQLiteStorage()
+        sqlite_td = TestDrive(DATASET_PATH, storage=storage)
+        vehicle = sqlite_td.dealers[0]['vehicles'][0]
+        self.assertIs(storage.keys_of(vehicle), storage.keys_of(vehicle))
+        self.assertIs(storage.availability_of(vehicle), storage.availability_of(vehicle))
+
+        with patch.object(storage, '_query', side_effect=AssertionError('SQL query')):
+            for kwargs in [{}, {'model': 'E'}, {'fuel': 'gasoline', 'transmission': 'manual'}]:
+                self.assertEqual(td.get_closest_dealer_with_vehicle(38.7, -9.2, **kwargs),
+                                 sqlite_td.get_closest_dealer_with_vehicle(38.7, -9.2, **kwargs))
+                self.assertEqual(td.get_closest_dealers_with_vehicle(41.1, -8.6, **kwargs),
+                                 sqlite_td.get_closest_dealers_with_vehicle(41.1, -8.6, **kwargs))
+
+    def test_double_booking_rejected_by_database(self):
+        pickup_date = datetime.datetime(2019, 4, 9, 10, 0)
+        storage = SQLiteStorage()
+        storage.load([], [])
+        storage.add_booking(self._booking('a', pickup_date), pickup_date)
+        with self.assertRaises(VehicleAlreadyBookedError):
+            storage.add_booking(self._booking('b', pickup_date), pickup_date)
+
+        cancelled = self._booking('a', pickup_date, cancelledAt='2019-03-02T10:00:00')
+        storage.cancel_booking(cancelled)
+        storage.add_booking(self._booking('c', pickup_date), pickup_date)
+        self.assertEqual(cancelled, storage.get_booking('A'))
+        self.assertEqual(['a', 'c'], [booking['id'] for booking in storage.bookings])
+
+    def test_double_bookings_in_dataset_loaded(self):
+        pickup_date = datetime.datetime(2019, 4, 9, 10, 0)
+        bookings = [self._booking('a', pickup_date), self._booking('b', pickup_date)]
+        storage = SQLiteStorage()
+        storage.load([], bookings)
+
+        self.assertEqual(bookings, storage.bookings)
+        storage.cancel_booking(self._booking('a', pickup_date, cancelledAt='2019-03-02T10:00:00'))
+        self.assertTrue(storage.is_booked(VEHICLE_ID.upper(), pickup_date))
+
+    def test_invalid_pickup_date(self):
+        bookings = [{'id': 'a', 'vehicleId': VEHICLE_ID, 'pickupDate': 'tomorrow'}]
+        with self.assertRaises(InvalidDataSetError):
+            SQLiteStorage().load([], bookings)
+
+    def test_database_file(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'testdrive.db')
+
+        td = TestDrive(DATASET_PATH, storage=SQLiteStorage(path))
+        booking = td.create_booking(first_name='Jayceon', last_name='Taylor', vehicle_id=VEHICLE_ID,
+                                    pickup_date=datetime.datetime(2019, 4, 9, 10, 0))
+        self.assertIn(booking, td._dataset['bookings'])
+        td.close()
+        self.assertTrue(os.path.exists(path))
+
+    def test_forked_process(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        storage = SQLiteStorage(os.path.join(directory, 'testdrive.db'))
+        memory_storage = SQLiteStorage()
+        for s in (storage, memory_storage):
+            s.load([], [])
+            self.addCleanup(s.close)
+
+        with patch('mbio.storage.sqlitestorage.os.getpid', return_value=-1):
+            # the database file is opened again
+            self.assertEqual([], storage.bookings)
+            with self.assertRaises(sqlite3.ProgrammingError):
+                memory_storage.bookings
+
+    def test_memory_storage_is_default(self):
+        td = TestDrive(DATASET_PATH)
+        self.assertIsInstance(td._storage, MemoryStorage)
+        # the bookings of the dataset are modified in place
+        self.assertIs(td._storage.bookings, td._dataset['bookings'])
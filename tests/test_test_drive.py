@@ -15,3 +15,8 @@ class TestDriveTestCase(unittest.TestCase):
         """TestDrive initialized with an valid data set."""
         with self.assertRaises(InvalidDataSetError):
             td = TestDrive(self.FAULTY_DATASET_PATH)
+
+    def test_testdrive_init_duplicate_vehicle_id_FAIL(self):
+        """TestDrive initialized with a data set where vehicle ids are repeated."""
+        with self.assertRaises(InvalidDataSetError):
+            td = TestDrive('./tests/resources/dataset_duplicate_vehicle_id.json')
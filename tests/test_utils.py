@@ -1,6 +1,8 @@
 """Utility function tests."""
 import unittest
-from mbio.utils import nfdk_normalize_ignore_case, is_str_equal_ignore_case
+from mbio.utils import (nfdk_normalize_ignore_case, is_str_equal_ignore_case, normalize_key,
+                        are_list_items_unique, is_ascii)
+from mbio.geo.coordinate import Coordinate
 
 class StringComparisonTestCase(unittest.TestCase):
     """Tests for string comparison utilities"""
@@ -22,3 +24,37 @@ class StringComparisonTestCase(unittest.TestCase):
         self.assertFalse(str1.lower() == str2.lower())
 
         self.assertTrue(is_str_equal_ignore_case(str1, str2))
+
+    def test_normalize_key_matches_is_equal_ignore_case(self):
+        strings = ['å', 'å', 'Å', 'ELECTRIC', 'electric', 'EleCtRIc', 'Straße',
+                   'STRASSE', 'ﬁ', 'fi', '846679BD-5831-4286-969B-056E9C89D74C',
+                   '846679bd-5831-4286-969b-056e9c89d74c']
+        for str1 in strings:
+            for str2 in strings:
+                self.assertEqual(is_str_equal_ignore_case(str1, str2),
+                                 normalize_key(str1) == normalize_key(str2))
+
+    def test_is_ascii(self):
+        for string in ['', 'electric', '846679BD-5831', '2019-04-16T10:00:00', '\x7f']:
+            self.assertTrue(is_ascii(string))
+        for string in ['å', 'Straße', '\x80', '2019-04-16T10:00:0\u0663', '\ud800']:
+            self.assertFalse(is_ascii(string))
+
+    def test_normalize_key_reuses_normalized_strings(self):
+        string = 'electric'
+        self.assertIs(string, normalize_key(string))
+
+
+class ListUniquenessTestCase(unittest.TestCase):
+    """Tests for the list items uniqueness check"""
+
+    def test_unique_coordinates(self):
+        coords = [Coordinate(lat / 10, lat / 20) for lat in range(2000)]
+        self.assertTrue(are_list_items_unique(coords))
+
+        coords.append(Coordinate(199.9, 99.95))
+        self.assertFalse(are_list_items_unique(coords))
+
+    def test_unhashable_items(self):
+        self.assertTrue(are_list_items_unique([[1, 2], [2, 1], {'a': 1}]))
+        self.assertFalse(are_list_items_unique([[1, 2], {'a': 1}, [1, 2]]))